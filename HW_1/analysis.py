@@ -0,0 +1,134 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+def calculate_rolling_stats(df, window=30):
+    """Вычисляет скользящее среднее и std."""
+    df = df.sort_values('timestamp').copy()
+    df['temp_rolling_mean'] = df['temperature'].rolling(window=window, center=True).mean()
+    df['temp_rolling_std'] = df['temperature'].rolling(window=window, center=True).std()
+    return df
+
+def identify_anomalies(df, threshold=2):
+    """Определяет аномалии как значения за пределами mean ± threshold * std."""
+    lower_bound = df['temp_rolling_mean'] - threshold * df['temp_rolling_std']
+    upper_bound = df['temp_rolling_mean'] + threshold * df['temp_rolling_std']
+    df['anomaly'] = (df['temperature'] < lower_bound) | (df['temperature'] > upper_bound)
+    return df
+
+def analyze_city_data(city_df):
+    """Проводит полный анализ для одного города."""
+    city_df = calculate_rolling_stats(city_df)
+    city_df = identify_anomalies(city_df)
+    seasonal_stats = city_df.groupby('season')['temperature'].agg(['mean', 'std']).reset_index()
+    seasonal_stats.columns = ['season', 'mean_temp', 'std_temp']
+    return city_df, seasonal_stats
+
+
+# Массивы в разделяемой памяти, к которым подключается каждый рабочий процесс
+_shared = {}
+
+
+def _attach(name, dtype, length):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(specs, length, window, threshold):
+    for key, (name, dtype) in specs.items():
+        _shared[key] = _attach(name, dtype, length)
+    _shared['params'] = (window, threshold)
+
+
+def _analyze_partition(partition):
+    """Анализирует группу городов, записывая результаты прямо в разделяемую память."""
+    window, threshold = _shared['params']
+    temps = _shared['temperature'][1]
+    seasons = _shared['season'][1]
+    out_mean = _shared['rolling_mean'][1]
+    out_std = _shared['rolling_std'][1]
+    out_anomaly = _shared['anomaly'][1]
+
+    seasonal = []
+    for city_code, start, end in partition:
+        temperature = pd.Series(temps[start:end], copy=False)
+        rolling = temperature.rolling(window=window, center=True)
+        mean = rolling.mean().to_numpy()
+        std = rolling.std().to_numpy()
+        out_mean[start:end] = mean
+        out_std[start:end] = std
+        out_anomaly[start:end] = (temps[start:end] < mean - threshold * std) | (temps[start:end] > mean + threshold * std)
+
+        stats = temperature.groupby(seasons[start:end]).agg(['mean', 'std'])
+        seasonal.extend(
+            (city_code, season_code, row_mean, row_std)
+            for season_code, row_mean, row_std in stats.itertuples()
+        )
+    return seasonal
+
+
+def _make_partitions(offsets, cities_per_task):
+    bounds = [(code, offsets[code], offsets[code + 1]) for code in range(len(offsets) - 1)]
+    return [bounds[i:i + cities_per_task] for i in range(0, len(bounds), cities_per_task)]
+
+
+def analyze_all_cities_parallel(df, workers=None, cities_per_task=None, window=30, threshold=2):
+    """
+    Параллельный анализ всех городов на пуле процессов.
+
+    Данные делятся по городам; температура и сезоны передаются рабочим через
+    разделяемую память, а скользящие статистики и флаги аномалий записываются
+    обратно в неё же — DataFrame между процессами не сериализуются.
+    Возвращает (DataFrame с колонками как у analyze_city_data, сезонная статистика по городам).
+    """
+    workers = workers or os.cpu_count()
+    df = df.sort_values(['city', 'timestamp'], kind='stable').reset_index(drop=True)
+    city_codes, cities = pd.factorize(df['city'], sort=True)
+    season_codes, seasons = pd.factorize(df['season'], sort=True)
+    offsets = np.searchsorted(city_codes, np.arange(len(cities) + 1))
+    cities_per_task = cities_per_task or max(1, math.ceil(len(cities) / (workers * 4)))
+    partitions = _make_partitions(offsets, cities_per_task)
+
+    length = len(df)
+    arrays = {
+        'temperature': df['temperature'].to_numpy(dtype=np.float64),
+        'season': season_codes.astype(np.int8),
+        'rolling_mean': np.empty(length, dtype=np.float64),
+        'rolling_std': np.empty(length, dtype=np.float64),
+        'anomaly': np.empty(length, dtype=np.bool_),
+    }
+    blocks = {}
+    views = {}
+    try:
+        for key, array in arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks[key] = shm
+            views[key] = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+            views[key][:] = array
+        specs = {key: (shm.name, arrays[key].dtype) for key, shm in blocks.items()}
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(specs, length, window, threshold)) as pool:
+            seasonal_parts = list(pool.map(_analyze_partition, partitions))
+
+        df['temp_rolling_mean'] = views['rolling_mean'].copy()
+        df['temp_rolling_std'] = views['rolling_std'].copy()
+        df['anomaly'] = views['anomaly'].copy()
+    finally:
+        views.clear()
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
+
+    seasonal_stats = pd.DataFrame(
+        [row for part in seasonal_parts for row in part],
+        columns=['city', 'season', 'mean_temp', 'std_temp']
+    )
+    seasonal_stats['city'] = cities[seasonal_stats['city'].to_numpy()]
+    seasonal_stats['season'] = seasons[seasonal_stats['season'].to_numpy()]
+    return df, seasonal_stats
@@ -1,40 +1,24 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
 import requests
+import os
 import time
 import asyncio
 import aiohttp
 
+from analysis import analyze_city_data, analyze_all_cities_parallel
+from charts import build_time_series_figure, build_seasonal_box_figure
+from weather_monitor import fetch_all_cities, build_norm_table, get_current_season
+from weather_cache import weather_cache
 
-def calculate_rolling_stats(df, window=30):
-    """Вычисляет скользящее среднее и std."""
-    df = df.sort_values('timestamp').copy()
-    df['temp_rolling_mean'] = df['temperature'].rolling(window=window, center=True).mean()
-    df['temp_rolling_std'] = df['temperature'].rolling(window=window, center=True).std()
-    return df
 
-def identify_anomalies(df, threshold=2):
-    """Определяет аномалии как значения за пределами mean ± threshold * std."""
-    lower_bound = df['temp_rolling_mean'] - threshold * df['temp_rolling_std']
-    upper_bound = df['temp_rolling_mean'] + threshold * df['temp_rolling_std']
-    df['anomaly'] = (df['temperature'] < lower_bound) | (df['temperature'] > upper_bound)
-    return df
-
-def analyze_city_data(city_df):
-    """Проводит полный анализ для одного города."""
-    city_df = calculate_rolling_stats(city_df)
-    city_df = identify_anomalies(city_df)
-    seasonal_stats = city_df.groupby('season')['temperature'].agg(['mean', 'std']).reset_index()
-    seasonal_stats.columns = ['season', 'mean_temp', 'std_temp']
-    return city_df, seasonal_stats
-
-
-def get_current_weather_sync(api_key, city_name):
-    """Синхронный запрос к API OpenWeatherMap."""
+def get_current_weather_sync(api_key, city_name, use_cache=True):
+    """Синхронный запрос к API OpenWeatherMap (через общий кэш)."""
+    if use_cache:
+        return weather_cache.get_or_fetch(
+            city_name, lambda: get_current_weather_sync(api_key, city_name, use_cache=False)
+        )
     url = f"http://api.openweathermap.org/data/2.5/weather"
     params = {
         'q': city_name,
@@ -42,7 +26,7 @@ def get_current_weather_sync(api_key, city_name):
         'units': 'metric'
     }
     try:
-        response = requests.get(url, params=params)
+        response = requests.get(url, params=params, timeout=10)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.HTTPError as e:
@@ -54,8 +38,12 @@ def get_current_weather_sync(api_key, city_name):
         st.error(f"Ошибка запроса: {e}")
     return None
 
-async def get_current_weather_async(session, api_key, city_name):
-    """Асинхронный запрос к API OpenWeatherMap."""
+async def get_current_weather_async(session, api_key, city_name, use_cache=True):
+    """Асинхронный запрос к API OpenWeatherMap (через общий кэш)."""
+    if use_cache:
+        return await weather_cache.get_or_fetch_async(
+            city_name, lambda: get_current_weather_async(session, api_key, city_name, use_cache=False)
+        )
     url = f"http://api.openweathermap.org/data/2.5/weather"
     params = {
         'q': city_name,
@@ -95,30 +83,27 @@ if uploaded_file is not None:
     st.dataframe(seasonal_stats)
 
     st.subheader(f"Временной ряд температур для {selected_city} с аномалиями")
-    fig_time_series = go.Figure()
-
-    fig_time_series.add_trace(go.Scatter(x=analyzed_city_data['timestamp'], y=analyzed_city_data['temperature'],
-                                         mode='lines', name='Температура', line=dict(width=1, color='lightblue')))
-
-    fig_time_series.add_trace(go.Scatter(x=analyzed_city_data['timestamp'], y=analyzed_city_data['temp_rolling_mean'],
-                                         mode='lines', name='Скользящее среднее (30 дней)', line=dict(color='orange')))
-
-    anomalies = analyzed_city_data[analyzed_city_data['anomaly']]
-
-    if not anomalies.empty:
-        fig_time_series.add_trace(go.Scatter(x=anomalies['timestamp'], y=anomalies['temperature'],
-                                             mode='markers', name='Аномалия', marker=dict(color='red', size=8)))
-    else:
+    fig_time_series = build_time_series_figure(analyzed_city_data)
+    if not analyzed_city_data['anomaly'].any():
         st.caption("Аномалий не обнаружено для выбранного города в рамках заданного порога.")
-    fig_time_series.update_layout(xaxis_title='Дата', yaxis_title='Температура (°C)')
     st.plotly_chart(fig_time_series)
 
     st.subheader(f"Сезонные профили для {selected_city}")
-    fig_seasonal = px.box(city_data, x='season', y='temperature',
-                          title=f'Распределение температур по сезонам в {selected_city}',
-                          labels={'temperature': 'Температура (°C)', 'season': 'Сезон'})
+    fig_seasonal = build_seasonal_box_figure(city_data, selected_city)
     st.plotly_chart(fig_seasonal)
 
+    st.header("Анализ всех городов")
+    if st.checkbox("Проанализировать все города параллельно"):
+        workers = st.slider("Число процессов", 1, os.cpu_count() or 1, os.cpu_count() or 1)
+        start_time_parallel = time.time()
+        all_cities_data, all_seasonal_stats = analyze_all_cities_parallel(df, workers=workers)
+        elapsed_parallel = time.time() - start_time_parallel
+        anomaly_counts = (all_cities_data.groupby('city')['anomaly'].sum()
+                          .rename('anomalies').reset_index())
+        st.dataframe(anomaly_counts)
+        st.dataframe(all_seasonal_stats)
+        st.write(f"*Время анализа {len(anomaly_counts)} городов на {workers} процессах: {elapsed_parallel:.2f} сек*")
+
 
     st.header("Мониторинг текущей температуры")
     api_key = st.text_input("Введите ваш API-ключ OpenWeatherMap", type="password")
@@ -135,11 +120,7 @@ if uploaded_file is not None:
             st.metric(label="Текущая температура (синхронно)", value=f"{current_temp_sync:.2f} °C", delta=None)
             st.write(f"*Время запроса (синхронно): {elapsed_sync:.2f} сек*")
 
-            current_month = datetime.now().month
-            if current_month in [12, 1, 2]: current_season = 'winter'
-            elif current_month in [3, 4, 5]: current_season = 'spring'
-            elif current_month in [6, 7, 8]: current_season = 'summer'
-            else: current_season = 'autumn'
+            current_season = get_current_season()
 
             season_row = seasonal_stats[seasonal_stats['season'] == current_season]
             if not season_row.empty:
@@ -175,6 +156,12 @@ if uploaded_file is not None:
 
         asyncio.run(fetch_async_weather())
 
+        cache_stats = weather_cache.stats()
+        st.caption(
+            f"Кэш погоды (TTL {weather_cache.ttl} сек): попаданий {cache_stats['hits']}, "
+            f"промахов {cache_stats['misses']}, объединённых запросов {cache_stats['coalesced']}"
+        )
+
         st.info(
             "**Комментарии по асинхронности:**\n\n"
             "- В этом одиночном запросе разница между синхронным и асинхронным подходом минимальна, "
@@ -185,5 +172,18 @@ if uploaded_file is not None:
             "который ждал бы каждый запрос по очереди."
         )
 
+        st.subheader("Мониторинг всех городов")
+        if st.checkbox("Получить текущую погоду для всех городов из файла"):
+            concurrency = st.slider("Параллельных запросов", 1, 50, 10)
+            rate = st.number_input("Лимит запросов в секунду (квота API)", min_value=0.1, value=1.0, step=0.1)
+            start_time_fleet = time.time()
+            fleet_results = asyncio.run(fetch_all_cities(api_key, df['city'].unique(),
+                                                         concurrency=concurrency, rate=rate))
+            elapsed_fleet = time.time() - start_time_fleet
+            norm_table = build_norm_table(fleet_results, df)
+            st.dataframe(norm_table)
+            st.write(f"*Время получения данных для {len(norm_table)} городов: {elapsed_fleet:.2f} сек, "
+                     f"аномальных: {int(norm_table['is_anomaly'].sum())}*")
+
 else:
     st.info("Пожалуйста, загрузите файл `temperature_data.csv` для начала анализа.")
\ No newline at end of file
@@ -0,0 +1,172 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from analysis import analyze_city_data, analyze_all_cities_parallel
+from charts import build_time_series_figure, build_seasonal_box_figure, figure_payload_size
+from generate import generate_realistic_temperature_data, make_synthetic_cities
+
+
+def make_dataset(num_cities, num_years, seed):
+    profiles = make_synthetic_cities(num_cities, seed)
+    df = generate_realistic_temperature_data(list(profiles), num_years, seed=seed, profiles=profiles)
+    df['city'] = df['city'].astype(str)
+    df['season'] = df['season'].astype(str)
+    return df
+
+
+def bench_parallel(args):
+    """Масштабирование параллельного анализа от 1 до N процессов."""
+    df = make_dataset(args.cities, args.years, args.seed)
+    print(f"Набор данных: {args.cities} городов, {len(df)} строк")
+
+    start = time.perf_counter()
+    serial = [analyze_city_data(city_df) for _, city_df in df.groupby('city')]
+    serial_time = time.perf_counter() - start
+    serial_anomalies = sum(int(city_df['anomaly'].sum()) for city_df, _ in serial)
+    print(f"Последовательно (analyze_city_data): {serial_time:.2f} сек, аномалий: {serial_anomalies}")
+
+    max_workers = args.max_workers or os.cpu_count()
+    base_time = None
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        result, _ = analyze_all_cities_parallel(df, workers=workers, cities_per_task=args.cities_per_task)
+        elapsed = time.perf_counter() - start
+        base_time = base_time or elapsed
+        assert int(result['anomaly'].sum()) == serial_anomalies
+        print(f"{workers:>3} процессов: {elapsed:.2f} сек, ускорение x{base_time / elapsed:.2f} "
+              f"(к последовательному x{serial_time / elapsed:.2f})")
+
+
+def build_full_figures(analyzed_city_data, city_data):
+    """Исходный вариант графиков из app.py: все точки в go.Scatter и сырые строки в px.box."""
+    fig_time_series = go.Figure()
+    fig_time_series.add_trace(go.Scatter(x=analyzed_city_data['timestamp'], y=analyzed_city_data['temperature'],
+                                         mode='lines', name='Температура', line=dict(width=1, color='lightblue')))
+    fig_time_series.add_trace(go.Scatter(x=analyzed_city_data['timestamp'], y=analyzed_city_data['temp_rolling_mean'],
+                                         mode='lines', name='Скользящее среднее (30 дней)', line=dict(color='orange')))
+    anomalies = analyzed_city_data[analyzed_city_data['anomaly']]
+    fig_time_series.add_trace(go.Scatter(x=anomalies['timestamp'], y=anomalies['temperature'],
+                                         mode='markers', name='Аномалия', marker=dict(color='red', size=8)))
+    fig_seasonal = px.box(city_data, x='season', y='temperature')
+    return fig_time_series, fig_seasonal
+
+
+def build_downsampled_figures(analyzed_city_data, city_data):
+    return build_time_series_figure(analyzed_city_data), build_seasonal_box_figure(city_data, 'City')
+
+
+def bench_render(args):
+    """Размер передаваемого в браузер JSON и время построения графиков до и после прореживания."""
+    profiles = make_synthetic_cities(1, args.seed)
+    city_data = generate_realistic_temperature_data(list(profiles), args.years, seed=args.seed,
+                                                    profiles=profiles, anomaly_rate=0.001)
+    city_data['season'] = city_data['season'].astype(str)
+    if args.hourly:
+        # Почасовой ряд: повторяем суточные значения с шумом
+        hours = np.arange(24, dtype='timedelta64[h]')
+        hourly = city_data.loc[city_data.index.repeat(24)].reset_index(drop=True)
+        hourly['timestamp'] = hourly['timestamp'] + np.tile(hours, len(city_data))
+        hourly['temperature'] += np.random.default_rng(args.seed).normal(0, 1, len(hourly))
+        city_data = hourly
+    analyzed_city_data, _ = analyze_city_data(city_data)
+    print(f"Точек в ряду: {len(city_data)}")
+
+    for label, builder in [("до (Scatter + px.box)", build_full_figures),
+                           ("после (Scattergl + LTTB + квартили)", build_downsampled_figures)]:
+        start = time.perf_counter()
+        figures = builder(analyzed_city_data, city_data)
+        payload = sum(figure_payload_size(fig) for fig in figures)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {payload / 1024 / 1024:.2f} МБ JSON, построение и сериализация {elapsed:.2f} сек")
+
+
+def bench_stub(args):
+    """
+    Проверка fetch_all_cities на локальном stub OpenWeatherMap: повторы только для 429, 5xx и сети,
+    ответ без температуры — ошибка одного города.
+    """
+    import asyncio
+
+    from aiohttp import web
+
+    from weather_monitor import fetch_all_cities
+
+    calls = {}
+
+    async def weather(request):
+        city = request.query['q']
+        calls[city] = calls.get(city, 0) + 1
+        if request.query['appid'] != 'good':
+            return web.json_response({'message': 'Invalid API key'}, status=401)
+        if city == 'Atlantis':
+            return web.json_response({'message': 'city not found'}, status=404)
+        if city == 'Broken':
+            return web.json_response({'cod': 200, 'weather': []})
+        if city == 'Limited':
+            return web.json_response({'message': 'rate limit'}, status=429)
+        # Первый запрос Flaky падает с 503, повтор проходит
+        if city == 'Flaky' and calls[city] == 1:
+            return web.json_response({'message': 'unavailable'}, status=503)
+        return web.json_response({'main': {'temp': 12.5}})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/weather', weather)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        base_url = f"http://127.0.0.1:{runner.addresses[0][1]}/weather"
+        try:
+            cities = ['Moscow', 'Atlantis', 'Broken', 'Limited', 'Flaky']
+            results = {r['city']: r for r in await fetch_all_cities(
+                'good', cities, rate=1000, burst=100, base_url=base_url)}
+            bad_key = await fetch_all_cities('bad', ['Paris'], rate=1000, burst=100, base_url=base_url)
+        finally:
+            await runner.cleanup()
+        return results, bad_key[0]
+
+    results, bad_key = asyncio.run(run())
+    for result in [*results.values(), bad_key]:
+        print(f"{result['city']}: temp={result['temp']}, попыток {result['attempts']}, ошибка {result['error']}")
+    assert results['Moscow']['temp'] == 12.5 and results['Moscow']['attempts'] == 1
+    assert results['Atlantis']['attempts'] == 1 and results['Atlantis']['error'] == 'city not found'
+    assert results['Broken']['attempts'] == 1 and results['Broken']['error'] == 'unexpected response'
+    assert bad_key['attempts'] == 1 and bad_key['error'] == 'Invalid API key'
+    assert results['Limited']['attempts'] == 3 and results['Limited']['temp'] is None
+    assert results['Flaky']['attempts'] == 2 and results['Flaky']['temp'] == 12.5
+    print("Повторы только для 429 и 5xx: OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки анализа температурных данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parallel = subparsers.add_parser("parallel", help="Масштабирование анализа по числу процессов")
+    parallel.add_argument("--cities", type=int, default=2000)
+    parallel.add_argument("--years", type=int, default=10)
+    parallel.add_argument("--seed", type=int, default=42)
+    parallel.add_argument("--max-workers", type=int, default=None)
+    parallel.add_argument("--cities-per-task", type=int, default=None)
+    parallel.set_defaults(func=bench_parallel)
+
+    render = subparsers.add_parser("render", help="Размер и время построения графиков")
+    render.add_argument("--years", type=int, default=50)
+    render.add_argument("--seed", type=int, default=42)
+    render.add_argument("--hourly", action="store_true", help="Почасовые данные вместо суточных")
+    render.set_defaults(func=bench_render)
+
+    stub = subparsers.add_parser("stub", help="Проверка загрузчика погоды на локальном stub-сервере")
+    stub.set_defaults(func=bench_stub)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Примерно по две точки на пиксель ширины графика
+MAX_POINTS = 2000
+
+SEASON_ORDER = ['winter', 'spring', 'summer', 'autumn']
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Индексы точек, выбранных алгоритмом Largest-Triangle-Three-Buckets.
+    Алгоритм сохраняет форму ряда: пики и провалы не сглаживаются, как при усреднении.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Первая и последняя точки сохраняются, остальные делятся на n_out - 2 корзины
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(df, x_col, y_col, max_points=MAX_POINTS, keep=None):
+    """Прореживает ряд через LTTB; строки из маски `keep` сохраняются всегда."""
+    valid = df[df[y_col].notna()]
+    x = valid[x_col].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    indices = lttb_indices(x, valid[y_col].to_numpy(), max_points)
+    if keep is not None:
+        indices = np.union1d(indices, np.flatnonzero(keep.loc[valid.index].to_numpy()))
+    return valid.iloc[indices]
+
+
+def build_time_series_figure(analyzed_city_data, max_points=MAX_POINTS):
+    """График температуры с аномалиями на WebGL (Scattergl) с прореживанием длинных рядов."""
+    anomaly_mask = analyzed_city_data['anomaly']
+    temperature = downsample(analyzed_city_data, 'timestamp', 'temperature', max_points, keep=anomaly_mask)
+    rolling_mean = downsample(analyzed_city_data, 'timestamp', 'temp_rolling_mean', max_points)
+    anomalies = analyzed_city_data[anomaly_mask]
+
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=temperature['timestamp'], y=temperature['temperature'],
+                               mode='lines', name='Температура', line=dict(width=1, color='lightblue')))
+    fig.add_trace(go.Scattergl(x=rolling_mean['timestamp'], y=rolling_mean['temp_rolling_mean'],
+                               mode='lines', name='Скользящее среднее (30 дней)', line=dict(color='orange')))
+    if not anomalies.empty:
+        fig.add_trace(go.Scattergl(x=anomalies['timestamp'], y=anomalies['temperature'],
+                                   mode='markers', name='Аномалия', marker=dict(color='red', size=8)))
+    fig.update_layout(xaxis_title='Дата', yaxis_title='Температура (°C)')
+    return fig
+
+
+def seasonal_box_stats(city_data):
+    """Квартили и границы «усов» (1.5 IQR) по сезонам, посчитанные на сервере."""
+    grouped = city_data.groupby('season', observed=True)['temperature']
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ['q1', 'median', 'q3']
+    stats['mean'] = grouped.mean()
+    iqr = stats['q3'] - stats['q1']
+    low = (city_data['season'].map(stats['q1'] - 1.5 * iqr)).astype(float)
+    high = (city_data['season'].map(stats['q3'] + 1.5 * iqr)).astype(float)
+    temps = city_data['temperature']
+    stats['lowerfence'] = temps[temps >= low].groupby(city_data['season'], observed=True).min()
+    stats['upperfence'] = temps[temps <= high].groupby(city_data['season'], observed=True).max()
+    order = [season for season in SEASON_ORDER if season in stats.index]
+    return stats.reindex(order + [season for season in stats.index if season not in order])
+
+
+def build_seasonal_box_figure(city_data, city_name):
+    """Box plot по готовым квартилям: в браузер уходит несколько чисел на сезон, а не все строки."""
+    stats = seasonal_box_stats(city_data)
+    fig = go.Figure(go.Box(
+        x=list(stats.index), q1=stats['q1'], median=stats['median'], q3=stats['q3'],
+        mean=stats['mean'], lowerfence=stats['lowerfence'], upperfence=stats['upperfence'],
+        name='Температура', boxpoints=False,
+    ))
+    fig.update_layout(title=f'Распределение температур по сезонам в {city_name}',
+                      xaxis_title='Сезон', yaxis_title='Температура (°C)')
+    return fig
+
+
+def figure_payload_size(fig):
+    """Размер JSON, который Streamlit отправляет в браузер для графика, в байтах."""
+    return len(fig.to_json().encode('utf-8'))
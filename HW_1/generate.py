@@ -1,3 +1,6 @@
+import argparse
+import os
+
 import pandas as pd
 import numpy as np
 
@@ -26,23 +29,138 @@ month_to_season = {12: "winter", 1: "winter", 2: "winter",
                    6: "summer", 7: "summer", 8: "summer",
                    9: "autumn", 10: "autumn", 11: "autumn"}
 
-# Генерация данных о температуре
-def generate_realistic_temperature_data(cities, num_years=10):
-    dates = pd.date_range(start="2010-01-01", periods=365 * num_years, freq="D")
-    data = []
-
-    for city in cities:
-        for date in dates:
-            season = month_to_season[date.month]
-            mean_temp = seasonal_temperatures[city][season]
-            # Добавляем случайное отклонение
-            temperature = np.random.normal(loc=mean_temp, scale=5)
-            data.append({"city": city, "timestamp": date, "temperature": temperature})
-
-    df = pd.DataFrame(data)
-    df['season'] = df['timestamp'].dt.month.map(lambda x: month_to_season[x])
+SEASONS = ["winter", "spring", "summer", "autumn"]
+# Индекс сезона для месяцев 1..12 (нулевой элемент не используется)
+MONTH_TO_SEASON_IDX = np.array([0] + [SEASONS.index(month_to_season[m]) for m in range(1, 13)])
+
+TEMPERATURE_STD = 5
+
+
+def make_synthetic_cities(num_cities, seed=None):
+    """
+    Создаёт профили для произвольного числа городов: каждый город — один из
+    реальных профилей со случайным сдвигом. Нужно для наборов данных на тысячи станций.
+    """
+    rng = np.random.default_rng(seed)
+    base = list(seasonal_temperatures.values())
+    picks = rng.integers(0, len(base), size=num_cities)
+    shifts = rng.normal(0, 3, size=num_cities)
+    return {
+        f"City_{i:05d}": {season: round(base[p][season] + s, 1) for season in SEASONS}
+        for i, (p, s) in enumerate(zip(picks, shifts))
+    }
+
+
+def _season_means(cities, profiles):
+    return np.array([[profiles[city][season] for season in SEASONS] for city in cities], dtype=np.float64)
+
+
+def generate_realistic_temperature_data(cities, num_years=10, seed=None, profiles=None,
+                                        start="2010-01-01", trend_per_year=0.0,
+                                        anomaly_rate=0.0, anomaly_magnitude=4.0,
+                                        missing_rate=0.0, rng=None):
+    """
+    Векторизованная генерация данных о температуре для сетки (город, дата).
+
+    - trend_per_year: линейный тренд в °C за год;
+    - anomaly_rate: доля точек с внесённой аномалией (сдвиг на anomaly_magnitude
+      стандартных отклонений), такие строки помечаются в колонке `is_injected_anomaly`;
+    - missing_rate: доля случайно пропущенных строк (пробелы в наблюдениях).
+    """
+    rng = rng if rng is not None else np.random.default_rng(seed)
+    profiles = profiles or seasonal_temperatures
+    cities = list(cities)
+    dates = pd.date_range(start=start, periods=365 * num_years, freq="D")
+
+    season_idx = MONTH_TO_SEASON_IDX[dates.month.to_numpy()]
+    means = _season_means(cities, profiles)[:, season_idx]
+    if trend_per_year:
+        years_elapsed = (dates - dates[0]).days.to_numpy() / 365.25
+        means += trend_per_year * years_elapsed
+
+    # Все случайные отклонения — одним вызовом
+    temperature = rng.normal(loc=means, scale=TEMPERATURE_STD)
+
+    shape = temperature.shape
+    anomalies = None
+    if anomaly_rate:
+        anomalies = rng.random(shape) < anomaly_rate
+        signs = rng.choice([-1.0, 1.0], size=shape)
+        temperature += anomalies * signs * anomaly_magnitude * TEMPERATURE_STD
+
+    df = pd.DataFrame({
+        "city": pd.Categorical.from_codes(np.repeat(np.arange(len(cities)), len(dates)), cities),
+        "timestamp": np.tile(dates.to_numpy(), len(cities)),
+        "temperature": temperature.ravel(),
+        "season": pd.Categorical.from_codes(np.tile(season_idx, len(cities)), SEASONS),
+    })
+    if anomalies is not None:
+        df["is_injected_anomaly"] = anomalies.ravel()
+    if missing_rate:
+        df = df[rng.random(len(df)) >= missing_rate].reset_index(drop=True)
     return df
 
-# Генерация данных
-data = generate_realistic_temperature_data(list(seasonal_temperatures.keys()))
-data.to_csv('temperature_data.csv', index=False)
+
+def write_temperature_data(path, cities, num_years=10, seed=None, profiles=None,
+                           chunk_cities=200, file_format=None, **kwargs):
+    """
+    Генерирует данные порциями по `chunk_cities` городов и дописывает их в CSV
+    или Parquet, так что объём набора не ограничен оперативной памятью.
+    Для Parquet нужен pyarrow. Результат детерминирован при заданных seed и chunk_cities.
+    """
+    cities = list(cities)
+    file_format = file_format or ("parquet" if path.endswith(".parquet") else "csv")
+    seed_seq = np.random.SeedSequence(seed)
+    chunk_starts = range(0, len(cities), chunk_cities)
+    rngs = [np.random.default_rng(s) for s in seed_seq.spawn(len(chunk_starts))]
+
+    writer = None
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        for rng, chunk_start in zip(rngs, chunk_starts):
+            chunk = generate_realistic_temperature_data(
+                cities[chunk_start:chunk_start + chunk_cities], num_years,
+                profiles=profiles, rng=rng, **kwargs
+            )
+            if file_format == "parquet":
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                chunk["city"] = chunk["city"].astype(str)
+                chunk["season"] = chunk["season"].astype(str)
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+                writer.write_table(table)
+            else:
+                chunk.to_csv(path, mode="a", header=chunk_start == 0, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетических температурных данных")
+    parser.add_argument("--output", default="temperature_data.csv")
+    parser.add_argument("--cities", type=int, default=None,
+                        help="Число синтетических городов (по умолчанию — реальные 15 городов)")
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-cities", type=int, default=200)
+    parser.add_argument("--trend", type=float, default=0.0, help="Тренд, °C в год")
+    parser.add_argument("--anomaly-rate", type=float, default=0.0)
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.cities:
+        profiles = make_synthetic_cities(args.cities, args.seed)
+    else:
+        profiles = seasonal_temperatures
+    write_temperature_data(args.output, list(profiles), args.years, seed=args.seed, profiles=profiles,
+                           chunk_cities=args.chunk_cities, trend_per_year=args.trend,
+                           anomaly_rate=args.anomaly_rate, missing_rate=args.missing_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+DEFAULT_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+# Сколько ждать чужой запрос того же города, прежде чем запросить самому
+WAIT_TIMEOUT = float(os.getenv("WEATHER_CACHE_WAIT_TIMEOUT", "30"))
+
+
+class WeatherCache:
+    """
+    Кэш ответов OpenWeatherMap на уровне процесса с TTL.
+
+    Ключ — (город, единицы измерения). Одновременные запросы одного и того же
+    города объединяются: в API уходит только один запрос, остальные ждут его результат.
+    Модуль импортируется один раз, поэтому кэш переживает перезапуски скрипта
+    Streamlit и общий для всех сессий.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(city_name, units='metric'):
+        return ' '.join(city_name.split()).casefold(), units
+
+    def _claim(self, key):
+        """Возвращает (значение, future, владелец ли вызывающий запроса)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1], None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+            return None, future, True
+
+    def _resolve(self, key, future, value=None, error=None):
+        with self._lock:
+            # Ошибки и пустые ответы не кэшируем
+            if error is None and value is not None:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def get_or_fetch(self, city_name, fetch, units='metric'):
+        """Синхронно возвращает данные из кэша или вызывает fetch()."""
+        key = self.make_key(city_name, units)
+        value, future, owner = self._claim(key)
+        if future is None:
+            return value
+        if not owner:
+            try:
+                return future.result(timeout=WAIT_TIMEOUT)
+            except FutureTimeoutError:
+                return fetch()
+        try:
+            value = fetch()
+        except Exception as e:
+            self._resolve(key, future, error=e)
+            raise
+        except BaseException as e:
+            # StopException/RerunException Streamlit или KeyboardInterrupt относятся к сессии владельца:
+            # ожидающим отдаём обычную ошибку, но future обязательно завершаем
+            self._resolve(key, future, error=RuntimeError(f"Запрос погоды прерван: {e!r}"))
+            raise
+        self._resolve(key, future, value)
+        return value
+
+    async def get_or_fetch_async(self, city_name, fetch, units='metric'):
+        """Асинхронный вариант: fetch — корутинная функция без аргументов."""
+        key = self.make_key(city_name, units)
+        value, future, owner = self._claim(key)
+        if future is None:
+            return value
+        if not owner:
+            # shield: отмена или таймаут ожидающего не должны отменять общий future владельца
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                return await fetch()
+        try:
+            value = await fetch()
+        except Exception as e:
+            self._resolve(key, future, error=e)
+            raise
+        except BaseException as e:
+            # CancelledError относится к задаче владельца, а не к сессиям, которые ждут тот же город
+            self._resolve(key, future, error=RuntimeError(f"Запрос погоды прерван: {e!r}"))
+            raise
+        self._resolve(key, future, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': (self.hits + self.coalesced) / total if total else 0.0,
+                'size': len(self._entries),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+weather_cache = WeatherCache()
@@ -0,0 +1,134 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+
+import aiohttp
+import pandas as pd
+
+OPENWEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+
+# Бесплатный тариф OpenWeatherMap: 60 запросов в минуту
+DEFAULT_RATE_PER_SECOND = 1.0
+DEFAULT_BURST = 10
+
+month_to_season = {12: "winter", 1: "winter", 2: "winter",
+                   3: "spring", 4: "spring", 5: "spring",
+                   6: "summer", 7: "summer", 8: "summer",
+                   9: "autumn", 10: "autumn", 11: "autumn"}
+
+
+def get_current_season(now=None):
+    """Возвращает сезон для текущей (или переданной) даты."""
+    now = now or datetime.now()
+    return month_to_season[now.month]
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не более `rate` запросов в секунду с запасом `capacity`."""
+
+    def __init__(self, rate=DEFAULT_RATE_PER_SECOND, capacity=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def fetch_city_weather(session, api_key, city_name, semaphore, bucket,
+                             retries=3, backoff=0.5, base_url=OPENWEATHER_URL):
+    """
+    Запрашивает текущую погоду для одного города с ограничением параллелизма,
+    лимитом частоты и повторами с jitter. Повторяются только 429, 5xx и сетевые ошибки.
+    Возвращает словарь с результатом и таймингами.
+    """
+    params = {'q': city_name, 'appid': api_key, 'units': 'metric'}
+    result = {'city': city_name, 'temp': None, 'elapsed': 0.0, 'attempts': 0, 'error': None}
+
+    async with semaphore:
+        for attempt in range(1, retries + 1):
+            await bucket.acquire()
+            result['attempts'] = attempt
+            start = time.perf_counter()
+            try:
+                async with session.get(base_url, params=params) as response:
+                    if 400 <= response.status < 500 and response.status != 429:
+                        # Неверный ключ (401), неизвестный город (404) и прочие 4xx повтором не исправить
+                        try:
+                            message = (await response.json()).get('message')
+                        except (aiohttp.ContentTypeError, ValueError):
+                            message = None
+                        result['error'] = message or f"HTTP {response.status}"
+                        return result
+                    if response.status < 400:
+                        # Ответ без main.temp — ошибка этого города, а не всего gather
+                        try:
+                            result['temp'] = float((await response.json())['main']['temp'])
+                            result['error'] = None
+                        except (aiohttp.ContentTypeError, ValueError, KeyError, TypeError):
+                            result['error'] = "unexpected response"
+                        return result
+                    # 429 и 5xx — временные, повторяем
+                    result['error'] = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result['error'] = str(e) or type(e).__name__
+            finally:
+                result['elapsed'] += time.perf_counter() - start
+
+            if attempt < retries:
+                # Экспоненциальная задержка с jitter, чтобы повторы не шли пачкой
+                await asyncio.sleep(backoff * 2 ** (attempt - 1) + random.uniform(0, backoff))
+    return result
+
+
+async def fetch_all_cities(api_key, cities, concurrency=10, rate=DEFAULT_RATE_PER_SECOND,
+                           burst=DEFAULT_BURST, retries=3, timeout=10, base_url=OPENWEATHER_URL):
+    """
+    Параллельно получает текущую погоду для всех городов через одну общую сессию.
+    `base_url` можно направить на локальный stub-сервер для проверки.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, burst)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        tasks = [
+            fetch_city_weather(session, api_key, city, semaphore, bucket,
+                               retries=retries, base_url=base_url)
+            for city in cities
+        ]
+        return await asyncio.gather(*tasks)
+
+
+def build_norm_table(results, df, season=None, threshold=2):
+    """
+    Сводная таблица «текущая температура против сезонной нормы» по всем городам.
+    """
+    season = season or get_current_season()
+    norms = (
+        df[df['season'] == season]
+        .groupby('city')['temperature']
+        .agg(['mean', 'std'])
+        .rename(columns={'mean': 'mean_temp', 'std': 'std_temp'})
+    )
+    table = pd.DataFrame(results).set_index('city').join(norms, how='left')
+    table['lower_limit'] = table['mean_temp'] - threshold * table['std_temp']
+    table['upper_limit'] = table['mean_temp'] + threshold * table['std_temp']
+    table['deviation'] = table['temp'] - table['mean_temp']
+    table['is_anomaly'] = (table['temp'] < table['lower_limit']) | (table['temp'] > table['upper_limit'])
+    table['season'] = season
+    return table.reset_index()[[
+        'city', 'season', 'temp', 'mean_temp', 'std_temp', 'lower_limit', 'upper_limit',
+        'deviation', 'is_anomaly', 'elapsed', 'attempts', 'error'
+    ]]
@@ -0,0 +1,56 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from datetime import time as day_time
+
+logger = logging.getLogger(__name__)
+
+# Сколько дней сырые логи живут в основной базе; 0 — не архивировать
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '5000'))
+ARCHIVE_HOUR = int(os.getenv('ARCHIVE_HOUR', '3'))
+
+
+def archive_path(db_name):
+    """Файл архива логов: BOT_ARCHIVE_PATH или <база>_archive.db рядом с основной базой"""
+    return os.getenv('BOT_ARCHIVE_PATH') or f"{os.path.splitext(db_name)[0]}_archive.db"
+
+
+def archive_cutoff(days, today=None):
+    """Первый день, логи которого остаются в основной базе"""
+    today = today or datetime.now(timezone.utc).date()
+    return (today - timedelta(days=days)).isoformat()
+
+
+async def archive_old_logs(db, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Переносит логи старше days дней в архивную базу и отдаёт освободившееся место файлу.
+
+    Дневные суммы за архивные дни остаются в daily_totals, поэтому прогресс и графики
+    их не теряют, а выгрузка читает сырые логи из обеих баз.
+    """
+    start = time.perf_counter()
+    before = archive_cutoff(days)
+    moved = await db.archive_logs(archive_path(db.db.db_name), before, batch_size)
+    freed = await db.incremental_vacuum()
+    stats = {
+        'before': before,
+        'moved': sum(moved.values()),
+        **moved,
+        'freed_pages': freed,
+        'seconds': time.perf_counter() - start,
+    }
+    if freed is None:
+        logger.warning("auto_vacuum не INCREMENTAL: место не вернётся файлу, выполните manage.py archive "
+                       "--enable-incremental-vacuum")
+    logger.info("Архивация логов: %s", stats)
+    return stats
+
+
+def schedule_archival(job_queue, db, hour=ARCHIVE_HOUR, days=ARCHIVE_AFTER_DAYS):
+    """Ежедневная архивация в hour:00 UTC"""
+    async def job(context):
+        await archive_old_logs(db, days)
+
+    return job_queue.run_daily(job, time=day_time(hour=hour), name='log_archival')
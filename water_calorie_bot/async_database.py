@@ -0,0 +1,201 @@
+import asyncio
+import functools
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from database import Database
+
+DB_READERS = int(os.getenv('DB_READERS', '4'))
+GROUP_COMMIT_MS = float(os.getenv('DB_GROUP_COMMIT_MS', '5'))
+GROUP_COMMIT_ROWS = int(os.getenv('DB_GROUP_COMMIT_ROWS', '256'))
+
+
+class AsyncDatabase:
+    """
+    Асинхронная обёртка над Database для хэндлеров бота.
+
+    Запросы к SQLite выполняются вне цикла событий: все записи — в одном
+    выделенном потоке-писателе, чтения — в пуле потоков, у каждого из которых
+    своё соединение (WAL позволяет читать параллельно с записью).
+
+    Логи воды, еды и тренировок фиксируются пакетами (group commit): запись
+    ждёт в очереди не дольше group_commit_ms или до group_commit_rows строк,
+    и весь пакет уходит одной транзакцией. log_* возвращается после коммита.
+    """
+
+    def __init__(self, db_name="bot_data.db", readers=DB_READERS,
+                 group_commit_ms=GROUP_COMMIT_MS, group_commit_rows=GROUP_COMMIT_ROWS):
+        self.db = Database(db_name)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        # Архивация и VACUUM идут долго и берут блокировку записи по частям — не занимаем ими писателя
+        self._maintenance = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-maintenance')
+        self.group_commit_delay = group_commit_ms / 1000
+        self.group_commit_rows = group_commit_rows
+        self._pending = []
+        self._has_pending = None
+        self._batch_full = None
+        self._flusher = None
+        self._closing = False
+        self.commit_batches = 0
+        self.commit_rows = 0
+        self._recent_commits = deque(maxlen=1000)
+
+    async def _run(self, executor, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+    async def _read(self, func, *args):
+        return await self._run(self._readers, func, *args)
+
+    async def _write(self, func, *args):
+        return await self._run(self._writer, func, *args)
+
+    async def _write_log(self, kind, params):
+        if self.group_commit_rows <= 1:
+            # Без группировки: каждая запись — отдельная транзакция
+            return await self._commit_batch([(kind, params, None)])
+        if self._flusher is None or self._flusher.done():
+            self._has_pending = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((kind, params, future))
+        self._has_pending.set()
+        if len(self._pending) >= self.group_commit_rows:
+            self._batch_full.set()
+        await future
+
+    async def _flush_loop(self):
+        while True:
+            await self._has_pending.wait()
+            # Пакет уходит по таймеру или сразу, как только набралось group_commit_rows строк
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.group_commit_delay)
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush_pending()
+            if self._closing and not self._pending:
+                return
+
+    async def _flush_pending(self):
+        batch = self._pending[:self.group_commit_rows]
+        del self._pending[:self.group_commit_rows]
+        if len(self._pending) < self.group_commit_rows:
+            self._batch_full.clear()
+        if not self._pending:
+            self._has_pending.clear()
+        if batch:
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            await self._write(self.db.write_log_batch, [(kind, params) for kind, params, _ in batch])
+        except Exception as e:
+            if batch[0][2] is None:
+                raise
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.commit_batches += 1
+            self.commit_rows += len(batch)
+            self._recent_commits.append((len(batch), time.perf_counter() - start))
+        for _, _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def write_metrics(self):
+        """Размеры пакетов и время коммита (по последним 1000 пакетам)"""
+        recent = list(self._recent_commits)
+        latencies = sorted(latency for _, latency in recent)
+        return {
+            'batches': self.commit_batches,
+            'rows': self.commit_rows,
+            'avg_batch_size': sum(size for size, _ in recent) / len(recent) if recent else 0.0,
+            'max_batch_size': max((size for size, _ in recent), default=0),
+            'commit_p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            'commit_p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        }
+
+    async def save_user_profile(self, *args):
+        return await self._write(self.db.save_user_profile, *args)
+
+    async def get_user_profile(self, user_id):
+        # Попадание в кэш профилей не требует похода в пул потоков
+        profile = self.db.profiles.get(user_id)
+        if profile is not None:
+            return profile
+        return await self._read(self.db.get_user_profile, user_id)
+
+    async def delete_user_profile(self, user_id):
+        return await self._write(self.db.delete_user_profile, user_id)
+
+    # Время записи фиксируется в момент вызова, а не коммита пакета
+    async def log_water(self, user_id, amount_ml):
+        await self._write_log('water', (user_id, amount_ml, self.db._now()))
+
+    async def log_food(self, user_id, product_name, calories, weight_grams):
+        await self._write_log('food', (user_id, product_name, calories, weight_grams, self.db._now()))
+
+    async def log_workout(self, user_id, workout_type, duration_minutes, calories_burned, water_needed_ml):
+        await self._write_log('workout', (user_id, workout_type, duration_minutes, calories_burned,
+                                          water_needed_ml, self.db._now()))
+
+    async def get_water_consumed_today(self, user_id):
+        return await self._read(self.db.get_water_consumed_today, user_id)
+
+    async def get_calories_consumed_today(self, user_id):
+        return await self._read(self.db.get_calories_consumed_today, user_id)
+
+    async def get_calories_burned_today(self, user_id):
+        return await self._read(self.db.get_calories_burned_today, user_id)
+
+    async def get_water_needed_from_workouts_today(self, user_id):
+        return await self._read(self.db.get_water_needed_from_workouts_today, user_id)
+
+    async def get_daily_totals(self, user_id):
+        return await self._read(self.db.get_daily_totals, user_id)
+
+    async def get_daily_series(self, user_id, days):
+        return await self._read(self.db.get_daily_series, user_id, days)
+
+    async def get_recent_foods(self, user_id, limit):
+        return await self._read(self.db.get_recent_foods, user_id, limit)
+
+    async def get_users_behind_water(self, fraction, sent_before, limit):
+        return await self._read(self.db.get_users_behind_water, fraction, sent_before, limit)
+
+    async def mark_reminders_sent(self, user_ids, timestamp):
+        return await self._write(self.db.mark_reminders_sent, user_ids, timestamp)
+
+    async def set_reminders_enabled(self, user_id, enabled):
+        return await self._write(self.db.set_reminders_enabled, user_id, enabled)
+
+    async def get_goal_inputs(self):
+        return await self._read(self.db.get_goal_inputs)
+
+    async def update_water_goals(self, goals):
+        return await self._write(self.db.update_water_goals, goals)
+
+    async def archive_logs(self, archive_name, before, batch_size=5000):
+        return await self._run(self._maintenance, self.db.archive_logs, archive_name, before, batch_size)
+
+    async def incremental_vacuum(self, pages_per_step=1000):
+        return await self._run(self._maintenance, self.db.incremental_vacuum, pages_per_step)
+
+    async def close(self):
+        """Дописывает очередь логов и закрывает соединения"""
+        self._closing = True
+        if self._flusher is not None and not self._flusher.done():
+            self._has_pending.set()
+            await self._flusher
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self._maintenance.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,939 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from calculator import Calculator
+
+
+class FakeMessage:
+    """Сообщение-заглушка: reply_text ничего не отправляет в Telegram."""
+
+    def __init__(self, text=''):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def reply_photo(self, photo, **kwargs):
+        self.replies.append(photo)
+
+
+def make_update(user_id, text=''):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id, first_name=f'user{user_id}', username=None),
+        message=FakeMessage(text),
+    )
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def report_latencies(title, latencies, elapsed):
+    print(f"{title}: {len(latencies)} вызовов за {elapsed:.2f} сек ({len(latencies) / elapsed:.0f} в сек)")
+    print(f"  p50={percentile(latencies, 0.5) * 1000:.1f} мс, p95={percentile(latencies, 0.95) * 1000:.1f} мс, "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f} мс, max={max(latencies) * 1000:.1f} мс, "
+          f"mean={statistics.mean(latencies) * 1000:.1f} мс")
+
+
+async def measure_loop_lag(stop, interval=0.01):
+    """Максимальная задержка цикла событий: показывает, блокируют ли хэндлеры event loop."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+def create_profiles(database, users):
+    for user_id in range(1, users + 1):
+        database.save_user_profile(user_id, f'user{user_id}', 70, 175, 30, 'male', 30, 'Moscow', 2500, 2450)
+
+
+async def bench_log_water(args):
+    """Тысячи пользователей одновременно присылают /log_water."""
+    import bot
+
+    bot.db.group_commit_rows = args.group_commit_rows
+    bot.db.group_commit_delay = args.group_commit_ms / 1000
+    create_profiles(bot.db.db, args.users)
+
+    async def one_call(user_id):
+        update = make_update(user_id)
+        context = SimpleNamespace(args=[str(args.amount)], user_data={})
+        start = time.perf_counter()
+        await bot.log_water(update, context)
+        return time.perf_counter() - start
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one_call(user_id) for user_id in range(1, args.users + 1)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    report_latencies("/log_water", latencies, elapsed)
+    print(f"  максимальная задержка цикла событий: {await lag_task * 1000:.1f} мс")
+    metrics = bot.db.write_metrics()
+    print(f"  коммитов: {metrics['batches']}, строк: {metrics['rows']}, "
+          f"средний пакет: {metrics['avg_batch_size']:.1f}, максимальный: {metrics['max_batch_size']}, "
+          f"коммит p50={metrics['commit_p50_ms']:.1f} мс, p95={metrics['commit_p95_ms']:.1f} мс")
+    await bot.db.close()
+
+
+def populate_logs(database, rows, users, days, seed=42, batch_size=100_000):
+    """Заполняет таблицы логов случайными записями за последние `days` дней."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    span = days * 86400
+
+    def timestamp():
+        return (now - timedelta(seconds=rng.randrange(span))).strftime('%Y-%m-%d %H:%M:%S')
+
+    tables = [
+        ('INSERT INTO water_logs (user_id, amount_ml, timestamp) VALUES (?, ?, ?)',
+         lambda: (rng.randint(1, users), rng.choice((200, 250, 300, 500)), timestamp()), 0.5),
+        ('INSERT INTO food_logs (user_id, product_name, calories, weight_grams, timestamp) VALUES (?, ?, ?, ?, ?)',
+         lambda: (rng.randint(1, users), 'банан', 89.0, 100.0, timestamp()), 0.3),
+        ('INSERT INTO workout_logs (user_id, workout_type, duration_minutes, calories_burned, water_needed_ml, timestamp) '
+         'VALUES (?, ?, ?, ?, ?, ?)',
+         lambda: (rng.randint(1, users), 'бег', 30, 360, 300, timestamp()), 0.2),
+    ]
+    conn = database.conn
+    for sql, make_row, share in tables:
+        remaining = int(rows * share)
+        while remaining > 0:
+            batch = min(batch_size, remaining)
+            with conn:
+                conn.executemany(sql, (make_row() for _ in range(batch)))
+            remaining -= batch
+
+
+LEGACY_DAILY_QUERIES = [
+    "SELECT SUM(amount_ml) FROM water_logs WHERE user_id = ? AND date(timestamp) = date('now')",
+    "SELECT SUM(calories) FROM food_logs WHERE user_id = ? AND date(timestamp) = date('now')",
+    "SELECT SUM(calories_burned) FROM workout_logs WHERE user_id = ? AND date(timestamp) = date('now')",
+    "SELECT SUM(water_needed_ml) FROM workout_logs WHERE user_id = ? AND date(timestamp) = date('now')",
+]
+
+
+def bench_daily_totals(args):
+    """Дневные суммы для /check_progress: четыре запроса с date() без индексов против одного индексного."""
+    from database import Database
+
+    database = Database(os.environ['BOT_DB_PATH'])
+    start = time.perf_counter()
+    populate_logs(database, args.rows, args.users, args.days)
+    print(f"Заполнено {args.rows} строк за {time.perf_counter() - start:.1f} сек")
+
+    rng = random.Random(1)
+    user_ids = [rng.randint(1, args.users) for _ in range(args.lookups)]
+    conn = database.conn
+    for table in ('water_logs', 'food_logs', 'workout_logs'):
+        conn.execute(f'DROP INDEX IF EXISTS idx_{table}_user_ts')
+
+    latencies = []
+    start = time.perf_counter()
+    for user_id in user_ids:
+        call_start = time.perf_counter()
+        for sql in LEGACY_DAILY_QUERIES:
+            conn.execute(sql, (user_id,)).fetchone()
+        latencies.append(time.perf_counter() - call_start)
+    report_latencies("до: 4 запроса с date(timestamp), без индексов", latencies, time.perf_counter() - start)
+
+    database._create_tables()
+    latencies = []
+    start = time.perf_counter()
+    for user_id in user_ids:
+        call_start = time.perf_counter()
+        database.get_daily_totals_from_logs(user_id)
+        latencies.append(time.perf_counter() - call_start)
+    report_latencies("один запрос по индексу (user_id, timestamp)", latencies, time.perf_counter() - start)
+
+    database.rebuild_daily_totals()
+    latencies = []
+    start = time.perf_counter()
+    for user_id in user_ids:
+        call_start = time.perf_counter()
+        database.get_daily_totals(user_id)
+        latencies.append(time.perf_counter() - call_start)
+    report_latencies("поиск по первичному ключу в daily_totals", latencies, time.perf_counter() - start)
+
+
+def bench_export(args):
+    """Потоковая выгрузка: пиковая память не зависит от числа строк."""
+    import tracemalloc
+
+    from database import Database
+    from export import export_logs
+
+    database = Database(os.environ['BOT_DB_PATH'])
+    populate_logs(database, args.rows, args.users, args.days)
+    database.close()
+    tmp = os.path.dirname(os.environ['BOT_DB_PATH'])
+    for file_format in args.formats:
+        path = os.path.join(tmp, f'export.{file_format}')
+        start = time.perf_counter()
+        count = export_logs(os.environ['BOT_DB_PATH'], path, None, file_format, args.chunk_size)
+        elapsed = time.perf_counter() - start
+        # tracemalloc сильно замедляет выгрузку, поэтому память меряем отдельным прогоном
+        tracemalloc.start()
+        export_logs(os.environ['BOT_DB_PATH'], path, None, file_format, args.chunk_size)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{file_format}: {count} строк за {elapsed:.2f} сек ({count / elapsed:.0f} строк/с), "
+              f"файл {os.path.getsize(path) / 2**20:.1f} МБ, пик памяти Python {peak / 2**20:.1f} МБ")
+
+    latencies = []
+    start = time.perf_counter()
+    for user_id in random.Random(1).sample(range(1, args.users + 1), min(args.lookups, args.users)):
+        call_start = time.perf_counter()
+        export_logs(os.environ['BOT_DB_PATH'], os.path.join(tmp, 'user.csv.gz'), user_id)
+        latencies.append(time.perf_counter() - call_start)
+    report_latencies("выгрузка одного пользователя (csv)", latencies, time.perf_counter() - start)
+
+
+async def bench_archive(args):
+    """Архивация: основная база уменьшается, история для выгрузки и сводок не теряется, записи не стоят."""
+    from archive import archive_old_logs, archive_path
+    from async_database import AsyncDatabase
+    from database import Database
+    from export import iter_log_chunks
+
+    db_path = os.environ['BOT_DB_PATH']
+    database = Database(db_path)
+    populate_logs(database, args.rows, args.users, args.days)
+    create_profiles(database, args.users)
+    database.close()
+
+    def measure(title):
+        database = Database(db_path)
+        conn = database.conn
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        rows = sum(conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+                   for t in ('water_logs', 'food_logs', 'workout_logs'))
+        start = time.perf_counter()
+        total, mismatched = database.rebuild_daily_totals()
+        rebuild = time.perf_counter() - start
+        exported = sum(len(chunk) for chunk in iter_log_chunks(db_path, archive_name=archive_path(db_path)))
+        print(f"{title}: файл {os.path.getsize(db_path) / 2**20:.1f} МБ, строк в логах {rows}, "
+              f"rebuild-totals {rebuild:.2f} сек ({total} дней, расхождений {mismatched}), в выгрузке {exported}")
+        database.close()
+        return exported
+
+    exported_before = measure("до архивации")
+
+    db = AsyncDatabase(db_path)
+    stop = asyncio.Event()
+    latencies = []
+
+    async def writer():
+        rng = random.Random(7)
+        while not stop.is_set():
+            start = time.perf_counter()
+            await db.log_water(rng.randint(1, args.users), 250)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.005)
+
+    writer_task = asyncio.create_task(writer())
+    stats = await archive_old_logs(db, args.keep_days, args.batch_size)
+    stop.set()
+    await writer_task
+    await db.close()
+    print(f"Перенесено {stats['moved']} строк за {stats['seconds']:.2f} сек, освобождено страниц {stats['freed_pages']}")
+    report_latencies("log_water во время архивации", latencies, stats['seconds'])
+
+    exported_after = measure("после архивации")
+    print(f"Архив {os.path.getsize(archive_path(db_path)) / 2**20:.1f} МБ; "
+          f"выгрузка полная: {exported_after == exported_before + len(latencies)}")
+
+
+def start_stub_server(respond, delay=0.0):
+    """
+    Локальный HTTP-сервер вместо внешнего API. respond(path, query) возвращает (статус, JSON-ответ).
+    Возвращает (сервер, базовый URL).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, как у настоящих API: клиенты httpx переиспользуют соединения
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self):
+            url = urlparse(self.path)
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            time.sleep(delay)
+            status, payload = respond(url.path, {k: v[0] for k, v in parse_qs(url.query).items()})
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _reply
+        do_POST = _reply
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 128
+
+        def handle_error(self, request, client_address):
+            # Клиент отменил запрос и закрыл соединение — для stub это не ошибка
+            if not isinstance(sys.exc_info()[1], ConnectionError):
+                super().handle_error(request, client_address)
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+FOODS = ['банан', 'яблоко', 'гречка', 'куриная грудка', 'овсянка', 'творог', 'рис', 'хлеб', 'молоко', 'яйцо']
+
+
+def telegram_stub(path, query):
+    """Bot API: getMe и ответы на sendMessage, остальные методы просто возвращают True"""
+    method = path.rsplit('/', 1)[-1]
+    if method == 'getMe':
+        result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+    elif method.startswith('send'):
+        result = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'}}
+    else:
+        result = True
+    return 200, {'ok': True, 'result': result}
+
+
+def make_update_payload(update_id, user_id, text):
+    """JSON апдейта с текстовым сообщением, как его присылает Telegram"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def openfoodfacts_stub(path, query):
+    terms = query.get('search_terms', '')
+    return 200, {'products': [{'product_name': terms.capitalize(), 'nutriments': {'energy-kcal_100g': 100 + len(terms)}}]}
+
+
+async def bench_nutrition(args):
+    """Доля поисков продуктов без сети и задержка поиска при типичной нагрузке /log_food."""
+    from nutrition_api import NutritionAPI
+    from product_store import ProductStore
+
+    server, base_url = start_stub_server(openfoodfacts_stub, delay=args.remote_delay)
+    store = ProductStore(os.path.join(os.path.dirname(os.environ['BOT_DB_PATH']), 'nutrition.db'))
+    if args.with_index:
+        dump = os.path.join(os.path.dirname(os.environ['BOT_DB_PATH']), 'dump.jsonl')
+        with open(dump, 'w', encoding='utf-8') as f:
+            for name in FOODS[:len(FOODS) // 2]:
+                f.write(json.dumps({'product_name': name.capitalize(), 'nutriments': {'energy-kcal_100g': 90}}) + '\n')
+        store.build_index(dump)
+    api = NutritionAPI(store=store, base_url=f"{base_url}/cgi/search.pl")
+
+    # Частые продукты встречаются намного чаще редких (распределение Ципфа)
+    rng = random.Random(42)
+    catalogue = FOODS + [f'продукт {i}' for i in range(args.catalogue)]
+    weights = [1 / (rank + 1) for rank in range(len(catalogue))]
+    queries = rng.choices(catalogue, weights, k=args.lookups)
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), args.concurrency):
+        await asyncio.gather(*(api.search_product(q) for q in queries[offset:offset + args.concurrency]))
+    elapsed = time.perf_counter() - start
+    await api.close()
+    server.shutdown()
+
+    stats = api.stats()
+    print(f"{args.lookups} поисков за {elapsed:.2f} сек")
+    print(f"  источники: память {stats['memory']}, объединено {stats['coalesced']}, кэш SQLite {stats['cache']}, "
+          f"индекс {stats['index']}, сеть {stats['remote']}, не найдено {stats['not_found']}")
+    print(f"  без обращения к сети: {stats['local_hit_rate']:.1%}, "
+          f"p50={stats['p50_ms']:.1f} мс, p95={stats['p95_ms']:.1f} мс")
+
+
+async def bench_stats_chart(args):
+    """/stats_chart: первая отрисовка в пуле процессов и повторные запросы из кэша."""
+    import bot
+
+    create_profiles(bot.db.db, args.users)
+    populate_logs(bot.db.db, args.users * 60, args.users, 30)
+    bot.db.db.rebuild_daily_totals()
+
+    async def one_call(user_id):
+        update = make_update(user_id)
+        context = SimpleNamespace(args=[args.period], user_data={})
+        start = time.perf_counter()
+        await bot.stats_chart(update, context)
+        assert isinstance(update.message.replies[-1], bytes)
+        return time.perf_counter() - start
+
+    for title in ("первая отрисовка", "повторный запрос (кэш)"):
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(measure_loop_lag(stop))
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one_call(user_id) for user_id in range(1, args.users + 1)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        report_latencies(f"/stats_chart {args.period}, {title}", latencies, elapsed)
+        print(f"  максимальная задержка цикла событий: {await lag_task * 1000:.1f} мс")
+    print(f"  кэш графиков: {bot.chart_renderer.cache.stats()}")
+    bot.chart_renderer.close()
+    await bot.db.close()
+
+
+class FakeBot:
+    """Bot для напоминаний: считает отправки, каждое n-е сообщение получает RetryAfter"""
+
+    def __init__(self, retry_every=0):
+        self.retry_every = retry_every
+        self.calls = 0
+        self.sent_at = []
+
+    async def send_message(self, chat_id, text):
+        from telegram.error import RetryAfter
+
+        self.calls += 1
+        if self.retry_every and self.calls % self.retry_every == 0:
+            raise RetryAfter(1)
+        self.sent_at.append(time.perf_counter())
+
+
+async def bench_reminders(args):
+    """Тик напоминаний на большом числе пользователей и темп отправки."""
+    from async_database import AsyncDatabase
+    from reminders import ReminderScheduler
+
+    db = AsyncDatabase(os.environ['BOT_DB_PATH'])
+    rng = random.Random(42)
+    today = db.db._today_range()[0][:10]
+    with db.db.conn as conn:
+        conn.executemany('''
+            INSERT INTO users (user_id, username, weight, height, age, gender, activity_minutes, city,
+                               calorie_goal, water_goal)
+            VALUES (?, ?, 70, 175, 30, 'male', 30, 'Moscow', 2500, 2450)
+        ''', ((user_id, f'user{user_id}') for user_id in range(1, args.users + 1)))
+        conn.executemany(
+            'INSERT INTO daily_totals (user_id, day, water_ml) VALUES (?, ?, ?)',
+            ((user_id, today, rng.randrange(0, 3000, 250)) for user_id in range(1, args.users + 1, 2))
+        )
+
+    scheduler = ReminderScheduler(db, interval=args.interval, rate=args.rate, fraction=lambda now: 0.5)
+    bot = FakeBot(retry_every=args.retry_every)
+    context = SimpleNamespace(bot=bot)
+    for _ in range(2):
+        await scheduler.tick(context)
+        stats = scheduler.stats()
+        print(f"тик на {args.users} пользователях: {stats['last_tick_ms']:.0f} мс, "
+              f"в очередь {stats['last_candidates']}, в очереди {stats['queued']}")
+
+    start = time.perf_counter()
+    await scheduler._sender
+    elapsed = time.perf_counter() - start
+    stats = scheduler.stats()
+    # Темп в самую загруженную секунду не должен превышать rate
+    per_second = {}
+    for sent_at in bot.sent_at:
+        second = int(sent_at - start)
+        per_second[second] = per_second.get(second, 0) + 1
+    peak = max(per_second.values())
+    print(f"отправлено {stats['sent']} за {elapsed:.2f} сек ({stats['sent'] / elapsed:.0f} в сек, лимит {args.rate:.0f}), "
+          f"максимум за секунду {peak}, RetryAfter: {stats['rate_limited']}")
+    await db.close()
+    if peak > args.rate:
+        raise SystemExit(f"Превышен лимит: {peak} сообщений за секунду при лимите {args.rate:.0f}")
+
+
+async def bench_goals(args):
+    """Пересчёт норм воды: запросов погоды столько, сколько городов, а не пользователей."""
+    from async_database import AsyncDatabase
+    from goals import recalculate_water_goals
+    from weather_api import WeatherAPI
+
+    requests_made = []
+
+    def weather_stub(path, query):
+        requests_made.append(query['q'])
+        return 200, {'main': {'temp': 20 + len(query['q']) % 15}}
+
+    server, base_url = start_stub_server(weather_stub, delay=args.remote_delay)
+    os.environ.setdefault('OPENWEATHER_API_KEY', 'bench')
+    weather_api = WeatherAPI(base_url=base_url)
+    db = AsyncDatabase(os.environ['BOT_DB_PATH'])
+    cities = [f'Город {i}' for i in range(args.cities)]
+    rng = random.Random(42)
+    with db.db.conn as conn:
+        conn.executemany('''
+            INSERT INTO users (user_id, username, weight, height, age, gender, activity_minutes, city,
+                               calorie_goal, water_goal)
+            VALUES (?, ?, ?, 175, 30, 'male', ?, ?, 2500, 2450)
+        ''', ((user_id, f'user{user_id}', rng.randint(50, 100), rng.choice((0, 30, 60)),
+               # Один и тот же город пишут по-разному
+               rng.choice(cities).upper() if user_id % 3 == 0 else rng.choice(cities))
+              for user_id in range(1, args.users + 1)))
+
+    stats = await recalculate_water_goals(db, weather_api, args.concurrency)
+    print(f"{stats['users']} пользователей в {stats['cities']} городах: {stats['seconds']:.2f} сек, "
+          f"запросов погоды {len(requests_made)}, обновлено норм {stats['updated']}")
+    await weather_api.close()
+    await db.close()
+    server.shutdown()
+
+
+async def bench_weather(args):
+    """Проверка WeatherAPI на локальном stub: кэш, объединение запросов и выключатель open → half_open → closed."""
+    from weather_api import WeatherAPI
+
+    stub = {'status': 200, 'delay': 0.0, 'requests': 0}
+
+    def weather_stub(path, query):
+        stub['requests'] += 1
+        time.sleep(stub['delay'])
+        if stub['status'] != 200:
+            return stub['status'], {'message': 'error'}
+        return 200, {'main': {'temp': 20.5}}
+
+    server, base_url = start_stub_server(weather_stub)
+    os.environ.setdefault('OPENWEATHER_API_KEY', 'bench')
+    weather_api = WeatherAPI(base_url=base_url)
+    breaker = weather_api.breaker
+    breaker.reset_timeout = 0.2
+
+    # Объединение: одновременные запросы одного города — один поход в API, повторный — из кэша
+    stub['delay'] = 0.1
+    temps = await asyncio.gather(*(weather_api.get_temperature(' moscow ' if i % 2 else 'Moscow')
+                                   for i in range(args.concurrency)))
+    stub['delay'] = 0.0
+    assert temps == [20.5] * args.concurrency and stub['requests'] == 1, stub
+    assert await weather_api.get_temperature('MOSCOW') == 20.5 and stub['requests'] == 1
+    print(f"кэш: {args.concurrency} одновременных запросов и повтор — 1 запрос к API, {weather_api.cache.stats()}")
+
+    # Ошибки 5xx размыкают цепь, пока она разомкнута, в API не ходим
+    stub['status'] = 503
+    for i in range(breaker.failure_threshold):
+        assert await weather_api.get_temperature(f'city{i}') is None
+    assert breaker.state == 'open', breaker.state
+    before = stub['requests']
+    assert await weather_api.get_temperature('Paris') is None and stub['requests'] == before
+    print(f"open: после {breaker.failure_threshold} ошибок запросы не уходят в API")
+
+    # Отменённый пробный запрос не должен держать выключатель полуоткрытым навсегда
+    await asyncio.sleep(breaker.reset_timeout)
+    stub['delay'] = 0.5
+    trial = asyncio.create_task(weather_api._fetch_temperature('Berlin'))
+    await asyncio.sleep(0.05)
+    trial.cancel()
+    await asyncio.gather(trial, return_exceptions=True)
+    assert breaker.state == 'half_open' and not breaker._trial_in_progress, breaker.state
+    print("half_open: отменённый пробный запрос освободил выключатель")
+
+    # Пробный запрос с ошибкой снова размыкает цепь, успешный — замыкает
+    stub['delay'] = 0.0
+    assert await weather_api.get_temperature('Rome') is None and breaker.state == 'open'
+    stub['status'] = 200
+    await asyncio.sleep(breaker.reset_timeout)
+    assert await weather_api.get_temperature('London') == 20.5 and breaker.state == 'closed'
+    print("half_open → closed: успешный пробный запрос замкнул цепь")
+
+    await weather_api.close()
+    server.shutdown()
+
+
+def random_calculator_inputs(rng, n):
+    """Случайные входы калькулятора, включая граничные значения активности и температуры"""
+    workouts = list(Calculator.WORKOUT_CALORIES_PER_MINUTE) + ['Бег', 'КАРДИО', 'скакалка']
+    return {
+        'weight': [rng.choice((rng.randint(30, 300), round(rng.uniform(30, 300), 1))) for _ in range(n)],
+        'height': [rng.choice((rng.randint(100, 250), round(rng.uniform(100, 250), 1))) for _ in range(n)],
+        'age': [rng.randint(10, 100) for _ in range(n)],
+        'gender': [rng.choice(('male', 'female', 'Male', 'FEMALE')) for _ in range(n)],
+        'activity': [rng.choice((0, 29, 30, 59, 60, 89, 90, 120, rng.randint(0, 600))) for _ in range(n)],
+        'temperature': [rng.choice((None, 0, 25, 25.5, 50, rng.uniform(-40, 50))) for _ in range(n)],
+        'workout': [rng.choice(workouts) for _ in range(n)],
+        'duration': [rng.randint(1, 300) for _ in range(n)],
+    }
+
+
+def bench_calculator(args):
+    """Пакетные методы Calculator: совпадение со скалярными на случайных входах и скорость."""
+    import numpy as np
+
+    rng = random.Random(args.seed)
+    data = random_calculator_inputs(rng, args.users)
+    temperature = [np.nan if t is None else t for t in data['temperature']]
+
+    start = time.perf_counter()
+    bmr = [Calculator.calculate_bmr(w, h, a, g)
+           for w, h, a, g in zip(data['weight'], data['height'], data['age'], data['gender'])]
+    calories = [Calculator.calculate_calorie_goal(b, m) for b, m in zip(bmr, data['activity'])]
+    water = [Calculator.calculate_water_goal(w, m, t)
+             for w, m, t in zip(data['weight'], data['activity'], data['temperature'])]
+    burned = [Calculator.estimate_calories_burned(k, d, w)
+              for k, d, w in zip(data['workout'], data['duration'], data['weight'])]
+    scalar_seconds = time.perf_counter() - start
+
+    columns = {name: np.array(values) for name, values in data.items() if name != 'temperature'}
+    start = time.perf_counter()
+    bmr_batch = Calculator.calculate_bmr_batch(columns['weight'], columns['height'], columns['age'], columns['gender'])
+    calories_batch = Calculator.calculate_calorie_goal_batch(bmr_batch, columns['activity'])
+    water_batch = Calculator.calculate_water_goal_batch(columns['weight'], columns['activity'], np.array(temperature))
+    burned_batch = Calculator.estimate_calories_burned_batch(columns['workout'], columns['duration'], columns['weight'])
+    batch_seconds = time.perf_counter() - start
+
+    for name, expected, actual in [('bmr', bmr, bmr_batch), ('calorie_goal', calories, calories_batch),
+                                   ('water_goal', water, water_batch), ('calories_burned', burned, burned_batch)]:
+        mismatches = np.flatnonzero(np.array(expected) != actual)
+        if len(mismatches):
+            i = mismatches[0]
+            raise SystemExit(f"{name}: {len(mismatches)} расхождений, например #{i}: "
+                             f"{expected[i]} != {actual[i]} при {({k: v[i] for k, v in data.items()})}")
+    print(f"{args.users} пользователей: результаты пакетных методов совпадают со скалярными")
+    print(f"  скалярные: {scalar_seconds:.2f} сек, пакетные: {batch_seconds:.3f} сек "
+          f"(в {scalar_seconds / batch_seconds:.0f} раз быстрее)")
+
+
+def recorded_updates(args):
+    """Апдейты из JSONL-файла или синтетический сценарий: вода, поиск еды, прогресс"""
+    if args.updates:
+        with open(args.updates, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    updates = []
+    for user_id in range(1, args.users + 1):
+        food = f'{FOODS[user_id % len(FOODS)]} {user_id}'
+        for text in ['/log_water 250', '/log_food', food, '150', '/check_progress']:
+            updates.append(make_update_payload(len(updates) + 1, user_id, text))
+    return updates
+
+
+def report_handler_metrics():
+    """Среднее время хэндлеров и его разбивка по компонентам из метрик Prometheus"""
+    from prometheus_client import REGISTRY
+
+    totals = {}
+    for metric in REGISTRY.collect():
+        if metric.name not in ('bot_handler_seconds', 'bot_component_seconds'):
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith(('_sum', '_count')):
+                key = (sample.labels['handler'], sample.labels.get('component', 'total'))
+                totals.setdefault(key, {})[sample.name.rsplit('_', 1)[1]] = sample.value
+    for handler in sorted({handler for handler, _ in totals}):
+        total = totals.get((handler, 'total'))
+        if not total or not total['count']:
+            continue
+        parts = ', '.join(f"{component} {values['sum'] / total['count'] * 1000:.1f}"
+                          for (name, component), values in sorted(totals.items())
+                          if name == handler and component != 'total')
+        print(f"  {handler}: {total['count']:.0f} раз, в среднем {total['sum'] / total['count'] * 1000:.1f} мс"
+              f"{f' (из них, мс: {parts})' if parts else ''}")
+
+
+async def bench_replay(args):
+    """Проигрывание апдейтов через вебхук: пропускная способность при медленном поиске еды."""
+    import httpx
+    import socket
+    import uvicorn
+
+    tmp = os.path.dirname(os.environ['BOT_DB_PATH'])
+    telegram_server, telegram_url = start_stub_server(telegram_stub, delay=args.telegram_delay)
+    food_server, food_url = start_stub_server(openfoodfacts_stub, delay=args.remote_delay)
+    os.environ['OPENFOODFACTS_URL'] = f"{food_url}/cgi/search.pl"
+    os.environ['NUTRITION_DB_PATH'] = os.path.join(tmp, 'nutrition.db')
+    if args.profile_dir:
+        os.environ['PROFILE_DIR'] = args.profile_dir
+        os.environ['SLOW_UPDATE_MS'] = str(args.slow_ms)
+    import bot
+    from webhook import WebhookApp
+
+    updates = recorded_updates(args)
+    create_profiles(bot.db.db, max(u['message']['from']['id'] for u in updates))
+    state_path = os.path.join(tmp, 'state.db') if args.state == 'sqlite' else None
+    application = bot.build_application('1:bench', base_url=f"{telegram_url}/bot",
+                                        concurrent_updates=args.concurrency, state_path=state_path)
+    app = WebhookApp(application, path='/telegram', secret_token='bench', webhook_url=None)
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    # Клиент, бот и сервер делят один цикл событий: keep-alive с запасом, чтобы uvicorn
+    # не закрывал соединения, которые клиент вот-вот переиспользует
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning',
+                                           lifespan='on', timeout_keep_alive=60))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    # Апдейты одного пользователя отправляются по порядку, разные пользователи — параллельно
+    by_user = {}
+    for update in updates:
+        by_user.setdefault(update['message']['from']['id'], []).append(update)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}",
+                                 headers={'X-Telegram-Bot-Api-Secret-Token': 'bench'},
+                                 limits=httpx.Limits(max_connections=100), timeout=60) as client:
+        async def send_user(user_updates):
+            for update in user_updates:
+                response = await client.post('/telegram', json=update)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send_user(user_updates) for user_updates in by_user.values()))
+        received = time.perf_counter() - start
+        while application.update_processor.processed < len(updates):
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        health = (await client.get('/healthcheck')).json()
+
+    server.should_exit = True
+    await server_task
+    telegram_server.shutdown()
+    food_server.shutdown()
+
+    print(f"{len(updates)} апдейтов от {len(by_user)} пользователей, параллельно до {args.concurrency}")
+    print(f"  приняты за {received:.2f} сек, обработаны за {elapsed:.2f} сек ({len(updates) / elapsed:.0f} в сек)")
+    print(f"  healthcheck: {health}")
+    if application.persistence:
+        print(f"  состояние диалогов в SQLite: {application.persistence.stats()}")
+    report_handler_metrics()
+    if args.profile_dir:
+        profiles = sorted(os.listdir(args.profile_dir))
+        print(f"  стеков медленных апдейтов: {len(profiles)} в {args.profile_dir}")
+        if profiles:
+            with open(os.path.join(args.profile_dir, profiles[-1])) as f:
+                print(f"  {profiles[-1]}, самые частые стеки:")
+                for line in f.readlines()[:3]:
+                    print(f"    {line.strip()}")
+
+
+async def bench_fairness(args):
+    """Один пользователь шлёт пачку медленных апдейтов: апдейт другого пользователя не должен её ждать."""
+    from telegram import Update
+
+    from update_processor import PerUserUpdateProcessor
+
+    processor = PerUserUpdateProcessor(args.concurrency)
+
+    def update(user_id, update_id):
+        return Update.de_json({'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}, 'text': 'x'}}, None)
+
+    # Пачка больше общего лимита: раньше очередь одного пользователя занимала все слоты
+    burst = [asyncio.create_task(processor.process_update(update(1, i), asyncio.sleep(args.slow_delay)))
+             for i in range(args.concurrency * 4)]
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await processor.process_update(update(2, 10_000), asyncio.sleep(0))
+    other = time.perf_counter() - start
+    print(f"Пачка из {len(burst)} апдейтов по {args.slow_delay:.1f} сек у пользователя 1, лимит {args.concurrency}: "
+          f"апдейт пользователя 2 обработан за {other * 1000:.1f} мс")
+    for task in burst:
+        task.cancel()
+    await asyncio.gather(*burst, return_exceptions=True)
+    assert other < args.slow_delay, "апдейт другого пользователя ждал очередь медленного"
+    assert not processor.stats()['active_users'], "замки пользователей не освобождены после отмены"
+
+
+def read_rss_mb(pid):
+    """Резидентная память процесса из /proc (только Linux)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+async def bench_startup(args):
+    """Холодный старт bot.py: время до первого обработанного апдейта и память в простое."""
+    import signal
+    import subprocess
+
+    from loadtest import BOT_SCRIPT, FakeServers, bot_env, serve
+
+    tmp = os.path.dirname(os.environ['BOT_DB_PATH'])
+    modes = [('байт-код скомпилирован', False), ('пустой кэш байт-кода', True)]
+    for title, cold_bytecode in modes:
+        first_update = []
+        rss = []
+        for run in range(args.runs):
+            workdir = tempfile.mkdtemp(dir=tmp)
+            servers = FakeServers()
+            server, server_task, url = await serve(servers)
+            env = bot_env(url, workdir)
+            if cold_bytecode:
+                # Как в образе без compileall: все модули компилируются при запуске
+                env['PYTHONPYCACHEPREFIX'] = tempfile.mkdtemp(dir=tmp)
+            # Апдейт ждёт в очереди getUpdates ещё до запуска процесса
+            replied = servers.deliver(1, 'message', '/start', 1)
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=env,
+                                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            first_update.append(await asyncio.wait_for(replied, 60) - start)
+            await asyncio.sleep(args.idle)
+            rss.append(read_rss_mb(process.pid))
+            process.send_signal(signal.SIGINT)
+            await process.wait()
+            server.should_exit = True
+            await server_task
+        print(f"{title}: до первого ответа {statistics.median(first_update):.2f} сек "
+              f"(min {min(first_update):.2f}, max {max(first_update):.2f}, {args.runs} запусков)"
+              + (f", RSS в простое {statistics.median(rss):.1f} МБ" if None not in rss else ""))
+
+
+async def bench_cluster(args):
+    """Масштабирование cluster.py: пропускная способность и задержки при 1…N воркерах на одном сценарии."""
+    from loadtest import run_loadtest
+
+    tmp = os.path.dirname(os.environ['BOT_DB_PATH'])
+    results = []
+    for workers in args.workers:
+        run_args = argparse.Namespace(users=args.users, rounds=args.rounds, seed=42, weather_delay=args.weather_delay,
+                                      food_delay=args.food_delay, step_timeout=60, startup_timeout=120,
+                                      workers=workers)
+        result = await run_loadtest(run_args, tempfile.mkdtemp(dir=tmp))
+        results.append(result)
+        print(f"воркеров {workers}: {result['updates_per_second']:.1f} апдейтов/сек, "
+              f"p50 {result['all']['p50_ms']:.0f} мс, p95 {result['all']['p95_ms']:.0f} мс, "
+              f"таймаутов {result['timeouts']}, запуск {result['startup_seconds']:.1f} сек")
+
+    base = results[0]['updates_per_second'] / args.workers[0]
+    print(f"\nПроцессоров на машине: {os.cpu_count()} — воркеры, фронт и нагрузка делят их между собой")
+    print(f"{'воркеров':>9}{'апдейтов/сек':>14}{'ускорение':>11}{'эффективность':>15}")
+    for workers, result in zip(args.workers, results):
+        speedup = result['updates_per_second'] / base
+        print(f"{workers:>9}{result['updates_per_second']:>14.1f}{speedup:>10.2f}x{speedup / workers * 100:>14.0f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные тесты бота")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    log_water = subparsers.add_parser("log_water", help="Одновременные /log_water от многих пользователей")
+    log_water.add_argument("--users", type=int, default=5000)
+    log_water.add_argument("--amount", type=int, default=250)
+    log_water.add_argument("--group-commit-rows", type=int, default=256, help="1 — коммит на каждую запись")
+    log_water.add_argument("--group-commit-ms", type=float, default=5)
+    log_water.set_defaults(func=bench_log_water)
+
+    daily_totals = subparsers.add_parser("daily_totals", help="Запросы дневных сумм на большой таблице логов")
+    daily_totals.add_argument("--rows", type=int, default=10_000_000)
+    daily_totals.add_argument("--users", type=int, default=50_000)
+    daily_totals.add_argument("--days", type=int, default=365)
+    daily_totals.add_argument("--lookups", type=int, default=20)
+    daily_totals.set_defaults(func=bench_daily_totals)
+
+    nutrition = subparsers.add_parser("nutrition", help="Кэш и офлайн-индекс поиска продуктов")
+    nutrition.add_argument("--lookups", type=int, default=2000)
+    nutrition.add_argument("--catalogue", type=int, default=500, help="Число редких продуктов")
+    nutrition.add_argument("--concurrency", type=int, default=20)
+    nutrition.add_argument("--remote-delay", type=float, default=0.2, help="Задержка stub OpenFoodFacts, сек")
+    nutrition.add_argument("--with-index", action="store_true", help="Построить офлайн-индекс для части продуктов")
+    nutrition.set_defaults(func=bench_nutrition)
+
+    stats_chart = subparsers.add_parser("stats_chart", help="Рендеринг графиков прогресса и их кэш")
+    stats_chart.add_argument("--users", type=int, default=50)
+    stats_chart.add_argument("--period", choices=["week", "month"], default="month")
+    stats_chart.set_defaults(func=bench_stats_chart)
+
+    reminders = subparsers.add_parser("reminders", help="Тик напоминаний о воде и темп отправки")
+    reminders.add_argument("--users", type=int, default=100_000)
+    reminders.add_argument("--rate", type=float, default=500, help="Сообщений в секунду")
+    reminders.add_argument("--interval", type=int, default=10, help="Секунд между тиками: ограничивает очередь")
+    reminders.add_argument("--retry-every", type=int, default=0, help="Каждое n-е сообщение получает RetryAfter")
+    reminders.set_defaults(func=bench_reminders)
+
+    goals = subparsers.add_parser("goals", help="Пересчёт норм воды по погоде")
+    goals.add_argument("--users", type=int, default=100_000)
+    goals.add_argument("--cities", type=int, default=200)
+    goals.add_argument("--concurrency", type=int, default=10)
+    goals.add_argument("--remote-delay", type=float, default=0.05, help="Задержка stub погоды, сек")
+    goals.set_defaults(func=bench_goals)
+
+    weather = subparsers.add_parser("weather", help="WeatherAPI на stub: кэш, объединение запросов, выключатель")
+    weather.add_argument("--concurrency", type=int, default=20)
+    weather.set_defaults(func=bench_weather)
+
+    calculator = subparsers.add_parser("calculator", help="Пакетные методы Calculator: совпадение и скорость")
+    calculator.add_argument("--users", type=int, default=1_000_000)
+    calculator.add_argument("--seed", type=int, default=42)
+    calculator.set_defaults(func=bench_calculator)
+
+    export = subparsers.add_parser("export", help="Потоковая выгрузка истории в CSV/Parquet")
+    export.add_argument("--rows", type=int, default=1_000_000)
+    export.add_argument("--users", type=int, default=1000)
+    export.add_argument("--days", type=int, default=90)
+    export.add_argument("--chunk-size", type=int, default=10000)
+    export.add_argument("--lookups", type=int, default=100)
+    export.add_argument("--formats", nargs="+", choices=["csv", "parquet"], default=["csv", "parquet"])
+    export.set_defaults(func=bench_export)
+
+    archive = subparsers.add_parser("archive", help="Архивация старых логов и incremental vacuum")
+    archive.add_argument("--rows", type=int, default=1_000_000)
+    archive.add_argument("--users", type=int, default=1000)
+    archive.add_argument("--days", type=int, default=365, help="За сколько дней сгенерировать логи")
+    archive.add_argument("--keep-days", type=int, default=30, help="Сколько дней оставить в основной базе")
+    archive.add_argument("--batch-size", type=int, default=5000)
+    archive.set_defaults(func=bench_archive)
+
+    fairness = subparsers.add_parser("fairness", help="Медленная пачка одного пользователя не блокирует других")
+    fairness.add_argument("--concurrency", type=int, default=4)
+    fairness.add_argument("--slow-delay", type=float, default=0.5, help="Длительность медленного хэндлера, сек")
+    fairness.set_defaults(func=bench_fairness)
+
+    startup = subparsers.add_parser("startup", help="Время до первого апдейта и RSS в простое для bot.py")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--idle", type=float, default=2.0, help="Сколько секунд простоя перед замером RSS")
+    startup.set_defaults(func=bench_startup)
+
+    cluster = subparsers.add_parser("cluster", help="Масштабирование cluster.py по числу воркеров")
+    cluster.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    cluster.add_argument("--users", type=int, default=200)
+    cluster.add_argument("--rounds", type=int, default=2)
+    cluster.add_argument("--weather-delay", type=float, default=0.05, help="Задержка stub погоды, сек")
+    cluster.add_argument("--food-delay", type=float, default=0.2, help="Задержка stub OpenFoodFacts, сек")
+    cluster.set_defaults(func=bench_cluster)
+
+    replay = subparsers.add_parser("replay", help="Проигрывание апдейтов через вебхук")
+    replay.add_argument("--updates", help="JSONL с записанными апдейтами; по умолчанию синтетический сценарий")
+    replay.add_argument("--users", type=int, default=200)
+    replay.add_argument("--concurrency", type=int, default=64, help="1 — последовательная обработка")
+    replay.add_argument("--remote-delay", type=float, default=0.2, help="Задержка stub OpenFoodFacts, сек")
+    replay.add_argument("--telegram-delay", type=float, default=0.0, help="Задержка stub Bot API, сек")
+    replay.add_argument("--profile-dir", help="Включить профилировщик и писать сюда стеки медленных апдейтов")
+    replay.add_argument("--slow-ms", type=float, default=200, help="Порог медленного апдейта для профилировщика")
+    replay.add_argument("--state", choices=["memory", "sqlite"], default="sqlite",
+                        help="Где хранить состояние диалогов и user_data")
+    replay.set_defaults(func=bench_replay)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault('BOT_DB_PATH', os.path.join(tmp, 'bench.db'))
+        result = args.func(args)
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,19 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, ContextTypes,
     ConversationHandler, filters, CallbackQueryHandler
 )
-from database import Database
+from async_database import AsyncDatabase
 from weather_api import WeatherAPI
 from nutrition_api import NutritionAPI
 from calculator import Calculator
+from update_processor import PerUserUpdateProcessor
+from persistence import SQLitePersistence, BOT_STATE_PATH
+from progress_charts import ChartRenderer, PERIODS, fill_days
+from reminders import ReminderScheduler
+from goals import schedule_goal_refresh
+from export import ExportService, EXPORT_FORMATS, parquet_available
+from archive import ARCHIVE_AFTER_DAYS, archive_path, schedule_archival
+from recent_foods import RecentFoods
+from metrics import TimedRequest, instrument, instrument_application, sampler, start_metrics_server
 
 load_dotenv()
 
@@ -27,10 +36,19 @@ logger = logging.getLogger(__name__)
     SET_CALORIE_GOAL
 ) = range(11)
 
-db = Database()
-weather_api = WeatherAPI()
-nutrition_api = NutritionAPI()
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '64'))
+
+DB_PATH = os.getenv('BOT_DB_PATH', 'bot_data.db')
+
+# Время вызовов базы и внешних API попадает в метрики хэндлера, из которого они сделаны
+db = instrument(AsyncDatabase(DB_PATH), 'db')
+weather_api = instrument(WeatherAPI(), 'weather')
+nutrition_api = instrument(NutritionAPI(), 'nutrition')
 calculator = Calculator()
+chart_renderer = ChartRenderer()
+reminders = ReminderScheduler(db)
+exporter = ExportService(DB_PATH, archive_path(DB_PATH))
+recent_foods = RecentFoods(db)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
@@ -43,6 +61,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🔹 /log_food - Записать приём пищи\n"
         "🔹 /log_workout - Записать тренировку\n"
         "🔹 /check_progress - Проверить прогресс\n"
+        "🔹 /stats_chart - График прогресса\n"
+        "🔹 /export - Выгрузить историю\n"
         "🔹 /reset_profile - Сбросить профиль"
     )
 
@@ -131,7 +151,7 @@ async def set_profile_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
     city = update.message.text.strip()
     context.user_data['profile']['city'] = city
     
-    temperature = weather_api.get_temperature(city)
+    temperature = await weather_api.get_temperature(city)
     context.user_data['profile']['temperature'] = temperature
     
     profile = context.user_data['profile']
@@ -151,7 +171,7 @@ async def set_profile_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['profile']['calorie_goal'] = calorie_goal
     context.user_data['profile']['water_goal'] = water_goal
     
-    db.save_user_profile(
+    await db.save_user_profile(
         profile['user_id'],
         profile['username'],
         profile['weight'],
@@ -183,7 +203,7 @@ async def set_profile_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Логирование воды: /log_water 500"""
     user_id = update.effective_user.id
-    profile = db.get_user_profile(user_id)
+    profile = await db.get_user_profile(user_id)
     
     if not profile:
         await update.message.reply_text("❌ Сначала настройте профиль командой /set_profile")
@@ -202,11 +222,10 @@ async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Укажите количество от 1 до 2000 мл")
             return
         
-        db.log_water(user_id, amount)
+        await db.log_water(user_id, amount)
         
-        profile = db.get_user_profile(user_id)
-        consumed = db.get_water_consumed_today(user_id)
-        goal = int(profile['water_goal'])
+        consumed = await db.get_water_consumed_today(user_id)
+        goal = int(profile.water_goal)
         remaining = max(0, goal - consumed)
         percent = min(100, round(consumed / goal * 100))
         
@@ -225,25 +244,65 @@ async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def log_food_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало логирования еды"""
     user_id = update.effective_user.id
-    profile = db.get_user_profile(user_id)
+    profile = await db.get_user_profile(user_id)
     
     if not profile:
         await update.message.reply_text("❌ Сначала настройте профиль командой /set_profile")
         return ConversationHandler.END
     
+    # Недавние и частые продукты пользователя — выбор в одно нажатие, без поиска
+    suggestions = await recent_foods.suggestions(user_id)
+    context.user_data['food_suggestions'] = suggestions
+    if not suggestions:
+        await update.message.reply_text(
+            "🍎 Введите название продукта (например: банан, куриная грудка, гречка):"
+        )
+        return FOOD_NAME
+    
+    keyboard = [
+        [
+            InlineKeyboardButton(f"{food['name']} · {food['calories_per_100g']:g} ккал",
+                                 callback_data=f'food_pick_{i}')
+            for i, food in enumerate(suggestions[row:row + 2], start=row)
+        ]
+        for row in range(0, len(suggestions), 2)
+    ]
     await update.message.reply_text(
-        "🍎 Введите название продукта (например: банан, куриная грудка, гречка):"
+        "🍎 Выберите продукт из недавних или введите название:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
     )
     return FOOD_NAME
 
+async def log_food_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выбор продукта кнопкой из недавних"""
+    query = update.callback_query
+    await query.answer()
+    
+    suggestions = context.user_data.get('food_suggestions') or []
+    index = int(query.data.replace('food_pick_', ''))
+    if index >= len(suggestions):
+        await query.edit_message_text("🍎 Введите название продукта:")
+        return FOOD_NAME
+    
+    product = suggestions[index]
+    context.user_data['food_product'] = product
+    await query.edit_message_text(
+        f"✅ {product['name']}\n"
+        f"🔥 Калорийность: {product['calories_per_100g']} ккал на 100г\n\n"
+        f"⚖️ Сколько грамм вы съели?"
+    )
+    return FOOD_WEIGHT
+
 async def log_food_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Поиск продукта в API"""
     product_name = update.message.text.strip()
     context.user_data['food_search'] = product_name
     
-    await update.message.reply_text("🔍 Ищу продукт...")
-    
-    product = nutrition_api.search_product(product_name)
+    # Продукт, который пользователь уже записывал, берётся из его истории без поиска
+    product = await recent_foods.match(update.effective_user.id, product_name)
+    if not product:
+        await update.message.reply_text("🔍 Ищу продукт...")
+        product = await nutrition_api.search_product(product_name)
     
     if not product:
         await update.message.reply_text(
@@ -277,14 +336,16 @@ async def log_food_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
         calories = round(product['calories_per_100g'] * weight / 100, 1)
         
         user_id = update.effective_user.id
-        db.log_food(user_id, product['name'], calories, weight)
+        await db.log_food(user_id, product['name'], calories, weight)
+        recent_foods.record(user_id, product['name'], product['calories_per_100g'])
         
-        profile = db.get_user_profile(user_id)
-        consumed = db.get_calories_consumed_today(user_id)
-        burned = db.get_calories_burned_today(user_id)
+        profile = await db.get_user_profile(user_id)
+        totals = await db.get_daily_totals(user_id)
+        consumed = totals['calories_consumed']
+        burned = totals['calories_burned']
         balance = consumed - burned
-        remaining = max(0, profile['calorie_goal'] - balance)
-        percent = min(100, round(balance / profile['calorie_goal'] * 100))
+        remaining = max(0, profile.calorie_goal - balance)
+        percent = min(100, round(balance / profile.calorie_goal * 100))
         
         await update.message.reply_text(
             f"✅ Записано: {product['name']} ({weight}г) — {calories} ккал\n\n"
@@ -304,7 +365,7 @@ async def log_food_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def log_workout_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало логирования тренировки"""
     user_id = update.effective_user.id
-    profile = db.get_user_profile(user_id)
+    profile = await db.get_user_profile(user_id)
     
     if not profile:
         await update.message.reply_text("❌ Сначала настройте профиль командой /set_profile")
@@ -350,22 +411,22 @@ async def log_workout_duration(update: Update, context: ContextTypes.DEFAULT_TYP
         
         workout_type = context.user_data.get('workout_type', 'тренировка')
         user_id = update.effective_user.id
-        profile = db.get_user_profile(user_id)
+        profile = await db.get_user_profile(user_id)
         
         if not profile:
             await update.message.reply_text("❌ Ошибка профиля. Настройте профиль заново.")
             return ConversationHandler.END
         
         calories_burned = calculator.estimate_calories_burned(
-            workout_type, duration, profile['weight']
+            workout_type, duration, profile.weight
         )
         water_needed = calculator.estimate_water_needed_for_workout(duration)
         
-        db.log_workout(user_id, workout_type, duration, calories_burned, water_needed)
+        await db.log_workout(user_id, workout_type, duration, calories_burned, water_needed)
         
-        profile = db.get_user_profile(user_id)
-        burned_today = db.get_calories_burned_today(user_id)
-        water_from_workouts = db.get_water_needed_from_workouts_today(user_id)
+        totals = await db.get_daily_totals(user_id)
+        burned_today = totals['calories_burned']
+        water_from_workouts = totals['water_from_workouts']
         
         await update.message.reply_text(
             f"✅ Записана тренировка: {workout_type} ({duration} мин)\n"
@@ -384,25 +445,24 @@ async def log_workout_duration(update: Update, context: ContextTypes.DEFAULT_TYP
 async def check_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Проверка прогресса по воде и калориям"""
     user_id = update.effective_user.id
-    profile = db.get_user_profile(user_id)
+    profile = await db.get_user_profile(user_id)
     
     if not profile:
         await update.message.reply_text("❌ Сначала настройте профиль командой /set_profile")
         return
     
-    profile = db.get_user_profile(user_id)
+    totals = await db.get_daily_totals(user_id)
+    water_consumed = totals['water_consumed']
+    water_from_workouts = totals['water_from_workouts']
+    calories_consumed = totals['calories_consumed']
+    calories_burned = totals['calories_burned']
     
-    water_consumed = db.get_water_consumed_today(user_id)
-    water_from_workouts = db.get_water_needed_from_workouts_today(user_id)
-    calories_consumed = db.get_calories_consumed_today(user_id)
-    calories_burned = db.get_calories_burned_today(user_id)
-    
-    water_goal = int(profile['water_goal'])
+    water_goal = int(profile.water_goal)
     water_remaining = max(0, water_goal - water_consumed)
     water_percent = min(100, round(water_consumed / water_goal * 100))
     water_bars = '💧' * (water_percent // 20) + '🥛' * (5 - water_percent // 20)
     
-    calorie_goal = profile['calorie_goal']
+    calorie_goal = profile.calorie_goal
     calorie_balance = calories_consumed - calories_burned
     calorie_remaining = max(0, calorie_goal - calorie_balance)
     calorie_percent = min(100, round(calorie_balance / calorie_goal * 100))
@@ -427,9 +487,61 @@ async def check_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(message)
 
+async def stats_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """График прогресса за неделю или месяц: /stats_chart [week|month]"""
+    user_id = update.effective_user.id
+    profile = await db.get_user_profile(user_id)
+    
+    if not profile:
+        await update.message.reply_text("❌ Сначала настройте профиль командой /set_profile")
+        return
+    
+    period = context.args[0].lower() if context.args else 'week'
+    if period not in PERIODS:
+        await update.message.reply_text("❌ Укажите период: /stats_chart week или /stats_chart month")
+        return
+    
+    days = PERIODS[period]
+    series = fill_days(await db.get_daily_series(user_id, days), days)
+    png = await chart_renderer.render(user_id, period, series, profile.water_goal, profile.calorie_goal)
+    
+    title = "неделю" if period == 'week' else "месяц"
+    await update.message.reply_photo(photo=png, caption=f"📈 Прогресс за {title}")
+
+async def toggle_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Включение и выключение напоминаний о воде: /reminders on|off"""
+    user_id = update.effective_user.id
+    choice = context.args[0].lower() if context.args else ''
+    if choice not in ('on', 'off'):
+        await update.message.reply_text("🔔 Укажите: /reminders on или /reminders off")
+        return
+    
+    await db.set_reminders_enabled(user_id, choice == 'on')
+    if choice == 'on':
+        await update.message.reply_text("🔔 Напоминания о воде включены")
+    else:
+        await update.message.reply_text("🔕 Напоминания о воде выключены")
+
+async def export_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка всей истории файлом: /export [csv|parquet]"""
+    user_id = update.effective_user.id
+    file_format = context.args[0].lower() if context.args else 'csv'
+    if file_format not in EXPORT_FORMATS:
+        await update.message.reply_text("❌ Укажите формат: /export csv или /export parquet")
+        return
+    if file_format == 'parquet' and not parquet_available():
+        await update.message.reply_text("❌ Parquet на этом сервере недоступен, используйте /export csv")
+        return
+    
+    if not exporter.start(context.bot, update.effective_chat.id, user_id, file_format):
+        await update.message.reply_text("⏳ Предыдущая выгрузка ещё готовится")
+        return
+    await update.message.reply_text("⏳ Готовлю выгрузку, пришлю файл, когда он будет готов")
+
 async def reset_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сброс профиля"""
     user_id = update.effective_user.id
+    await db.delete_user_profile(user_id)
     
     await update.message.reply_text(
         "🔄 Профиль сброшен. Настройте его заново командой /set_profile"
@@ -450,6 +562,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/log_food - Записать приём пищи (диалог)\n"
         "/log_workout - Записать тренировку (диалог)\n"
         "/check_progress - Проверить дневной прогресс\n"
+        "/stats_chart [week|month] - График за неделю или месяц\n"
+        "/reminders on|off - Напоминания о воде\n"
+        "/export [csv|parquet] - Выгрузить всю историю файлом\n"
         "/reset_profile - Сбросить настройки профиля\n"
         "/help - Показать эту справку\n\n"
         "💡 Советы:\n"
@@ -458,13 +573,45 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Для точности указывайте реальные данные в профиле"
     )
 
-def main():
-    """Запуск бота"""
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    if not token:
-        raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
-    
-    application = Application.builder().token(token).build()
+async def post_shutdown(application: Application):
+    """Закрывает соединения с базой и HTTP-клиенты при остановке бота"""
+    await weather_api.close()
+    await nutrition_api.close()
+    logger.info("Поиск продуктов: %s", nutrition_api.stats())
+    logger.info("Групповая запись логов: %s", db.write_metrics())
+    if application.persistence:
+        logger.info("Сохранение состояния диалогов: %s", application.persistence.stats())
+    logger.info("Напоминания: %s", reminders.stats())
+    logger.info("Выгрузки истории: %s", exporter.stats())
+    logger.info("Недавние продукты: %s", recent_foods.stats())
+    if sampler is not None:
+        logger.info("Профилей медленных апдейтов записано: %d", sampler.dumped)
+    await reminders.close()
+    await exporter.close()
+    chart_renderer.close()
+    await db.close()
+
+def build_application(token, base_url=None, concurrent_updates=BOT_CONCURRENT_UPDATES, state_path=BOT_STATE_PATH):
+    """Собирает Application со всеми хэндлерами. state_path=None — состояние диалогов только в памяти"""
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+        .request(TimedRequest(connection_pool_size=256))
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if state_path:
+        builder = builder.persistence(SQLitePersistence(state_path))
+    application = builder.build()
+    persistent = application.persistence is not None
+    if application.job_queue is not None:
+        if reminders.interval > 0:
+            reminders.schedule(application.job_queue)
+        schedule_goal_refresh(application.job_queue, db, weather_api)
+        if ARCHIVE_AFTER_DAYS > 0:
+            schedule_archival(application.job_queue, db)
     
     profile_conv = ConversationHandler(
         entry_points=[CommandHandler('set_profile', set_profile_start)],
@@ -476,16 +623,23 @@ def main():
             ACTIVITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_profile_activity)],
             CITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_profile_city)],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='profile_conv',
+        persistent=persistent
     )
     
     food_conv = ConversationHandler(
         entry_points=[CommandHandler('log_food', log_food_start)],
         states={
-            FOOD_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, log_food_name)],
+            FOOD_NAME: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, log_food_name),
+                CallbackQueryHandler(log_food_pick, pattern='^food_pick_'),
+            ],
             FOOD_WEIGHT: [MessageHandler(filters.TEXT & ~filters.COMMAND, log_food_weight)],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='food_conv',
+        persistent=persistent
     )
     
     workout_conv = ConversationHandler(
@@ -494,13 +648,18 @@ def main():
             WORKOUT_TYPE: [CallbackQueryHandler(log_workout_type, pattern='^workout_')],
             WORKOUT_DURATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, log_workout_duration)],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='workout_conv',
+        persistent=persistent
     )
     
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('help', help_command))
     application.add_handler(CommandHandler('log_water', log_water))
     application.add_handler(CommandHandler('check_progress', check_progress))
+    application.add_handler(CommandHandler('stats_chart', stats_chart))
+    application.add_handler(CommandHandler('reminders', toggle_reminders))
+    application.add_handler(CommandHandler('export', export_history))
     application.add_handler(CommandHandler('reset_profile', reset_profile))
     
     application.add_handler(profile_conv)
@@ -508,9 +667,24 @@ def main():
     application.add_handler(workout_conv)
     
     application.add_handler(CommandHandler('cancel', cancel))
+    instrument_application(application)
+    return application
+
+def main():
+    """Запуск бота"""
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
+    
+    application = build_application(token, base_url=os.getenv('TELEGRAM_API_URL'))
+    start_metrics_server()
     
     logger.info("Бот запущен...")
-    application.run_polling()
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        from webhook import run_webhook
+        run_webhook(application)
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
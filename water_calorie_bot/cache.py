@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class AsyncTTLCache:
+    """
+    Асинхронный кэш с TTL и ограничением размера.
+
+    Одновременные запросы одного ключа объединяются: fetch выполняется один раз,
+    остальные вызывающие ждут тот же результат. Ошибки и None не кэшируются.
+    """
+
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._on_fetched(key, done))
+        # shield: отмена одного из ожидающих не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    def _on_fetched(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self.set(key, task.result())
+
+    def stats(self):
+        total = self.hits + self.misses + self.coalesced
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / total if total else 0.0,
+            'size': len(self._entries),
+        }
+
+
+class CircuitOpenError(Exception):
+    """Внешний сервис временно считается недоступным"""
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель для внешнего API.
+
+    После failure_threshold ошибок подряд запросы не выполняются reset_timeout секунд,
+    затем пропускается один пробный запрос: успех замыкает цепь, ошибка снова размыкает.
+    Запросы выполняются внутри call(): исход фиксирует вызывающий (record_success/record_failure).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._outcomes = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._trial_in_progress:
+            self._trial_in_progress = True
+            return True
+        return False
+
+    @contextmanager
+    def call(self):
+        """
+        Запрос под выключателем; CircuitOpenError, если цепь разомкнута.
+
+        Если запрос прервался до record_success/record_failure, пробный запрос не остаётся
+        занятым навсегда: неожиданное исключение считается сбоем, отмена просто освобождает его.
+        """
+        if not self.allow():
+            raise CircuitOpenError("Сервис временно недоступен")
+        outcomes = self._outcomes
+        try:
+            yield
+        except Exception:
+            if self._outcomes == outcomes:
+                self.record_failure()
+            raise
+        finally:
+            if self._outcomes == outcomes:
+                self._trial_in_progress = False
+
+    def record_success(self):
+        self._outcomes += 1
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+
+    def record_failure(self):
+        self._outcomes += 1
+        self.failures += 1
+        self._trial_in_progress = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
@@ -1,4 +1,15 @@
 class Calculator:
+    WORKOUT_CALORIES_PER_MINUTE = {
+        'бег': 12,
+        'ходьба': 5,
+        'велосипед': 8,
+        'плавание': 10,
+        'йога': 4,
+        'силовая': 8,
+        'кардио': 10,
+        'танцы': 7
+    }
+    
     @staticmethod
     def calculate_bmr(weight, height, age, gender='male'):
         """
@@ -52,18 +63,7 @@ class Calculator:
         """
         Оценка сожжённых калорий за тренировку
         """
-        calories_per_minute = {
-            'бег': 12,
-            'ходьба': 5,
-            'велосипед': 8,
-            'плавание': 10,
-            'йога': 4,
-            'силовая': 8,
-            'кардио': 10,
-            'танцы': 7
-        }
-        
-        base_cals = calories_per_minute.get(workout_type.lower(), 6)
+        base_cals = Calculator.WORKOUT_CALORIES_PER_MINUTE.get(workout_type.lower(), 6)
         adjusted = base_cals * (weight / 70)
         
         return round(adjusted * duration_minutes)
@@ -73,4 +73,66 @@ class Calculator:
         """
         Расчёт дополнительной потребности в воде во время тренировки
         """
-        return (duration_minutes // 30) * 200 + 100
\ No newline at end of file
+        return (duration_minutes // 30) * 200 + 100
+    
+    # Пакетные версии: принимают столбцы (массивы NumPy или списки) и возвращают массивы.
+    # Результаты совпадают со скалярными методами, округление — банковское, как у round().
+    # NumPy импортируется при первом вызове: боту для ответов хватает скалярных методов
+    
+    @staticmethod
+    def _map_strings(values, func):
+        """Применяет func к каждому различному значению строкового столбца, а не к каждой строке"""
+        import numpy as np
+        
+        unique, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        return np.array([func(value) for value in unique.tolist()])[inverse]
+    
+    @staticmethod
+    def calculate_bmr_batch(weight, height, age, gender):
+        """Базовый метаболизм для массивов; gender — массив строк"""
+        import numpy as np
+        
+        male = Calculator._map_strings(gender, lambda value: value.lower() == 'male')
+        bmr = 10 * np.asarray(weight, dtype=float) + 6.25 * np.asarray(height, dtype=float) - 5 * np.asarray(age, dtype=float)
+        return bmr + np.where(male, 5, -161)
+    
+    @staticmethod
+    def calculate_calorie_goal_batch(bmr, activity_minutes):
+        """Дневная норма калорий для массивов"""
+        import numpy as np
+        
+        activity_minutes = np.asarray(activity_minutes, dtype=float)
+        activity_factor = np.select(
+            [activity_minutes < 30, activity_minutes < 60, activity_minutes < 90],
+            [1.2, 1.375, 1.55],
+            1.725
+        )
+        extra_calories = np.minimum(activity_minutes * 5, 400)
+        return np.round(np.asarray(bmr, dtype=float) * activity_factor + extra_calories).astype(np.int64)
+    
+    @staticmethod
+    def calculate_water_goal_batch(weight, activity_minutes, temperature=None):
+        """Дневная норма воды для массивов; неизвестная температура — NaN"""
+        import numpy as np
+        
+        weight = np.asarray(weight, dtype=float)
+        activity_water = (np.asarray(activity_minutes, dtype=float) // 30) * 250
+        weather_water = 0
+        if temperature is not None:
+            temperature = np.asarray(temperature, dtype=float)
+            with np.errstate(invalid='ignore'):
+                hot = temperature > 25
+            weather_water = np.where(hot, np.minimum(300 + (temperature - 25) * 20, 800), 0)
+        total = weight * 35 + activity_water + weather_water
+        return np.round(np.clip(total, 1500, 5000)).astype(np.int64)
+    
+    @staticmethod
+    def estimate_calories_burned_batch(workout_type, duration_minutes, weight):
+        """Сожжённые калории для массивов; workout_type — массив строк"""
+        import numpy as np
+        
+        base_cals = Calculator._map_strings(
+            workout_type, lambda value: float(Calculator.WORKOUT_CALORIES_PER_MINUTE.get(value.lower(), 6))
+        )
+        adjusted = base_cals * (np.asarray(weight, dtype=float) / 70)
+        return np.round(adjusted * np.asarray(duration_minutes, dtype=float)).astype(np.int64)
@@ -0,0 +1,320 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+
+import httpx
+
+from product_store import PRODUCT_INDEX_PATH
+from webhook import MAX_BODY_SIZE, WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL, WebhookApp
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', str(os.cpu_count() or 1)))
+CLUSTER_DATA_DIR = os.getenv('CLUSTER_DATA_DIR', '.')
+CLUSTER_WORKER_BASE_PORT = int(os.getenv('CLUSTER_WORKER_BASE_PORT', str(WEBHOOK_PORT + 1)))
+# Апдейтов в очереди одного шарда; сверх этого фронт отвечает 503 и Telegram повторит доставку позже
+CLUSTER_QUEUE_SIZE = int(os.getenv('CLUSTER_QUEUE_SIZE', '10000'))
+# Сколько раз повторять пересылку при ответе 5xx или неожиданной ошибке, прежде чем пропустить апдейт;
+# сетевые ошибки (воркер перезапускается) повторяются без ограничения
+CLUSTER_FORWARD_ATTEMPTS = int(os.getenv('CLUSTER_FORWARD_ATTEMPTS', '5'))
+CLUSTER_DRAIN_TIMEOUT = float(os.getenv('CLUSTER_DRAIN_TIMEOUT', '10'))
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+
+
+def update_user_id(update):
+    """id пользователя, от которого пришёл апдейт (message, callback_query и т.д.), или 0"""
+    for key, value in update.items():
+        if key != 'update_id' and isinstance(value, dict):
+            sender = value.get('from') or value.get('chat') or {}
+            return sender.get('id', 0)
+    return 0
+
+
+def shard_files(data_dir, shard):
+    """
+    Файлы шарда: у каждого воркера своя база, архив, состояние диалогов и кэш продуктов.
+    Офлайн-индекс продуктов общий: воркеры подключают его только для чтения
+    """
+    return {
+        'BOT_DB_PATH': os.path.join(data_dir, f'bot_data.shard{shard}.db'),
+        'BOT_ARCHIVE_PATH': os.path.join(data_dir, f'bot_archive.shard{shard}.db'),
+        'BOT_STATE_PATH': os.path.join(data_dir, f'bot_state.shard{shard}.db'),
+        'NUTRITION_DB_PATH': os.path.join(data_dir, f'nutrition_cache.shard{shard}.db'),
+        'PRODUCT_INDEX_PATH': os.path.abspath(PRODUCT_INDEX_PATH),
+    }
+
+
+def check_shard_count(data_dir, workers):
+    """Пользователь живёт в шарде user_id % workers, поэтому число воркеров у данных менять нельзя"""
+    path = os.path.join(data_dir, 'cluster.json')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            stored = json.load(f)['workers']
+        if stored != workers:
+            raise ValueError(f"Данные в {data_dir} разбиты на {stored} шардов, а запускается {workers} воркеров")
+    else:
+        os.makedirs(data_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'workers': workers}, f)
+
+
+class Worker:
+    """Процесс bot.py в режиме вебхука, обслуживающий один шард; перезапускается, если упал"""
+
+    def __init__(self, shard, workers, port, data_dir, secret):
+        self.shard = shard
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.restarts = 0
+        self._process = None
+        self._monitor = None
+        self._stopping = False
+        env = {
+            **os.environ,
+            **shard_files(data_dir, shard),
+            'BOT_MODE': 'webhook',
+            'WEBHOOK_HOST': '127.0.0.1',
+            'WEBHOOK_PORT': str(port),
+            'WEBHOOK_PATH': WEBHOOK_PATH,
+            'WEBHOOK_SECRET': secret,
+            # Вебхук в Telegram регистрирует фронт, а не воркеры
+            'WEBHOOK_URL': '',
+            # Лимит Telegram на рассылку общий для бота — делим его между воркерами
+            'REMINDER_RATE': str(float(os.getenv('REMINDER_RATE', '25')) / workers),
+        }
+        if os.getenv('METRICS_PORT', '0') != '0':
+            env['METRICS_PORT'] = str(int(os.environ['METRICS_PORT']) + shard)
+        self.env = env
+
+    async def start(self):
+        # Своя сессия: Ctrl+C получает только фронт и останавливает воркеры после того, как допишет очереди
+        self._process = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=self.env,
+                                                             start_new_session=True)
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        code = await self._process.wait()
+        if self._stopping:
+            return
+        self.restarts += 1
+        logger.error("Воркер %d завершился с кодом %s, перезапуск", self.shard, code)
+        await asyncio.sleep(1)
+        # Кластер могли остановить, пока ждали: новый процесс в своей сессии остался бы сиротой
+        if not self._stopping:
+            await self.start()
+
+    async def wait_ready(self, client, timeout=60):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            try:
+                response = await client.get(f"{self.url}/healthcheck")
+                if response.status_code == 200 and response.json()['status'] == 'ok':
+                    return
+            except httpx.TransportError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError(f"Воркер {self.shard} не запустился за {timeout} сек")
+            await asyncio.sleep(0.1)
+
+    async def stop(self):
+        self._stopping = True
+        if self._monitor is not None and self._monitor is not asyncio.current_task():
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        if self._process is not None and self._process.returncode is None:
+            self._process.send_signal(signal.SIGINT)
+            await self._process.wait()
+
+
+class ClusterFront:
+    """
+    ASGI-фронт для горизонтального масштабирования.
+
+    Принимает вебхуки Telegram и отправляет каждый апдейт воркеру user_id % workers.
+    У каждого шарда своя очередь и один пересылающий таск, поэтому апдейты пользователя
+    доходят до воркера в порядке поступления, а состояние диалогов и база пользователя
+    живут в одном процессе. Фронт отвечает Telegram сразу после постановки в очередь.
+    """
+
+    def __init__(self, workers=CLUSTER_WORKERS, data_dir=CLUSTER_DATA_DIR, base_port=CLUSTER_WORKER_BASE_PORT,
+                 path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, webhook_url=WEBHOOK_URL):
+        self.path = path
+        self.secret_token = secret_token
+        self.webhook_url = webhook_url
+        self.data_dir = data_dir
+        # Секрет между фронтом и воркерами: воркеры слушают localhost, но чужие апдейты не примут
+        self._internal_secret = secrets.token_hex(16)
+        self.workers = [Worker(shard, workers, base_port + shard, data_dir, self._internal_secret)
+                        for shard in range(workers)]
+        self._queues = []
+        self._forwarders = []
+        self._client = None
+        self.received = 0
+        self.forwarded = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.overloaded = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    try:
+                        await self.startup()
+                    except Exception as e:
+                        logger.exception("Ошибка запуска кластера")
+                        await self.shutdown()
+                        await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                        return
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await self.shutdown()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def startup(self):
+        check_shard_count(self.data_dir, len(self.workers))
+        self._client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_keepalive_connections=len(self.workers)))
+        for worker in self.workers:
+            await worker.start()
+        await asyncio.gather(*(worker.wait_ready(self._client) for worker in self.workers))
+        self._queues = [asyncio.Queue(CLUSTER_QUEUE_SIZE) for _ in self.workers]
+        self._forwarders = [asyncio.create_task(self._forward(worker, queue))
+                            for worker, queue in zip(self.workers, self._queues)]
+        if self.webhook_url:
+            from telegram import Bot, Update
+
+            async with Bot(os.environ['TELEGRAM_BOT_TOKEN'], base_url=os.getenv('TELEGRAM_API_URL') or
+                           'https://api.telegram.org/bot') as bot:
+                await bot.set_webhook(self.webhook_url + self.path, secret_token=self.secret_token or None,
+                                      allowed_updates=Update.ALL_TYPES)
+        logger.info("Кластер из %d воркеров принимает апдейты на %s", len(self.workers), self.path)
+
+    async def shutdown(self):
+        # Сначала дописываем очереди, потом останавливаем воркеры
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), CLUSTER_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Не доставлено воркерам апдейтов: %d", sum(queue.qsize() for queue in self._queues))
+        for task in self._forwarders:
+            task.cancel()
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def _forward(self, worker, queue):
+        while True:
+            body = await queue.get()
+            try:
+                if await self._deliver(worker, body):
+                    self.forwarded += 1
+                else:
+                    self.dropped += 1
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, worker, body):
+        """Доставляет апдейт воркеру; False, если пришлось пропустить после повторяющихся ошибок"""
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self._internal_secret, 'Content-Type': 'application/json'}
+        delay = 0.1
+        errors = 0
+        while True:
+            try:
+                response = await self._client.post(f"{worker.url}{self.path}", content=body, headers=headers)
+                if response.status_code < 500:
+                    return True
+                # Апдейт, на котором воркер падает, иначе держал бы очередь шарда и фронт отвечал бы 503 вечно
+                logger.warning("Воркер %d ответил %d на апдейт", worker.shard, response.status_code)
+                errors += 1
+            except httpx.TransportError:
+                # Воркер перезапускается: держим очередь, чтобы не нарушить порядок апдейтов
+                pass
+            except Exception:
+                logger.exception("Ошибка пересылки апдейта воркеру %d", worker.shard)
+                errors += 1
+            if errors >= CLUSTER_FORWARD_ATTEMPTS:
+                logger.error("Апдейт для воркера %d пропущен после %d ошибок: %.200s",
+                             worker.shard, errors, body.decode('utf-8', 'replace'))
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    async def _http(self, scope, receive, send):
+        if scope['method'] == 'GET' and scope['path'] == '/healthcheck':
+            await WebhookApp._respond(send, 200, await self.stats())
+            return
+        if scope['method'] != 'POST' or scope['path'] != self.path:
+            await WebhookApp._respond(send, 404, {'error': 'not found'})
+            return
+
+        headers = dict(scope['headers'])
+        token = headers.get(b'x-telegram-bot-api-secret-token', b'').decode('latin-1')
+        if self.secret_token and not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            await WebhookApp._respond(send, 403, {'error': 'forbidden'})
+            return
+
+        body = await WebhookApp._read_body(receive)
+        if body is None:
+            return
+        if len(body) > MAX_BODY_SIZE:
+            await WebhookApp._respond(send, 413, {'error': 'payload too large'})
+            return
+        try:
+            user_id = int(update_user_id(json.loads(body)))
+        except (TypeError, ValueError, AttributeError):
+            await WebhookApp._respond(send, 400, {'error': 'bad update'})
+            return
+        queue = self._queues[user_id % len(self._queues)]
+        try:
+            queue.put_nowait(body)
+        except asyncio.QueueFull:
+            self.overloaded += 1
+            await WebhookApp._respond(send, 503, {'error': 'overloaded'})
+            return
+        self.received += 1
+        await WebhookApp._respond(send, 200, {'ok': True})
+
+    async def stats(self):
+        async def worker_stats(worker):
+            try:
+                return (await self._client.get(f"{worker.url}/healthcheck")).json()
+            except (httpx.TransportError, ValueError):
+                return {'status': 'down'}
+
+        workers = await asyncio.gather(*(worker_stats(worker) for worker in self.workers))
+        return {
+            'status': 'ok' if all(w['status'] == 'ok' for w in workers) else 'degraded',
+            'received': self.received,
+            'forwarded': self.forwarded,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'overloaded': self.overloaded,
+            'queued': [queue.qsize() for queue in self._queues],
+            'workers': [{'shard': w.shard, 'restarts': w.restarts, **s} for w, s in zip(self.workers, workers)],
+        }
+
+
+def main():
+    """Запуск кластера: фронт на WEBHOOK_HOST:WEBHOOK_PORT и CLUSTER_WORKERS воркеров"""
+    import uvicorn
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    uvicorn.run(ClusterFront(), host=WEBHOOK_HOST, port=WEBHOOK_PORT, log_level='warning', lifespan='on')
+
+
+if __name__ == '__main__':
+    main()
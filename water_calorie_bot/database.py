@@ -1,15 +1,74 @@
 import sqlite3
-from datetime import date, datetime
+import threading
+from datetime import date, datetime, timedelta, timezone
 import json
+from collections import defaultdict
+
+from profile_cache import ProfileCache, UserProfile
+
+LOG_INSERTS = {
+    'water': 'INSERT INTO water_logs (user_id, amount_ml, timestamp) VALUES (?, ?, ?)',
+    'food': '''
+        INSERT INTO food_logs (user_id, product_name, calories, weight_grams, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+    ''',
+    'workout': '''
+        INSERT INTO workout_logs (user_id, workout_type, duration_minutes, calories_burned, water_needed_ml, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+}
+
+LOG_TABLES = ('water_logs', 'food_logs', 'workout_logs')
+
+# Таблицы архива повторяют столбцы логов: INSERT ... SELECT * переносит строки вместе с id
+ARCHIVE_TABLES = {
+    'water_logs': 'id INTEGER PRIMARY KEY, user_id INTEGER, amount_ml INTEGER, timestamp TIMESTAMP',
+    'food_logs': '''
+        id INTEGER PRIMARY KEY, user_id INTEGER, product_name TEXT, calories REAL, weight_grams REAL,
+        timestamp TIMESTAMP
+    ''',
+    'workout_logs': '''
+        id INTEGER PRIMARY KEY, user_id INTEGER, workout_type TEXT, duration_minutes INTEGER,
+        calories_burned REAL, water_needed_ml INTEGER, timestamp TIMESTAMP
+    ''',
+}
 
 class Database:
+    """
+    Хранилище бота на SQLite в режиме WAL.
+
+    У каждого потока своё соединение, поэтому чтения из разных потоков идут параллельно
+    и не делят один курсор. Записи сериализуются общей блокировкой.
+    """
+
     def __init__(self, db_name="bot_data.db"):
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        self.db_name = db_name
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.profiles = ProfileCache()
         self._create_tables()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=30)
+            # Действует только для новой базы; существующую переводит enable_incremental_vacuum()
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Записи логов группируются в пакеты, поэтому fsync на каждый коммит обходится дёшево
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
     
     def _create_tables(self):
-        self.cursor.execute('''
+        cursor = self.conn.cursor()
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
                 username TEXT,
@@ -25,7 +84,7 @@ class Database:
             )
         ''')
         
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS water_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
@@ -35,7 +94,7 @@ class Database:
             )
         ''')
         
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS food_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
@@ -47,7 +106,7 @@ class Database:
             )
         ''')
         
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS workout_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
@@ -60,83 +119,377 @@ class Database:
             )
         ''')
         
+        for table in LOG_TABLES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user_ts ON {table}(user_id, timestamp)')
+        
+        # Дневные суммы по пользователю, обновляются в той же транзакции, что и логи
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_totals (
+                user_id INTEGER,
+                day TEXT,
+                water_ml INTEGER DEFAULT 0,
+                calories_consumed REAL DEFAULT 0,
+                calories_burned REAL DEFAULT 0,
+                water_from_workouts INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Настройки и время последнего напоминания о воде
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reminders (
+                user_id INTEGER PRIMARY KEY,
+                enabled INTEGER DEFAULT 1,
+                last_sent TIMESTAMP
+            )
+        ''')
+        
+        # Служебные значения, например граница архивации логов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        
         self.conn.commit()
+        
+        # База создана до появления daily_totals — заполняем суммы из логов
+        has_totals = cursor.execute('SELECT 1 FROM daily_totals LIMIT 1').fetchone()
+        has_logs = cursor.execute('''
+            SELECT EXISTS (SELECT 1 FROM water_logs) OR EXISTS (SELECT 1 FROM food_logs)
+                OR EXISTS (SELECT 1 FROM workout_logs)
+        ''').fetchone()[0]
+        if not has_totals and has_logs:
+            self.rebuild_daily_totals()
+    
+    @staticmethod
+    def _today_range():
+        """
+        Границы текущих суток [начало, конец) в формате CURRENT_TIMESTAMP (UTC).
+        Сравнение timestamp с диапазоном, в отличие от date(timestamp), использует индекс.
+        """
+        today = datetime.now(timezone.utc).date()
+        return f"{today} 00:00:00", f"{today + timedelta(days=1)} 00:00:00"
+    
+    @staticmethod
+    def _now():
+        """Текущее время в формате CURRENT_TIMESTAMP (UTC)"""
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    
+    def write_log_batch(self, entries):
+        """
+        Записывает пакет логов одной транзакцией (group commit).
+        entries — список (вид, параметры), вид: 'water', 'food' или 'workout';
+        последний параметр — timestamp. Дневные суммы обновляются в той же транзакции.
+        """
+        rows_by_kind = defaultdict(list)
+        totals = defaultdict(lambda: [0, 0, 0, 0])
+        for kind, params in entries:
+            rows_by_kind[kind].append(params)
+            day_totals = totals[(params[0], params[-1][:10])]
+            if kind == 'water':
+                day_totals[0] += params[1]
+            elif kind == 'food':
+                day_totals[1] += params[2]
+            else:
+                day_totals[2] += params[3]
+                day_totals[3] += params[4]
+        
+        with self._write_lock, self.conn as conn:
+            for kind, rows in rows_by_kind.items():
+                conn.executemany(LOG_INSERTS[kind], rows)
+            conn.executemany('''
+                INSERT INTO daily_totals (user_id, day, water_ml, calories_consumed, calories_burned, water_from_workouts)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, day) DO UPDATE SET
+                    water_ml = water_ml + excluded.water_ml,
+                    calories_consumed = calories_consumed + excluded.calories_consumed,
+                    calories_burned = calories_burned + excluded.calories_burned,
+                    water_from_workouts = water_from_workouts + excluded.water_from_workouts
+            ''', [(user_id, day, *values) for (user_id, day), values in totals.items()])
     
     def save_user_profile(self, user_id, username, weight, height, age, gender, activity_minutes, city, calorie_goal, water_goal):
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO users 
-            (user_id, username, weight, height, age, gender, activity_minutes, city, calorie_goal, water_goal)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, weight, height, age, gender, activity_minutes, city, calorie_goal, water_goal))
-        self.conn.commit()
+        with self._write_lock, self.conn:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO users 
+                (user_id, username, weight, height, age, gender, activity_minutes, city, calorie_goal, water_goal)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, username, weight, height, age, gender, activity_minutes, city, calorie_goal, water_goal))
+        self.profiles.invalidate(user_id)
     
-    def get_user_profile(self, user_id):
-        self.cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        row = self.cursor.fetchone()
+    def delete_user_profile(self, user_id):
+        with self._write_lock, self.conn:
+            self.conn.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+        self.profiles.invalidate(user_id)
+    
+    def _load_user_profile(self, user_id):
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(UserProfile.COLUMNS)} FROM users WHERE user_id = ?", (user_id,)
+        )
+        row = cursor.fetchone()
         if row:
-            return {
-                'user_id': row[0],
-                'username': row[1],
-                'weight': row[2],
-                'height': row[3],
-                'age': row[4],
-                'gender': row[5],
-                'activity_minutes': row[6],
-                'city': row[7],
-                'calorie_goal': row[8],
-                'water_goal': row[9]
-            }
+            return UserProfile(*row)
         return None
     
+    def get_user_profile(self, user_id):
+        return self.profiles.get_or_load(user_id, self._load_user_profile)
+    
     def log_water(self, user_id, amount_ml):
-        self.cursor.execute('INSERT INTO water_logs (user_id, amount_ml) VALUES (?, ?)', (user_id, amount_ml))
-        self.conn.commit()
+        self.write_log_batch([('water', (user_id, amount_ml, self._now()))])
     
     def get_water_consumed_today(self, user_id):
-        self.cursor.execute('''
-            SELECT SUM(amount_ml) FROM water_logs 
-            WHERE user_id = ? AND date(timestamp) = date('now')
-        ''', (user_id,))
-        result = self.cursor.fetchone()[0]
-        return result if result else 0
+        return self.get_daily_totals(user_id)['water_consumed']
     
     def log_food(self, user_id, product_name, calories, weight_grams):
-        self.cursor.execute('''
-            INSERT INTO food_logs (user_id, product_name, calories, weight_grams)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, product_name, calories, weight_grams))
-        self.conn.commit()
+        self.write_log_batch([('food', (user_id, product_name, calories, weight_grams, self._now()))])
     
     def get_calories_consumed_today(self, user_id):
-        self.cursor.execute('''
-            SELECT SUM(calories) FROM food_logs 
-            WHERE user_id = ? AND date(timestamp) = date('now')
-        ''', (user_id,))
-        result = self.cursor.fetchone()[0]
-        return result if result else 0
+        return self.get_daily_totals(user_id)['calories_consumed']
     
     def log_workout(self, user_id, workout_type, duration_minutes, calories_burned, water_needed_ml):
-        self.cursor.execute('''
-            INSERT INTO workout_logs (user_id, workout_type, duration_minutes, calories_burned, water_needed_ml)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, workout_type, duration_minutes, calories_burned, water_needed_ml))
-        self.conn.commit()
+        self.write_log_batch([('workout', (user_id, workout_type, duration_minutes, calories_burned,
+                                           water_needed_ml, self._now()))])
     
     def get_calories_burned_today(self, user_id):
-        self.cursor.execute('''
-            SELECT SUM(calories_burned) FROM workout_logs 
-            WHERE user_id = ? AND date(timestamp) = date('now')
-        ''', (user_id,))
-        result = self.cursor.fetchone()[0]
-        return result if result else 0
+        return self.get_daily_totals(user_id)['calories_burned']
     
     def get_water_needed_from_workouts_today(self, user_id):
-        self.cursor.execute('''
-            SELECT SUM(water_needed_ml) FROM workout_logs 
-            WHERE user_id = ? AND date(timestamp) = date('now')
-        ''', (user_id,))
-        result = self.cursor.fetchone()[0]
-        return result if result else 0
+        return self.get_daily_totals(user_id)['water_from_workouts']
+    
+    def get_daily_totals(self, user_id):
+        """Все дневные суммы пользователя одним поиском по первичному ключу"""
+        cursor = self.conn.execute('''
+            SELECT water_ml, calories_consumed, calories_burned, water_from_workouts
+            FROM daily_totals WHERE user_id = ? AND day = ?
+        ''', (user_id, self._today_range()[0][:10]))
+        row = cursor.fetchone() or (0, 0, 0, 0)
+        return {
+            'water_consumed': row[0],
+            'calories_consumed': row[1],
+            'calories_burned': row[2],
+            'water_from_workouts': row[3]
+        }
+    
+    def get_daily_series(self, user_id, days):
+        """Дневные суммы за последние days суток (включая сегодня), только дни с записями"""
+        today = datetime.now(timezone.utc).date()
+        cursor = self.conn.execute('''
+            SELECT day, water_ml, calories_consumed, calories_burned, water_from_workouts
+            FROM daily_totals WHERE user_id = ? AND day >= ? ORDER BY day
+        ''', (user_id, (today - timedelta(days=days - 1)).isoformat()))
+        return cursor.fetchall()
+    
+    def get_recent_foods(self, user_id, limit):
+        """Последние limit записей о еде пользователя, от новых к старым"""
+        cursor = self.conn.execute('''
+            SELECT product_name, calories, weight_grams, timestamp
+            FROM food_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?
+        ''', (user_id, limit))
+        return cursor.fetchall()
+    
+    def get_daily_totals_from_logs(self, user_id):
+        """Дневные суммы, посчитанные по сырым логам (для сверки с daily_totals)"""
+        start, end = self._today_range()
+        cursor = self.conn.execute('''
+            SELECT
+                (SELECT COALESCE(SUM(amount_ml), 0) FROM water_logs
+                 WHERE user_id = :user_id AND timestamp >= :start AND timestamp < :end),
+                (SELECT COALESCE(SUM(calories), 0) FROM food_logs
+                 WHERE user_id = :user_id AND timestamp >= :start AND timestamp < :end),
+                (SELECT COALESCE(SUM(calories_burned), 0) FROM workout_logs
+                 WHERE user_id = :user_id AND timestamp >= :start AND timestamp < :end),
+                (SELECT COALESCE(SUM(water_needed_ml), 0) FROM workout_logs
+                 WHERE user_id = :user_id AND timestamp >= :start AND timestamp < :end)
+        ''', {'user_id': user_id, 'start': start, 'end': end})
+        row = cursor.fetchone()
+        return {
+            'water_consumed': row[0],
+            'calories_consumed': row[1],
+            'calories_burned': row[2],
+            'water_from_workouts': row[3]
+        }
+    
+    def get_users_behind_water(self, fraction, sent_before, limit):
+        """
+        Одним запросом: пользователи, выпившие меньше fraction дневной нормы воды (с учётом тренировок),
+        у которых не выключены напоминания и последнее было раньше sent_before.
+        Сначала самые отстающие. Возвращает (user_id, выпито, норма).
+        """
+        cursor = self.conn.execute('''
+            SELECT u.user_id, COALESCE(t.water_ml, 0) AS consumed,
+                   u.water_goal + COALESCE(t.water_from_workouts, 0) AS target
+            FROM users u
+            LEFT JOIN daily_totals t ON t.user_id = u.user_id AND t.day = :day
+            LEFT JOIN reminders r ON r.user_id = u.user_id
+            WHERE u.water_goal > 0
+              AND COALESCE(r.enabled, 1) = 1
+              AND (r.last_sent IS NULL OR r.last_sent < :sent_before)
+              AND COALESCE(t.water_ml, 0) < (u.water_goal + COALESCE(t.water_from_workouts, 0)) * :fraction
+            ORDER BY consumed * 1.0 / target
+            LIMIT :limit
+        ''', {'day': self._today_range()[0][:10], 'sent_before': sent_before, 'fraction': fraction, 'limit': limit})
+        return cursor.fetchall()
+    
+    def mark_reminders_sent(self, user_ids, timestamp):
+        with self._write_lock, self.conn as conn:
+            conn.executemany('''
+                INSERT INTO reminders (user_id, last_sent) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET last_sent = excluded.last_sent
+            ''', [(user_id, timestamp) for user_id in user_ids])
+    
+    def set_reminders_enabled(self, user_id, enabled):
+        with self._write_lock, self.conn as conn:
+            conn.execute('''
+                INSERT INTO reminders (user_id, enabled) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET enabled = excluded.enabled
+            ''', (user_id, int(enabled)))
+    
+    def get_goal_inputs(self):
+        """Данные для пересчёта нормы воды: (user_id, вес, активность, город, текущая норма)"""
+        return self.conn.execute(
+            'SELECT user_id, weight, activity_minutes, city, water_goal FROM users'
+        ).fetchall()
+    
+    def update_water_goals(self, goals, batch_size=5000):
+        """Массовое обновление норм воды: goals — список (user_id, норма)"""
+        for offset in range(0, len(goals), batch_size):
+            batch = goals[offset:offset + batch_size]
+            with self._write_lock, self.conn as conn:
+                conn.executemany('UPDATE users SET water_goal = ? WHERE user_id = ?',
+                                 [(water_goal, user_id) for user_id, water_goal in batch])
+            for user_id, _ in batch:
+                self.profiles.invalidate(user_id)
+    
+    def get_archived_before(self):
+        """День (YYYY-MM-DD), раньше которого сырые логи перенесены в архив, или None"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'archived_before'").fetchone()
+        return row[0] if row else None
+    
+    def _attach_archive(self, archive_name):
+        conn = self.conn
+        if not any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list')):
+            conn.execute('ATTACH DATABASE ? AS archive', (archive_name,))
+            conn.execute('PRAGMA archive.journal_mode=WAL')
+        for table, columns in ARCHIVE_TABLES.items():
+            conn.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} ({columns})')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS archive.idx_{table}_user_ts ON {table}(user_id, timestamp)')
+        conn.commit()
+    
+    def archive_logs(self, archive_name, before, batch_size=5000):
+        """
+        Переносит логи старше дня before (YYYY-MM-DD) в архивную базу archive_name.
+
+        Строки идут пакетами по batch_size в порядке id, каждый пакет — отдельная транзакция,
+        так что запись логов ботом ждёт не дольше одного пакета. Дневные суммы за эти дни
+        остаются в daily_totals. INSERT OR IGNORE делает повторный запуск после сбоя безопасным.
+        Возвращает число перенесённых строк по таблицам.
+        """
+        self._attach_archive(archive_name)
+        conn = self.conn
+        cutoff = f"{before} 00:00:00"
+        moved = {}
+        for table in LOG_TABLES:
+            moved[table] = 0
+            last_id = 0
+            while True:
+                with self._write_lock, conn:
+                    ids = conn.execute(
+                        f'SELECT id FROM main.{table} WHERE id > ? AND timestamp < ? ORDER BY id LIMIT ?',
+                        (last_id, cutoff, batch_size)
+                    ).fetchall()
+                    if not ids:
+                        break
+                    # Все подходящие строки с id в (last_id, upper] — ровно выбранный пакет
+                    params = (last_id, ids[-1][0], cutoff)
+                    conn.execute(f'''
+                        INSERT OR IGNORE INTO archive.{table}
+                        SELECT * FROM main.{table} WHERE id > ? AND id <= ? AND timestamp < ?
+                    ''', params)
+                    conn.execute(f'DELETE FROM main.{table} WHERE id > ? AND id <= ? AND timestamp < ?', params)
+                moved[table] += len(ids)
+                last_id = ids[-1][0]
+        
+        with self._write_lock, conn:
+            conn.execute('''
+                INSERT INTO meta (key, value) VALUES ('archived_before', ?)
+                ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+            ''', (before,))
+        return moved
+    
+    def enable_incremental_vacuum(self):
+        """Однократный перевод существующей базы в auto_vacuum=INCREMENTAL (полный VACUUM)"""
+        with self._write_lock:
+            self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            self.conn.execute('VACUUM')
+    
+    def incremental_vacuum(self, pages_per_step=1000):
+        """
+        Возвращает свободные страницы файлу шагами по pages_per_step, отпуская блокировку записи
+        между шагами. Возвращает число освобождённых страниц или None, если auto_vacuum не INCREMENTAL.
+        """
+        conn = self.conn
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return None
+        freed = 0
+        while True:
+            with self._write_lock:
+                free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if not free:
+                    break
+                # execute() делает у PRAGMA без результата один шаг (одну страницу), executescript — до конца
+                conn.executescript(f'PRAGMA incremental_vacuum({int(pages_per_step)});')
+                freed += free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return freed
+    
+    def rebuild_daily_totals(self):
+        """
+        Пересчитывает daily_totals из сырых логов. Дни, логи которых уже в архиве, не трогаются.
+        Возвращает (число строк после пересчёта, число расходившихся строк).
+        """
+        since = self.get_archived_before() or ''
+        with self._write_lock, self.conn as conn:
+            conn.execute('DROP TABLE IF EXISTS temp.daily_totals_fresh')
+            conn.execute('CREATE TEMP TABLE daily_totals_fresh AS SELECT * FROM daily_totals WHERE 0')
+            conn.execute('''
+                INSERT INTO daily_totals_fresh
+                    (user_id, day, water_ml, calories_consumed, calories_burned, water_from_workouts)
+                SELECT user_id, day, SUM(water_ml), SUM(calories_consumed), SUM(calories_burned), SUM(water_from_workouts)
+                FROM (
+                    SELECT user_id, date(timestamp) AS day, amount_ml AS water_ml, 0 AS calories_consumed,
+                           0 AS calories_burned, 0 AS water_from_workouts
+                    FROM water_logs WHERE timestamp >= :since
+                    UNION ALL
+                    SELECT user_id, date(timestamp), 0, calories, 0, 0 FROM food_logs WHERE timestamp >= :since
+                    UNION ALL
+                    SELECT user_id, date(timestamp), 0, 0, calories_burned, water_needed_ml FROM workout_logs
+                    WHERE timestamp >= :since
+                )
+                GROUP BY user_id, day
+            ''', {'since': since})
+            mismatched = conn.execute('''
+                SELECT COUNT(*) FROM (
+                    SELECT user_id, day, water_ml, ROUND(calories_consumed, 3), ROUND(calories_burned, 3),
+                           water_from_workouts
+                    FROM daily_totals WHERE day >= :since
+                    EXCEPT
+                    SELECT user_id, day, water_ml, ROUND(calories_consumed, 3), ROUND(calories_burned, 3),
+                           water_from_workouts
+                    FROM daily_totals_fresh
+                )
+            ''', {'since': since}).fetchone()[0]
+            missing = conn.execute('''
+                SELECT COUNT(*) FROM daily_totals_fresh f
+                WHERE NOT EXISTS (SELECT 1 FROM daily_totals d WHERE d.user_id = f.user_id AND d.day = f.day)
+            ''').fetchone()[0]
+            conn.execute('DELETE FROM daily_totals WHERE day >= ?', (since,))
+            conn.execute('INSERT INTO daily_totals SELECT * FROM daily_totals_fresh')
+            total = conn.execute('SELECT COUNT(*) FROM daily_totals').fetchone()[0]
+            conn.execute('DROP TABLE temp.daily_totals_fresh')
+        return total, mismatched + missing
     
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
\ No newline at end of file
@@ -0,0 +1,188 @@
+import asyncio
+import csv
+import gzip
+import importlib.util
+import logging
+import os
+import sqlite3
+import tempfile
+
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '10000'))
+EXPORT_CONCURRENCY = int(os.getenv('EXPORT_CONCURRENCY', '2'))
+# Bot API принимает документы до 50 МБ
+EXPORT_MAX_FILE_SIZE = 50 * 1024 * 1024
+EXPORT_FORMATS = {'csv': '.csv.gz', 'parquet': '.parquet'}
+
+EXPORT_COLUMNS = ('kind', 'user_id', 'timestamp', 'amount_ml', 'product_name', 'calories', 'weight_grams',
+                  'workout_type', 'duration_minutes', 'calories_burned', 'water_needed_ml')
+
+# Все три таблицы логов приводятся к общему набору столбцов EXPORT_COLUMNS
+EXPORT_SELECTS = {
+    'water_logs': "'water', user_id, timestamp, amount_ml, NULL, NULL, NULL, NULL, NULL, NULL, NULL",
+    'food_logs': "'food', user_id, timestamp, NULL, product_name, calories, weight_grams, NULL, NULL, NULL, NULL",
+    'workout_logs': '''
+        'workout', user_id, timestamp, NULL, NULL, NULL, NULL, workout_type, duration_minutes,
+        calories_burned, water_needed_ml
+    ''',
+}
+
+
+def _export_query(schema, table, user_id):
+    conditions = ['user_id = :user_id'] if user_id is not None else []
+    if schema == 'archive':
+        # Строка, которую архивация уже скопировала, но ещё не удалила из основной базы, выгружается один раз
+        conditions.append(f'NOT EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = t.id)')
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'SELECT {EXPORT_SELECTS[table]} FROM {schema}.{table} t {where} ORDER BY user_id, timestamp'
+
+
+def iter_log_chunks(db_name, user_id=None, chunk_size=EXPORT_CHUNK_SIZE, archive_name=None):
+    """
+    Логи одного или всех пользователей порциями по chunk_size строк.
+
+    Таблицы читаются по индексу (user_id, timestamp) через fetchmany, так что память не зависит
+    от объёма истории. Всё читается в одной транзакции — согласованный снимок при WAL.
+    Если есть архив archive_name, его строки (они старше) идут перед строками основной базы.
+    """
+    conn = sqlite3.connect(f'file:{db_name}?mode=ro', uri=True, timeout=30)
+    try:
+        schemas = ['main']
+        if archive_name and os.path.exists(archive_name):
+            conn.execute('ATTACH DATABASE ? AS archive', (f'file:{archive_name}?mode=ro',))
+            schemas.insert(0, 'archive')
+        conn.execute('BEGIN')
+        # Снимок основной базы берётся раньше архива: перенесённая между ними строка видна хотя бы в одном
+        conn.execute('SELECT COUNT(*) FROM main.sqlite_master').fetchone()
+        if 'archive' in schemas:
+            conn.execute('SELECT COUNT(*) FROM archive.sqlite_master').fetchone()
+        for table in EXPORT_SELECTS:
+            for schema in schemas:
+                cursor = conn.execute(_export_query(schema, table, user_id), {'user_id': user_id})
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+
+def parquet_available():
+    """pyarrow ставится отдельно (requirements-parquet.txt); проверка без импорта"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def write_csv(chunks, path):
+    """CSV со сжатием gzip"""
+    count = 0
+    with gzip.open(path, 'wt', compresslevel=6, encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def write_parquet(chunks, path):
+    """Parquet со сжатием zstd, каждая порция — отдельная row group"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('kind', pa.string()), ('user_id', pa.int64()), ('timestamp', pa.string()),
+        ('amount_ml', pa.int64()), ('product_name', pa.string()), ('calories', pa.float64()),
+        ('weight_grams', pa.float64()), ('workout_type', pa.string()), ('duration_minutes', pa.int64()),
+        ('calories_burned', pa.float64()), ('water_needed_ml', pa.int64()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            count += len(rows)
+    return count
+
+
+def export_logs(db_name, path, user_id=None, file_format='csv', chunk_size=EXPORT_CHUNK_SIZE, archive_name=None):
+    """Выгружает логи в path (csv → .csv.gz, parquet → .parquet). Возвращает число строк"""
+    chunks = iter_log_chunks(db_name, user_id, chunk_size, archive_name)
+    if file_format == 'parquet':
+        return write_parquet(chunks, path)
+    return write_csv(chunks, path)
+
+
+class ExportService:
+    """
+    Выгрузка истории по команде /export в фоне.
+
+    Хэндлер только ставит задачу и сразу возвращается, поэтому долгая выгрузка не держит
+    очередь апдейтов пользователя. Файл пишется в отдельном потоке во временный каталог,
+    одновременно выполняется не больше concurrency выгрузок, на пользователя — одна.
+    """
+
+    def __init__(self, db_name, archive_name=None, concurrency=EXPORT_CONCURRENCY, chunk_size=EXPORT_CHUNK_SIZE):
+        self.db_name = db_name
+        self.archive_name = archive_name
+        self.chunk_size = chunk_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = {}
+        self.completed = 0
+        self.failed = 0
+
+    def start(self, bot, chat_id, user_id, file_format='csv'):
+        """Запускает выгрузку; False, если у пользователя уже идёт другая"""
+        task = self._tasks.get(user_id)
+        if task is not None and not task.done():
+            return False
+        task = asyncio.create_task(self._run(bot, chat_id, user_id, file_format))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+        return True
+
+    async def _run(self, bot, chat_id, user_id, file_format):
+        suffix = EXPORT_FORMATS[file_format]
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            async with self._semaphore:
+                count = await asyncio.to_thread(export_logs, self.db_name, path, user_id, file_format,
+                                                self.chunk_size, self.archive_name)
+            if count == 0:
+                await bot.send_message(chat_id=chat_id, text="📭 Записей для выгрузки пока нет")
+            elif os.path.getsize(path) > EXPORT_MAX_FILE_SIZE:
+                await bot.send_message(chat_id=chat_id, text="❌ Файл выгрузки больше 50 МБ, Telegram его не примет")
+            else:
+                with open(path, 'rb') as f:
+                    await bot.send_document(chat_id=chat_id, document=f, filename=f'history{suffix}',
+                                            caption=f"📦 Записей: {count}")
+            self.completed += 1
+        except TelegramError as e:
+            self.failed += 1
+            logger.warning("Не удалось отправить выгрузку истории %s: %s", user_id, e)
+        except Exception:
+            # Ошибка SQLite, диска или pyarrow (ArrowInvalid и т.п.): задачу никто не ждёт, поэтому логируем здесь
+            self.failed += 1
+            logger.exception("Не удалось выгрузить историю %s", user_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text="❌ Не удалось подготовить выгрузку, попробуйте позже")
+            except TelegramError as e:
+                logger.warning("Не удалось сообщить об ошибке выгрузки %s: %s", user_id, e)
+        finally:
+            os.remove(path)
+
+    def stats(self):
+        return {'running': len(self._tasks), 'completed': self.completed, 'failed': self.failed}
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
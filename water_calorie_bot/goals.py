@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import time as day_time
+
+from calculator import Calculator
+from weather_api import WeatherAPI
+
+logger = logging.getLogger(__name__)
+
+GOAL_REFRESH_CONCURRENCY = int(os.getenv('GOAL_REFRESH_CONCURRENCY', '10'))
+GOAL_REFRESH_HOUR = int(os.getenv('GOAL_REFRESH_HOUR', '4'))
+
+
+async def fetch_city_temperatures(weather_api, cities, concurrency=GOAL_REFRESH_CONCURRENCY):
+    """Температура для каждого города, не больше concurrency запросов одновременно"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(city):
+        async with semaphore:
+            return city, await weather_api.get_temperature(city)
+
+    return dict(await asyncio.gather(*(fetch(city) for city in cities)))
+
+
+async def recalculate_water_goals(db, weather_api, concurrency=GOAL_REFRESH_CONCURRENCY):
+    """
+    Пересчитывает норму воды всех пользователей по текущей погоде.
+
+    Погода запрашивается один раз на город (без учёта регистра и пробелов), поэтому число
+    запросов зависит от числа городов, а не пользователей. Если температуру получить
+    не удалось, нормы жителей этого города не меняются. В базу пишутся только изменившиеся нормы.
+    """
+    import numpy as np
+
+    start = time.perf_counter()
+    users_by_city = defaultdict(list)
+    for row in await db.get_goal_inputs():
+        users_by_city[WeatherAPI.normalize_city(row[3] or '')].append(row)
+    users_by_city.pop('', None)
+
+    # Для запроса берём написание города первого пользователя
+    temperatures = await fetch_city_temperatures(
+        weather_api, [users[0][3] for users in users_by_city.values()], concurrency
+    )
+
+    rows = []
+    skipped = 0
+    for users in users_by_city.values():
+        temperature = temperatures.get(users[0][3])
+        if temperature is None:
+            skipped += len(users)
+            continue
+        rows.extend((user_id, weight, activity_minutes or 0, temperature, water_goal)
+                    for user_id, weight, activity_minutes, _, water_goal in users)
+
+    changed = []
+    if rows:
+        user_ids, weights, activity, temperature, current = (np.array(column) for column in zip(*rows))
+        new_goals = Calculator.calculate_water_goal_batch(weights, activity, temperature)
+        mask = new_goals != current
+        changed = list(zip(user_ids[mask].tolist(), new_goals[mask].tolist()))
+    await db.update_water_goals(changed)
+
+    stats = {
+        'users': sum(len(users) for users in users_by_city.values()),
+        'cities': len(users_by_city),
+        'cities_without_weather': sum(1 for t in temperatures.values() if t is None),
+        'updated': len(changed),
+        'skipped': skipped,
+        'seconds': time.perf_counter() - start,
+    }
+    logger.info("Пересчёт норм воды: %s", stats)
+    return stats
+
+
+def schedule_goal_refresh(job_queue, db, weather_api, hour=GOAL_REFRESH_HOUR):
+    """Ежедневный пересчёт норм воды в hour:00 UTC"""
+    async def job(context):
+        await recalculate_water_goals(db, weather_api)
+
+    return job_queue.run_daily(job, time=day_time(hour=hour), name='water_goal_refresh')
@@ -0,0 +1,443 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import signal
+import socket
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+import httpx
+
+FOODS = ['банан', 'яблоко', 'гречка', 'куриная грудка', 'овсянка', 'творог', 'рис', 'хлеб', 'молоко', 'яйцо']
+WORKOUTS = ['бег', 'ходьба', 'велосипед', 'плавание', 'йога', 'силовая', 'кардио']
+CITIES = ['Moscow', 'London', 'Paris', 'Berlin', 'Tokyo']
+
+BOT_INFO = {'id': 1, 'is_bot': True, 'first_name': 'loadtest', 'username': 'loadtest_bot'}
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+CLUSTER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cluster.py')
+
+
+def flow_steps(flow, rng, foods=None):
+    """
+    Шаги сценария: (хэндлер, тип апдейта, текст или callback_data, сколько вызовов Bot API ждать).
+    Шаг считается выполненным, когда бот сделал для чата столько вызовов (ответ, правка, answerCallbackQuery).
+    foods — продукты, которые пользователь уже записывал (дополняется по ходу сценария).
+    """
+    foods = set() if foods is None else foods
+    if flow == 'set_profile':
+        return [
+            ('set_profile_start', 'message', '/set_profile', 1),
+            ('set_profile_weight', 'message', str(rng.randint(50, 100)), 1),
+            ('set_profile_height', 'message', str(rng.randint(150, 200)), 1),
+            ('set_profile_age', 'message', str(rng.randint(18, 70)), 1),
+            ('set_profile_gender', 'callback', rng.choice(['gender_male', 'gender_female']), 2),
+            ('set_profile_activity', 'message', str(rng.choice([0, 30, 60])), 1),
+            ('set_profile_city', 'message', rng.choice(CITIES), 1),
+        ]
+    if flow == 'log_water':
+        return [('log_water', 'message', f'/log_water {rng.choice([200, 250, 300, 500])}', 1)]
+    if flow == 'log_food':
+        if foods and rng.random() < 0.5:
+            # Кнопка недавнего продукта: answerCallbackQuery и правка сообщения
+            choose = ('log_food_pick', 'callback', 'food_pick_0', 2)
+        else:
+            food = rng.choice(FOODS)
+            # «Ищу продукт...» и результат поиска; уже записанный продукт берётся из истории одним ответом
+            choose = ('log_food_name', 'message', food, 1 if food in foods else 2)
+            foods.add(food)
+        return [
+            ('log_food_start', 'message', '/log_food', 1),
+            choose,
+            ('log_food_weight', 'message', str(rng.randint(50, 400)), 1),
+        ]
+    if flow == 'log_workout':
+        return [
+            ('log_workout_start', 'message', '/log_workout', 1),
+            ('log_workout_type', 'callback', f'workout_{rng.choice(WORKOUTS)}', 2),
+            ('log_workout_duration', 'message', str(rng.randint(10, 90)), 1),
+        ]
+    if flow == 'check_progress':
+        return [('check_progress', 'message', '/check_progress', 1)]
+    raise ValueError(flow)
+
+
+def user_script(user_id, rounds, seed):
+    """Профиль, затем rounds кругов остальных сценариев в случайном, но воспроизводимом порядке"""
+    rng = random.Random(seed * 1_000_003 + user_id)
+    steps = flow_steps('set_profile', rng)
+    foods = set()
+    for _ in range(rounds):
+        flows = ['log_water', 'log_water', 'log_food', 'log_workout', 'check_progress']
+        rng.shuffle(flows)
+        for flow in flows:
+            steps.extend(flow_steps(flow, rng, foods))
+    return steps
+
+
+class FakeServers:
+    """
+    ASGI-приложение вместо внешних сервисов: Bot API (/bot<token>/<метод>), OpenWeatherMap (/weather)
+    и OpenFoodFacts (/off). Апдейты отдаются боту через getUpdates (long polling), вызовы бота
+    засчитываются шагу сценария соответствующего чата.
+    """
+
+    def __init__(self, weather_delay=0.0, food_delay=0.0):
+        self.weather_delay = weather_delay
+        self.food_delay = food_delay
+        self._updates = []
+        self._update_id = 0
+        self._message_id = 0
+        self._new_updates = asyncio.Event()
+        self._waiters = {}
+        self.polling = asyncio.Event()
+        self.api_calls = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        path = scope['path']
+        query = {k: v[0] for k, v in parse_qs(scope['query_string'].decode()).items()}
+        if path.startswith('/weather'):
+            await asyncio.sleep(self.weather_delay)
+            payload = {'main': {'temp': 15 + len(query.get('q', '')) % 15}}
+        elif path.startswith('/off'):
+            await asyncio.sleep(self.food_delay)
+            terms = query.get('search_terms', '')
+            payload = {'products': [{'product_name': terms.capitalize(),
+                                     'nutriments': {'energy-kcal_100g': 50 + len(terms) * 10}}]}
+        else:
+            headers = dict(scope['headers'])
+            params = self._parse_params(body, headers.get(b'content-type', b'').decode())
+            payload = {'ok': True, 'result': await self._bot_api(path.rsplit('/', 1)[-1], params)}
+        response = json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(response)).encode())]})
+        await send({'type': 'http.response.body', 'body': response})
+
+    @staticmethod
+    def _parse_params(body, content_type):
+        if content_type.startswith('multipart/form-data'):
+            # sendPhoto/sendDocument: нужен только chat_id
+            match = re.search(rb'name="chat_id"\r\n\r\n(-?\d+)', body)
+            return {'chat_id': match.group(1).decode()} if match else {}
+        return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+    async def _bot_api(self, method, params):
+        if method == 'getMe':
+            return BOT_INFO
+        if method == 'getUpdates':
+            return await self._get_updates(int(params.get('offset', 0)), float(params.get('timeout', 0)))
+        self.api_calls += 1
+        if method == 'answerCallbackQuery':
+            self._count_call(int(params['callback_query_id'].split(':')[0]))
+            return True
+        if 'chat_id' not in params:
+            return True
+        chat_id = int(params['chat_id'])
+        self._count_call(chat_id)
+        self._message_id += 1
+        return {'message_id': self._message_id, 'date': int(time.time()), 'from': BOT_INFO,
+                'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+
+    async def _get_updates(self, offset, timeout):
+        self.polling.set()
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:100]
+
+    def _count_call(self, chat_id):
+        waiter = self._waiters.get(chat_id)
+        if waiter is None:
+            return
+        waiter[0] -= 1
+        if waiter[0] <= 0 and not waiter[1].done():
+            waiter[1].set_result(time.perf_counter())
+
+    def make_update(self, user_id, kind, value):
+        """Апдейт Telegram от пользователя: сообщение или нажатие inline-кнопки"""
+        self._update_id += 1
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+        chat = {'id': user_id, 'type': 'private'}
+        if kind == 'callback':
+            self._message_id += 1
+            return {'update_id': self._update_id, 'callback_query': {
+                'id': f'{user_id}:{self._update_id}', 'from': user, 'chat_instance': str(user_id), 'data': value,
+                'message': {'message_id': self._message_id, 'date': int(time.time()), 'chat': chat, 'from': BOT_INFO,
+                            'text': '…'},
+            }}
+        message = {'message_id': self._update_id, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': value}
+        if value.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(value.split()[0])}]
+        return {'update_id': self._update_id, 'message': message}
+
+    def expect(self, user_id, expected_calls):
+        """future, который завершится после expected_calls вызовов бота для чата пользователя"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[user_id] = [expected_calls, future]
+        return future
+
+    def deliver(self, user_id, kind, value, expected_calls):
+        """Ставит апдейт пользователя в очередь getUpdates; future завершится после expected_calls вызовов бота"""
+        future = self.expect(user_id, expected_calls)
+        self._updates.append(self.make_update(user_id, kind, value))
+        self._new_updates.set()
+        return future
+
+
+def percentiles(values):
+    values = sorted(values)
+
+    def q(p):
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    return {'count': len(values), 'p50_ms': q(0.5), 'p95_ms': q(0.95), 'p99_ms': q(0.99),
+            'max_ms': values[-1] * 1000, 'mean_ms': statistics.mean(values) * 1000}
+
+
+def db_stats(paths):
+    """
+    Логический размер баз (страницы с учётом WAL, не зависит от чекпойнтов) и число строк в таблицах.
+    В режиме кластера баз несколько — по одной на шард, размеры и строки суммируются.
+    """
+    size = 0
+    rows = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        size += conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+        for table in ('users', 'water_logs', 'food_logs', 'workout_logs', 'daily_totals'):
+            rows[table] = rows.get(table, 0) + conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        conn.close()
+    return size, rows
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def serve(app):
+    """Запускает ASGI-приложение под uvicorn на свободном порту. Возвращает (сервер, задача, URL)"""
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    server = uvicorn.Server(uvicorn.Config(app, log_level='warning', lifespan='off', timeout_keep_alive=60))
+    return server, asyncio.create_task(server.serve(sockets=[sock])), url
+
+
+def bot_env(url, workdir):
+    """Окружение bot.py: все внешние сервисы — FakeServers по url, файлы — в workdir"""
+    return {
+        **os.environ,
+        'TELEGRAM_BOT_TOKEN': '1:loadtest',
+        'TELEGRAM_API_URL': f'{url}/bot',
+        'OPENWEATHER_API_KEY': 'loadtest',
+        'OPENWEATHER_BASE_URL': f'{url}/weather',
+        'OPENFOODFACTS_URL': f'{url}/off',
+        'BOT_DB_PATH': os.path.join(workdir, 'bot.db'),
+        'BOT_STATE_PATH': os.path.join(workdir, 'state.db'),
+        'BOT_ARCHIVE_PATH': os.path.join(workdir, 'archive.db'),
+        'NUTRITION_DB_PATH': os.path.join(workdir, 'nutrition.db'),
+        'BOT_MODE': 'polling',
+        # Фоновые задачи не должны попадать в замеры
+        'REMINDER_INTERVAL': '0',
+        'ARCHIVE_AFTER_DAYS': '0',
+    }
+
+
+def cluster_env(url, workdir, workers):
+    """Окружение cluster.py: фронт на свободном порту, базы шардов — в workdir"""
+    port = free_port()
+    return {
+        **bot_env(url, workdir),
+        'CLUSTER_WORKERS': str(workers),
+        'CLUSTER_DATA_DIR': workdir,
+        'CLUSTER_WORKER_BASE_PORT': str(free_port()),
+        'WEBHOOK_HOST': '127.0.0.1',
+        'WEBHOOK_PORT': str(port),
+        'WEBHOOK_PATH': '/telegram',
+        'WEBHOOK_SECRET': 'loadtest',
+        'WEBHOOK_URL': '',
+    }
+
+
+async def wait_healthy(client, url, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get(f'{url}/healthcheck')
+            if response.status_code == 200 and response.json()['status'] == 'ok':
+                return True
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def run_loadtest(args, workdir):
+    servers = FakeServers(args.weather_delay, args.food_delay)
+    server, server_task, url = await serve(servers)
+    workers = getattr(args, 'workers', 0)
+    if workers:
+        # Кластер: апдейты идут вебхуком во фронт, фронт раскладывает их по воркерам
+        env = cluster_env(url, workdir, workers)
+        script = CLUSTER_SCRIPT
+        front = f"http://127.0.0.1:{env['WEBHOOK_PORT']}"
+        db_paths = [os.path.join(workdir, f'bot_data.shard{shard}.db') for shard in range(workers)]
+    else:
+        env = bot_env(url, workdir)
+        script = BOT_SCRIPT
+        db_paths = [os.path.join(workdir, 'bot.db')]
+    client = httpx.AsyncClient(timeout=args.step_timeout, limits=httpx.Limits(max_connections=64))
+    log_path = os.path.join(workdir, 'bot.log')
+    start = time.perf_counter()
+    with open(log_path, 'wb') as log:
+        process = await asyncio.create_subprocess_exec(sys.executable, script, env=env, stdout=log, stderr=log)
+        if workers:
+            ready = await wait_healthy(client, front, args.startup_timeout)
+        else:
+            try:
+                await asyncio.wait_for(servers.polling.wait(), args.startup_timeout)
+                ready = True
+            except asyncio.TimeoutError:
+                ready = False
+        if not ready:
+            process.kill()
+            await process.wait()
+            raise RuntimeError(f"Бот не начал принимать апдейты, см. {log_path}")
+        startup = time.perf_counter() - start
+        size_before, _ = db_stats(db_paths)
+
+        latencies = {}
+        timeouts = 0
+
+        async def send_update(user_id, kind, value, calls):
+            if not workers:
+                return servers.deliver(user_id, kind, value, calls)
+            future = servers.expect(user_id, calls)
+            response = await client.post(f"{front}/telegram", json=servers.make_update(user_id, kind, value),
+                                         headers={'X-Telegram-Bot-Api-Secret-Token': env['WEBHOOK_SECRET']})
+            response.raise_for_status()
+            return future
+
+        async def run_user(user_id):
+            nonlocal timeouts
+            for handler, kind, value, calls in user_script(user_id, args.rounds, args.seed):
+                sent = time.perf_counter()
+                future = await send_update(user_id, kind, value, calls)
+                try:
+                    done = await asyncio.wait_for(future, args.step_timeout)
+                except asyncio.TimeoutError:
+                    timeouts += 1
+                    continue
+                latencies.setdefault(handler, []).append(done - sent)
+
+        load_start = time.perf_counter()
+        await asyncio.gather(*(run_user(user_id) for user_id in range(1, args.users + 1)))
+        elapsed = time.perf_counter() - load_start
+
+        process.send_signal(signal.SIGINT)
+        await process.wait()
+
+    await client.aclose()
+    server.should_exit = True
+    await server_task
+    size_after, rows = db_stats(db_paths)
+    steps = sum(len(values) for values in latencies.values())
+    return {
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        # Бот и нагрузка делят процессоры машины — сравнивать имеет смысл прогоны на одинаковом окружении
+        'environment': {'python': sys.version.split()[0], 'cpus': os.cpu_count()},
+        'workers': workers,
+        'startup_seconds': startup,
+        'elapsed_seconds': elapsed,
+        'updates': steps,
+        'timeouts': timeouts,
+        'updates_per_second': steps / elapsed,
+        'bot_api_calls': servers.api_calls,
+        'all': percentiles([v for values in latencies.values() for v in values]),
+        'handlers': {handler: percentiles(values) for handler, values in sorted(latencies.items())},
+        'db': {'size_before': size_before, 'size_after': size_after, 'growth_bytes': size_after - size_before,
+               'rows': rows},
+        'exit_code': process.returncode,
+    }
+
+
+def print_report(result, previous=None):
+    def delta(value, old):
+        return f" ({(value - old) / old * 100:+.0f}%)" if old else ''
+
+    prev_handlers = (previous or {}).get('handlers', {})
+    mode = f"кластера из {result['workers']} воркеров" if result.get('workers') else "бота"
+    print(f"Запуск {mode} до приёма апдейтов: {result['startup_seconds']:.2f} сек")
+    print(f"{result['updates']} апдейтов от {result['config']['users']} пользователей за "
+          f"{result['elapsed_seconds']:.2f} сек: {result['updates_per_second']:.1f} в сек"
+          f"{delta(result['updates_per_second'], (previous or {}).get('updates_per_second'))}, "
+          f"таймаутов {result['timeouts']}")
+    print(f"{'хэндлер':<22}{'n':>6}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for handler, stats in [*result['handlers'].items(), ('всего', result['all'])]:
+        old = prev_handlers.get(handler) if handler != 'всего' else (previous or {}).get('all')
+        print(f"{handler:<22}{stats['count']:>6}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+              f"{delta(stats['p95_ms'], old['p95_ms']) if old else ''}")
+    db = result['db']
+    logs = sum(db['rows'].get(t, 0) for t in ('water_logs', 'food_logs', 'workout_logs'))
+    print(f"База: {db['size_before'] / 1024:.0f} → {db['size_after'] / 1024:.0f} КБ "
+          f"(+{db['growth_bytes'] / 1024:.0f} КБ, {db['growth_bytes'] / max(logs, 1):.0f} байт на запись лога), "
+          f"строк: {db['rows']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальными Bot API, погодой и OpenFoodFacts")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3, help="Кругов сценариев на пользователя после профиля")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--weather-delay", type=float, default=0.05, help="Задержка stub погоды, сек")
+    parser.add_argument("--food-delay", type=float, default=0.2, help="Задержка stub OpenFoodFacts, сек")
+    parser.add_argument("--step-timeout", type=float, default=30)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Запустить cluster.py с этим числом воркеров; 0 — один bot.py с опросом getUpdates")
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона: показать изменения")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        result = asyncio.run(run_loadtest(args, workdir))
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_report(result, previous)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from archive import ARCHIVE_AFTER_DAYS, archive_old_logs, archive_path
+from async_database import AsyncDatabase
+from database import Database
+from export import export_logs
+from goals import recalculate_water_goals
+from product_store import PRODUCT_INDEX_PATH, ProductStore
+from weather_api import WeatherAPI
+
+load_dotenv()
+
+
+def rebuild_totals(args):
+    """Пересчёт daily_totals из сырых логов со сверкой"""
+    db = Database(args.db)
+    total, mismatched = db.rebuild_daily_totals()
+    print(f"Пересчитано строк daily_totals: {total}, расходилось с логами: {mismatched}")
+    db.close()
+
+
+def build_food_index(args):
+    """Офлайн-индекс продуктов из дампа OpenFoodFacts"""
+    store = ProductStore(args.nutrition_db, index_path=args.nutrition_db)
+    count = store.build_index(args.dump)
+    print(f"Проиндексировано продуктов: {count}")
+
+
+def recalculate_goals(args):
+    """Пересчёт норм воды всех пользователей по текущей погоде"""
+    async def run():
+        db = AsyncDatabase(args.db)
+        weather_api = WeatherAPI()
+        try:
+            return await recalculate_water_goals(db, weather_api, args.concurrency)
+        finally:
+            await weather_api.close()
+            await db.close()
+
+    stats = asyncio.run(run())
+    print(f"Пользователей: {stats['users']}, городов: {stats['cities']} "
+          f"(без погоды: {stats['cities_without_weather']}), обновлено норм: {stats['updated']}, "
+          f"пропущено: {stats['skipped']}, за {stats['seconds']:.2f} сек")
+
+
+def archive(args):
+    """Перенос старых логов в архивную базу и возврат места файлу"""
+    if args.enable_incremental_vacuum:
+        Database(args.db).enable_incremental_vacuum()
+        print("База переведена в auto_vacuum=INCREMENTAL")
+
+    async def run():
+        db = AsyncDatabase(args.db)
+        try:
+            return await archive_old_logs(db, args.days, args.batch_size)
+        finally:
+            await db.close()
+
+    stats = asyncio.run(run())
+    print(f"В архив {archive_path(args.db)} перенесено логов старше {stats['before']}: {stats['moved']} "
+          f"(вода {stats['water_logs']}, еда {stats['food_logs']}, тренировки {stats['workout_logs']}), "
+          f"освобождено страниц: {stats['freed_pages']}, за {stats['seconds']:.2f} сек")
+
+
+def export(args):
+    """Потоковая выгрузка логов одного или всех пользователей в CSV (gzip) или Parquet"""
+    file_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    count = export_logs(args.db, args.output, args.user_id, file_format, args.chunk_size, archive_path(args.db))
+    print(f"Выгружено записей: {count} в {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды бота")
+    parser.add_argument("--db", default=os.getenv('BOT_DB_PATH', 'bot_data.db'), help="Путь к базе бота")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-totals", help="Пересчитать дневные суммы из логов")
+    rebuild.set_defaults(func=rebuild_totals)
+
+    food_index = subparsers.add_parser("build-food-index", help="Построить офлайн-индекс продуктов из дампа")
+    food_index.add_argument("dump", help="openfoodfacts-products.jsonl[.gz] или en.openfoodfacts.org.products.csv[.gz]")
+    food_index.add_argument("--nutrition-db", default=PRODUCT_INDEX_PATH,
+                            help="Файл индекса (PRODUCT_INDEX_PATH, иначе NUTRITION_DB_PATH); в кластере он общий для воркеров")
+    food_index.set_defaults(func=build_food_index)
+
+    goals = subparsers.add_parser("recalculate-goals", help="Пересчитать нормы воды по текущей погоде")
+    goals.add_argument("--concurrency", type=int, default=10, help="Одновременных запросов погоды")
+    goals.set_defaults(func=recalculate_goals)
+
+    archive_parser = subparsers.add_parser("archive", help="Перенести старые логи в архивную базу")
+    archive_parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS or 90,
+                                help="Сколько дней логи остаются в основной базе")
+    archive_parser.add_argument("--batch-size", type=int, default=5000, help="Строк в одной транзакции")
+    archive_parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                                help="Сначала перевести базу в auto_vacuum=INCREMENTAL (полный VACUUM)")
+    archive_parser.set_defaults(func=archive)
+
+    export_parser = subparsers.add_parser("export", help="Выгрузить логи в CSV (gzip) или Parquet")
+    export_parser.add_argument("output", help="Файл выгрузки, например history.csv.gz или history.parquet")
+    export_parser.add_argument("--user-id", type=int, help="Только этот пользователь (по умолчанию все)")
+    export_parser.add_argument("--format", choices=["csv", "parquet"], help="По умолчанию — по расширению файла")
+    export_parser.add_argument("--chunk-size", type=int, default=10000, help="Строк за одно чтение")
+    export_parser.set_defaults(func=export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
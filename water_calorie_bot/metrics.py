@@ -0,0 +1,211 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from prometheus_client import Counter as PromCounter, Histogram, start_http_server
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Порт /metrics для Prometheus (слушает только localhost); 0 — не поднимать
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+SLOW_UPDATE_MS = float(os.getenv('SLOW_UPDATE_MS', '1000'))
+# Каталог для стеков медленных апдейтов; пусто — сэмплирующий профилировщик выключен
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Время обработки апдейта хэндлером', ['handler'],
+                            buckets=BUCKETS)
+HANDLER_ERRORS = PromCounter('bot_handler_errors_total', 'Исключения в хэндлерах', ['handler'])
+SLOW_UPDATES = PromCounter('bot_slow_updates_total', 'Апдейты дольше SLOW_UPDATE_MS', ['handler'])
+COMPONENT_SECONDS = Histogram('bot_component_seconds', 'Время во внешних вызовах по хэндлерам',
+                              ['handler', 'component'], buckets=BUCKETS)
+
+# Разбивка времени текущего хэндлера по компонентам; вне хэндлера (напоминания, JobQueue) — None
+_breakdown = contextvars.ContextVar('breakdown', default=None)
+_handler = contextvars.ContextVar('handler', default='background')
+
+
+@asynccontextmanager
+async def track(component):
+    """Засекает время внешнего вызова и относит его к текущему хэндлеру"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        COMPONENT_SECONDS.labels(_handler.get(), component).observe(elapsed)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown[component] += elapsed
+
+
+def instrument(obj, component):
+    """Оборачивает публичные корутин-методы объекта (db, weather_api, nutrition_api) в track(component)"""
+    # Методы берутся у класса: getmembers по экземпляру вычислил бы ленивые свойства (например, HTTP-клиенты)
+    for name, _ in inspect.getmembers(type(obj), inspect.iscoroutinefunction):
+        if name.startswith('_') or name == 'close':
+            continue
+        method = getattr(obj, name)
+
+        async def timed(*args, __method=method, **kwargs):
+            async with track(component):
+                return await __method(*args, **kwargs)
+
+        setattr(obj, name, functools.wraps(method)(timed))
+    return obj
+
+
+class TimedRequest(HTTPXRequest):
+    """HTTPXRequest, который относит запросы к Bot API (reply_text, send_photo…) к компоненту telegram"""
+
+    async def do_request(self, *args, **kwargs):
+        async with track('telegram'):
+            return await super().do_request(*args, **kwargs)
+
+
+class StackSampler:
+    """
+    Сэмплирующий профилировщик для медленных апдейтов.
+
+    Отдельный поток каждые interval секунд снимает стек каждого выполняющегося хэндлера:
+    цепочку await корутин, а если в этот момент цикл событий исполняет код хэндлера —
+    ещё и синхронные вызовы под ней. Стеки апдейтов дольше slow_ms пишутся в каталог
+    в формате folded (flamegraph.pl, speedscope, inferno).
+    """
+
+    def __init__(self, directory, interval_ms=PROFILE_INTERVAL_MS, slow_ms=SLOW_UPDATE_MS):
+        self.directory = directory
+        self.interval = interval_ms / 1000
+        self.slow_ms = slow_ms
+        self._active = {}
+        self._loop_thread_id = None
+        self._thread = None
+        self.dumped = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def begin(self, coro, handler):
+        if self._thread is None:
+            self._loop_thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+        samples = Counter()
+        self._active[coro] = (handler, samples)
+        return samples
+
+    def end(self, coro, handler, elapsed_ms):
+        _, samples = self._active.pop(coro, (None, None))
+        if samples and elapsed_ms >= self.slow_ms:
+            name = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{handler}_{elapsed_ms:.0f}ms.folded"
+            with open(os.path.join(self.directory, name), 'w') as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.dumped += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            loop_frame = sys._current_frames().get(self._loop_thread_id)
+            for coro, (handler, samples) in list(self._active.items()):
+                try:
+                    samples[';'.join([handler, *self._stack(coro, loop_frame)])] += 1
+                except (AttributeError, ValueError):
+                    # Корутина завершилась, пока снимали стек
+                    continue
+
+    @staticmethod
+    def _frame_name(frame):
+        return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+    def _stack(self, coro, loop_frame):
+        frames = []
+        while coro is not None:
+            frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+            if frame is None:
+                break
+            frames.append(frame)
+            coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+        stack = [self._frame_name(frame) for frame in frames]
+
+        # Самая глубокая корутина сейчас исполняется — добавляем синхронные вызовы под ней
+        if frames:
+            callees = []
+            frame = loop_frame
+            while frame is not None and frame is not frames[-1]:
+                callees.append(self._frame_name(frame))
+                frame = frame.f_back
+            if frame is not None:
+                stack.extend(reversed(callees))
+        return stack
+
+
+sampler = StackSampler(PROFILE_DIR) if PROFILE_DIR else None
+
+
+def instrument_handler(func):
+    """Время хэндлера и разбивка по компонентам; медленные апдейты — в лог и, если включено, в профиль"""
+    handler = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(update, context):
+        breakdown = Counter()
+        breakdown_token = _breakdown.set(breakdown)
+        handler_token = _handler.set(handler)
+        coro = func(update, context)
+        if sampler is not None:
+            sampler.begin(coro, handler)
+        start = time.perf_counter()
+        try:
+            return await coro
+        except Exception:
+            HANDLER_ERRORS.labels(handler).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _breakdown.reset(breakdown_token)
+            _handler.reset(handler_token)
+            HANDLER_SECONDS.labels(handler).observe(elapsed)
+            if sampler is not None:
+                sampler.end(coro, handler, elapsed * 1000)
+            if elapsed * 1000 >= SLOW_UPDATE_MS:
+                SLOW_UPDATES.labels(handler).inc()
+                other = elapsed - sum(breakdown.values())
+                logger.warning("Медленный апдейт %s: %.0f мс (%s, прочее %.0f мс)", handler, elapsed * 1000,
+                               ', '.join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in breakdown.items()),
+                               other * 1000)
+
+    return wrapper
+
+
+def _instrument_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            _instrument_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                _instrument_handlers(state_handlers)
+            _instrument_handlers(handler.fallbacks)
+        elif hasattr(handler, 'callback') and not hasattr(handler.callback, '__wrapped__'):
+            handler.callback = instrument_handler(handler.callback)
+
+
+def instrument_application(application):
+    """Оборачивает все хэндлеры Application (включая вложенные в ConversationHandler)"""
+    for handlers in application.handlers.values():
+        _instrument_handlers(handlers)
+
+
+def start_metrics_server(port=METRICS_PORT):
+    if port:
+        start_http_server(port, addr='127.0.0.1')
+        logger.info("Метрики Prometheus: http://127.0.0.1:%d/metrics", port)
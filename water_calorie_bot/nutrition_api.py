@@ -1,35 +1,119 @@
-import requests
+import asyncio
+import os
+import time
+
+import httpx
+
+from cache import AsyncTTLCache, CircuitBreaker, CircuitOpenError
+from product_store import ProductStore, normalize_name, parse_product
+
+NUTRITION_MEMORY_TTL = int(os.getenv('NUTRITION_MEMORY_TTL', '3600'))
 
 class NutritionAPI:
-    def __init__(self):
-        self.base_url = "https://world.openfoodfacts.org/cgi/search.pl"
-    
-    def search_product(self, product_name):
-        """Ищет продукт в OpenFoodFacts и возвращает калорийность на 100г"""
+    """
+    Поиск калорийности продуктов. Источники по порядку:
+    кэш в памяти → локальный кэш в SQLite → офлайн-индекс из дампа → OpenFoodFacts.
+    """
+
+    def __init__(self, store=None, base_url=None, timeout=10):
+        self.base_url = base_url or os.getenv('OPENFOODFACTS_URL', "https://world.openfoodfacts.org/cgi/search.pl")
+        self.timeout = timeout
+        self.store = store or ProductStore()
+        self.memory = AsyncTTLCache(ttl=NUTRITION_MEMORY_TTL, maxsize=5000)
+        self.breaker = CircuitBreaker()
+        self._client = None
+        self.sources = {'memory': 0, 'cache': 0, 'index': 0, 'remote': 0, 'not_found': 0}
+        self.latencies = []
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+        return self._client
+
+    async def search_product(self, product_name):
+        """Ищет продукт и возвращает калорийность на 100г"""
+        start = time.perf_counter()
+        key = normalize_name(product_name)
+        if self.memory.get(key) is not None:
+            self.sources['memory'] += 1
+        try:
+            return await self.memory.get_or_fetch(key, lambda: self._resolve(product_name))
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+            del self.latencies[:-1000]
+
+    async def _resolve(self, product_name):
+        product = await asyncio.to_thread(self.store.get_cached, product_name)
+        if product:
+            self.sources['cache'] += 1
+            return product
+
+        product = await asyncio.to_thread(self.store.search_index, product_name)
+        source = 'index'
+        if not product:
+            product = await self._search_remote(product_name)
+            source = 'remote'
+        if not product:
+            self.sources['not_found'] += 1
+            return None
+
+        self.sources[source] += 1
+        await asyncio.to_thread(self.store.put_cached, product_name, product)
+        return product
+
+    async def _search_remote(self, product_name):
+        """Ищет продукт в OpenFoodFacts"""
         params = {
             'action': 'process',
             'search_terms': product_name,
             'json': 'true',
             'page_size': 5
         }
-        
+
         try:
-            response = requests.get(self.base_url, params=params, timeout=10)
+            with self.breaker.call():
+                try:
+                    response = await self.client.get(self.base_url, params=params)
+                except httpx.TransportError:
+                    self.breaker.record_failure()
+                    raise
+                if response.status_code >= 500 or response.status_code == 429:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
             response.raise_for_status()
             data = response.json()
-            
-            products = data.get('products', [])
-            for product in products:
-                nutriments = product.get('nutriments', {})
-                calories = nutriments.get('energy-kcal_100g') or nutriments.get('energy_100g', 0) / 4.184
-                
-                if calories and product.get('product_name'):
-                    return {
-                        'name': product['product_name'],
-                        'calories_per_100g': round(calories, 1),
-                        'image_url': product.get('image_front_url', '')
-                    }
+        except CircuitOpenError:
+            print("Ошибка поиска продукта: OpenFoodFacts временно недоступен")
             return None
-        except requests.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             print(f"Ошибка поиска продукта: {e}")
-            return None
\ No newline at end of file
+            return None
+
+        for product in data.get('products', []):
+            parsed = parse_product(product)
+            if parsed:
+                return parsed
+        return None
+
+    def stats(self):
+        """Доля ответов без обращения к сети и задержка поиска"""
+        lookups = sum(self.sources.values()) + self.memory.coalesced
+        local = self.sources['memory'] + self.sources['cache'] + self.sources['index'] + self.memory.coalesced
+        latencies = sorted(self.latencies)
+        return {
+            **self.sources,
+            'coalesced': self.memory.coalesced,
+            'local_hit_rate': local / lookups if lookups else 0.0,
+            'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+BOT_STATE_PATH = os.getenv('BOT_STATE_PATH', 'bot_state.db')
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '5'))
+# Через сколько секунд повторить запись, если SQLite вернул ошибку (например, database is locked)
+PERSISTENCE_RETRY_DELAY = float(os.getenv('PERSISTENCE_RETRY_DELAY', '1'))
+PERSISTENCE_SHUTDOWN_ATTEMPTS = 5
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Хранение состояния диалогов ConversationHandler и context.user_data в SQLite (WAL).
+
+    Application раз в update_interval секунд вызывает update_* для изменившихся данных.
+    Эти вызовы только складывают изменения в буфер, а запись всего буфера идёт одной
+    транзакцией в отдельном потоке — один flush на цикл, цикл событий не блокируется.
+    Если запись не удалась, изменения возвращаются в буфер и запись повторяется.
+    chat_data, bot_data и callback_data бот не использует, они не сохраняются.
+    """
+
+    def __init__(self, db_name=BOT_STATE_PATH, update_interval=PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db_name = db_name
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._user_data = {}
+        self._conversations = {}
+        self._flush_task = None
+        self._flush_lock = None
+        self._retry_handle = None
+        self.flushes = 0
+        self.flush_errors = 0
+        self.rows_written = 0
+        self.flush_seconds = 0.0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS user_data (
+                        user_id INTEGER PRIMARY KEY,
+                        data BLOB
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS conversations (
+                        name TEXT,
+                        key TEXT,
+                        state TEXT,
+                        PRIMARY KEY (name, key)
+                    ) WITHOUT ROWID
+                ''')
+            self._conn = conn
+        return self._conn
+
+    def _query(self, sql, params=()):
+        with self._conn_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    async def get_user_data(self):
+        rows = await asyncio.to_thread(self._query, 'SELECT user_id, data FROM user_data')
+        return {user_id: pickle.loads(data) for user_id, data in rows}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = await asyncio.to_thread(self._query, 'SELECT key, state FROM conversations WHERE name = ?', (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    # update_* получают уже скопированные Application данные, сериализация — при записи
+    async def update_conversation(self, name, key, new_state):
+        self._conversations[(name, json.dumps(list(key)))] = new_state
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id, data):
+        self._user_data[user_id] = data
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        self._user_data[user_id] = None
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def _schedule_flush(self):
+        # Задача запускается после всех update_* текущего цикла, которые Application собирает в gather
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_pending())
+
+    async def _flush_pending(self):
+        """Записывает буфер; False, если SQLite вернул ошибку и изменения остались в буфере"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            user_data, self._user_data = self._user_data, {}
+            conversations, self._conversations = self._conversations, {}
+            if not user_data and not conversations:
+                return True
+            try:
+                await asyncio.to_thread(self._write, user_data, conversations)
+            except sqlite3.Error as e:
+                # Возвращаем изменения в буфер; пришедшие за время записи новее и остаются поверх
+                self._user_data = {**user_data, **self._user_data}
+                self._conversations = {**conversations, **self._conversations}
+                self.flush_errors += 1
+                logger.warning("Не удалось сохранить состояние диалогов (%d записей), повтор через %g сек: %s",
+                               len(user_data) + len(conversations), PERSISTENCE_RETRY_DELAY, e)
+                if self._retry_handle is None:
+                    self._retry_handle = asyncio.get_running_loop().call_later(PERSISTENCE_RETRY_DELAY, self._retry)
+                return False
+            except Exception:
+                # Несериализуемые данные повтор не исправит
+                self.flush_errors += 1
+                logger.exception("Не удалось сохранить состояние диалогов, изменения потеряны")
+            return True
+
+    def _retry(self):
+        self._retry_handle = None
+        self._schedule_flush()
+
+    def _write(self, user_data, conversations):
+        start = time.perf_counter()
+        with self._conn_lock, self.conn as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)',
+                [(user_id, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+                 for user_id, data in user_data.items() if data is not None]
+            )
+            conn.executemany(
+                'DELETE FROM user_data WHERE user_id = ?',
+                [(user_id,) for user_id, data in user_data.items() if data is None]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                [(name, key, json.dumps(state)) for (name, key), state in conversations.items() if state is not None]
+            )
+            conn.executemany(
+                'DELETE FROM conversations WHERE name = ? AND key = ?',
+                [(name, key) for (name, key), state in conversations.items() if state is None]
+            )
+        self.flushes += 1
+        self.rows_written += len(user_data) + len(conversations)
+        self.flush_seconds += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'flushes': self.flushes,
+            'flush_errors': self.flush_errors,
+            'rows_written': self.rows_written,
+            'avg_flush_ms': self.flush_seconds / self.flushes * 1000 if self.flushes else 0.0,
+        }
+
+    async def flush(self):
+        """Вызывается Application при остановке: дописывает буфер и закрывает соединение"""
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+            self._retry_handle = None
+        if self._flush_task is not None:
+            await self._flush_task
+        for _ in range(PERSISTENCE_SHUTDOWN_ATTEMPTS):
+            if await self._flush_pending():
+                break
+            await asyncio.sleep(PERSISTENCE_RETRY_DELAY)
+        else:
+            logger.error("Состояние диалогов не сохранено при остановке: %d записей",
+                         len(self._user_data) + len(self._conversations))
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+            self._retry_handle = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,244 @@
+import csv
+import gzip
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+NUTRITION_DB_PATH = os.getenv('NUTRITION_DB_PATH', 'nutrition_cache.db')
+# Офлайн-индекс можно держать в отдельном файле: воркеры кластера подключают его только для чтения
+PRODUCT_INDEX_PATH = os.getenv('PRODUCT_INDEX_PATH') or NUTRITION_DB_PATH
+PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', str(30 * 24 * 3600)))
+PRODUCT_CACHE_SIZE = int(os.getenv('PRODUCT_CACHE_SIZE', '50000'))
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+# Окончания для лёгкого стемминга запросов: сначала длинные. Основа короче трёх букв не укорачивается
+_RU_ENDINGS = ('ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ой', 'ей', 'ий', 'ый',
+               'ую', 'юю', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ы', 'и', 'а', 'я', 'у', 'ю', 'о', 'е', 'ь', 'й')
+_MIN_STEM = 3
+
+
+def normalize_name(text):
+    """Нормализация названий для поиска: регистр, ё→е, пунктуация и лишние пробелы"""
+    text = text.casefold().replace('ё', 'е')
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def stem_token(token):
+    """
+    Лёгкий стемминг слова запроса: банана, бананы → банан; гречку → гречк; apples → apple.
+    Основа ищется как префикс, поэтому находит и исходную форму в индексе.
+    """
+    if re.search('[а-я]', token):
+        for ending in _RU_ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= _MIN_STEM:
+                return token[:-len(ending)]
+        return token
+    if token.endswith('ies') and len(token) > _MIN_STEM + 2:
+        return token[:-3] + 'y'
+    if token.endswith(('ses', 'xes', 'ches', 'shes')):
+        return token[:-2]
+    if token.endswith('s') and not token.endswith('ss') and len(token) > _MIN_STEM:
+        return token[:-1]
+    return token
+
+
+def parse_product(product):
+    """Достаёт название и калорийность на 100г из записи OpenFoodFacts"""
+    nutriments = product.get('nutriments', {})
+    try:
+        calories = nutriments.get('energy-kcal_100g') or float(nutriments.get('energy_100g', 0) or 0) / 4.184
+        calories = float(calories)
+    except (TypeError, ValueError):
+        return None
+    name = (product.get('product_name') or '').strip()
+    if not calories or not name:
+        return None
+    return {
+        'name': name,
+        'calories_per_100g': round(calories, 1),
+        'image_url': product.get('image_front_url', '')
+    }
+
+
+class ProductStore:
+    """
+    Локальное хранилище продуктов в SQLite:
+    - product_cache — найденные продукты по нормализованному запросу, с TTL и ограничением размера;
+    - products_fts — необязательный офлайн-индекс из дампа OpenFoodFacts (FTS5).
+    Если index_path — другой файл, индекс подключается из него через ATTACH только для чтения,
+    а в db_name остаётся один кэш: так шарды кластера делят общий индекс.
+    """
+
+    def __init__(self, db_name=NUTRITION_DB_PATH, ttl=PRODUCT_CACHE_TTL, max_entries=PRODUCT_CACHE_SIZE,
+                 index_path=None):
+        self.db_name = db_name
+        index_path = index_path or (PRODUCT_INDEX_PATH if db_name == NUTRITION_DB_PATH else db_name)
+        self.index_path = None if os.path.abspath(index_path) == os.path.abspath(db_name) else index_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Число строк кэша ведётся в памяти: COUNT(*) на каждую вставку дорожает с ростом таблицы.
+        # Лишние строки удаляются пачкой, когда их набирается 1% от лимита
+        self._trim_batch = max(1, max_entries // 100)
+        self._cache_size = None
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._create_tables()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.index_table = 'products_fts'
+            if self.index_path is not None:
+                # Отдельный индекс строится заранее (manage.py build-food-index) и подхватывается новыми подключениями
+                self._local.index_table = None
+                if os.path.exists(self.index_path):
+                    uri = pathlib.Path(self.index_path).absolute().as_uri() + '?mode=ro'
+                    conn.execute('ATTACH DATABASE ? AS product_index', (uri,))
+                    if conn.execute("SELECT 1 FROM product_index.sqlite_master WHERE name = 'products_fts'").fetchone():
+                        self._local.index_table = 'product_index.products_fts'
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        with self.conn as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS product_cache (
+                    query TEXT PRIMARY KEY,
+                    name TEXT,
+                    calories_per_100g REAL,
+                    image_url TEXT,
+                    fetched_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_product_cache_fetched ON product_cache(fetched_at)')
+            if self.index_path is not None:
+                return
+            conn.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    name, normalized_name, calories_per_100g UNINDEXED, image_url UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            ''')
+
+    def get_cached(self, query):
+        row = self.conn.execute(
+            'SELECT name, calories_per_100g, image_url, fetched_at FROM product_cache WHERE query = ?',
+            (normalize_name(query),)
+        ).fetchone()
+        if row is None or row[3] + self.ttl < time.time():
+            return None
+        return {'name': row[0], 'calories_per_100g': row[1], 'image_url': row[2]}
+
+    def put_cached(self, query, product):
+        with self._write_lock, self.conn as conn:
+            if self._cache_size is None:
+                self._cache_size = conn.execute('SELECT COUNT(*) FROM product_cache').fetchone()[0]
+            key = normalize_name(query)
+            exists = conn.execute('SELECT 1 FROM product_cache WHERE query = ?', (key,)).fetchone()
+            conn.execute('''
+                INSERT OR REPLACE INTO product_cache (query, name, calories_per_100g, image_url, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, product['name'], product['calories_per_100g'], product.get('image_url', ''), time.time()))
+            if not exists:
+                self._cache_size += 1
+            # Самые старые записи вытесняются пачкой, когда лимит превышен на trim_batch
+            excess = self._cache_size - self.max_entries
+            if excess >= self._trim_batch:
+                deleted = conn.execute('''
+                    DELETE FROM product_cache WHERE query IN (
+                        SELECT query FROM product_cache ORDER BY fetched_at LIMIT ?
+                    )
+                ''', (excess,)).rowcount
+                self._cache_size -= deleted
+
+    def search_index(self, query):
+        """Лучшее совпадение в офлайн-индексе: основы всех слов запроса как префиксы"""
+        tokens = [stem_token(token) for token in normalize_name(query).split()]
+        conn = self.conn
+        table = self._local.index_table
+        if not tokens or table is None:
+            return None
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        row = conn.execute(f'''
+            SELECT name, calories_per_100g, image_url FROM {table}
+            WHERE products_fts MATCH ?
+            ORDER BY bm25(products_fts, 1.0, 2.0), length(name)
+            LIMIT 1
+        ''', (f'normalized_name : ({match})',)).fetchone()
+        if row is None:
+            return None
+        return {'name': row[0], 'calories_per_100g': float(row[1]), 'image_url': row[2] or ''}
+
+    def index_size(self):
+        conn = self.conn
+        table = self._local.index_table
+        if table is None:
+            return 0
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def build_index(self, dump_path, batch_size=10000):
+        """
+        Строит офлайн-индекс из дампа OpenFoodFacts: JSONL (openfoodfacts-products.jsonl[.gz])
+        или CSV с табуляцией (en.openfoodfacts.org.products.csv[.gz]). Возвращает число продуктов.
+        """
+        if self.index_path is not None:
+            raise ValueError(f"Индекс подключён только для чтения из {self.index_path}, стройте его в этом файле")
+        opener = gzip.open if dump_path.endswith('.gz') else open
+        with self._write_lock, self.conn as conn:
+            conn.execute('DELETE FROM products_fts')
+        count = 0
+        batch = []
+        with opener(dump_path, 'rt', encoding='utf-8', errors='replace') as f:
+            for product in self._read_dump(f, dump_path):
+                parsed = parse_product(product)
+                if parsed is None:
+                    continue
+                batch.append((parsed['name'], normalize_name(parsed['name']),
+                              parsed['calories_per_100g'], parsed['image_url']))
+                if len(batch) >= batch_size:
+                    count += self._insert_index_batch(batch)
+                    batch = []
+        count += self._insert_index_batch(batch)
+        with self._write_lock, self.conn as conn:
+            conn.execute("INSERT INTO products_fts(products_fts) VALUES ('optimize')")
+        return count
+
+    @staticmethod
+    def _read_dump(f, dump_path):
+        if '.csv' in dump_path:
+            csv.field_size_limit(sys.maxsize)
+            for row in csv.DictReader(f, delimiter='\t'):
+                yield {
+                    'product_name': row.get('product_name'),
+                    'image_front_url': row.get('image_url', ''),
+                    'nutriments': {
+                        'energy-kcal_100g': row.get('energy-kcal_100g') or None,
+                        'energy_100g': row.get('energy_100g') or 0,
+                    },
+                }
+        else:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def _insert_index_batch(self, batch):
+        if not batch:
+            return 0
+        with self._write_lock, self.conn as conn:
+            conn.executemany('''
+                INSERT INTO products_fts (name, normalized_name, calories_per_100g, image_url)
+                VALUES (?, ?, ?, ?)
+            ''', batch)
+        return len(batch)
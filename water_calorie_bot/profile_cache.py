@@ -0,0 +1,87 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))
+
+
+@dataclass(frozen=True, slots=True)
+class UserProfile:
+    user_id: int
+    username: str
+    weight: float
+    height: float
+    age: int
+    gender: str
+    activity_minutes: int
+    city: str
+    calorie_goal: float
+    water_goal: float
+
+    COLUMNS = ('user_id', 'username', 'weight', 'height', 'age', 'gender',
+               'activity_minutes', 'city', 'calorie_goal', 'water_goal')
+
+
+class ProfileCache:
+    """
+    Ограниченный LRU-кэш профилей пользователей.
+
+    Если профиль инвалидирован, пока его читали из базы, прочитанное значение
+    в кэш не попадёт — иначе после save_user_profile мог бы вернуться старый профиль.
+    """
+
+    def __init__(self, maxsize=PROFILE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._profiles = OrderedDict()
+        # user_id -> [число идущих загрузок, была ли инвалидация во время загрузки]
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is not None:
+                self._profiles.move_to_end(user_id)
+                self.hits += 1
+            return profile
+
+    def get_or_load(self, user_id, loader):
+        profile = self.get(user_id)
+        if profile is not None:
+            return profile
+        with self._lock:
+            self.misses += 1
+            state = self._loading.setdefault(user_id, [0, False])
+            state[0] += 1
+        try:
+            profile = loader(user_id)
+        finally:
+            with self._lock:
+                state[0] -= 1
+                if state[0] == 0:
+                    del self._loading[user_id]
+                if profile is not None and not state[1]:
+                    self._profiles[user_id] = profile
+                    self._profiles.move_to_end(user_id)
+                    if len(self._profiles) > self.maxsize:
+                        self._profiles.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._profiles.pop(user_id, None)
+            if user_id in self._loading:
+                self._loading[user_id][1] = True
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+            for state in self._loading.values():
+                state[1] = True
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._profiles)}
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from cache import AsyncTTLCache
+
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', '2'))
+CHART_CACHE_TTL = int(os.getenv('CHART_CACHE_TTL', '3600'))
+CHART_CACHE_SIZE = int(os.getenv('CHART_CACHE_SIZE', '1000'))
+
+PERIODS = {'week': 7, 'month': 30}
+
+# Фигура создаётся один раз на процесс-воркер и переиспользуется между графиками
+_figure = None
+_axes = None
+
+
+def _init_worker():
+    """Инициализация воркера: headless-бэкенд, шрифты и фигура загружаются заранее"""
+    global _figure, _axes
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+
+    font_manager.findfont(font_manager.FontProperties(family=plt.rcParams['font.family']))
+    _figure, _axes = plt.subplots(3, 1, figsize=(8, 9), sharex=True)
+    # Поля задаются один раз: tight_layout на каждый график дороже самой отрисовки
+    _figure.subplots_adjust(left=0.1, right=0.97, top=0.95, bottom=0.08, hspace=0.3)
+    # Первая отрисовка прогревает кэш глифов
+    _figure.savefig(io.BytesIO(), format='png')
+
+
+def fill_days(rows, days, today=None):
+    """Дополняет строки daily_totals нулями до непрерывного ряда из days суток"""
+    today = today or datetime.now(timezone.utc).date()
+    by_day = {row[0]: row[1:] for row in rows}
+    series = []
+    for offset in range(days - 1, -1, -1):
+        day = (today - timedelta(days=offset)).isoformat()
+        series.append((day, *by_day.get(day, (0, 0, 0, 0))))
+    return series
+
+
+def render_chart(series, water_goal, calorie_goal):
+    """Рисует вода / калории / тренировки по дням и возвращает PNG"""
+    if _figure is None:
+        _init_worker()
+    days = [day[5:] for day, *_ in series]
+    water = [row[1] for row in series]
+    consumed = [row[2] for row in series]
+    burned = [row[3] for row in series]
+    water_target = [water_goal + row[4] for row in series]
+    x = range(len(series))
+
+    for ax in _axes:
+        ax.clear()
+        ax.grid(axis='y', alpha=0.3)
+
+    water_ax, calories_ax, workout_ax = _axes
+    water_ax.bar(x, water, color='#4a90d9', label='Выпито')
+    water_ax.step(x, water_target, where='mid', color='#1f3f66', label='Норма')
+    water_ax.set_ylabel('мл')
+    water_ax.set_title('Вода')
+    water_ax.legend(loc='upper left')
+
+    calories_ax.bar(x, consumed, color='#e8a33d', label='Потреблено')
+    calories_ax.axhline(calorie_goal, color='#8a5a12', label='Цель')
+    calories_ax.set_ylabel('ккал')
+    calories_ax.set_title('Калории')
+    calories_ax.legend(loc='upper left')
+
+    workout_ax.bar(x, burned, color='#5cb85c', label='Сожжено')
+    workout_ax.set_ylabel('ккал')
+    workout_ax.set_title('Тренировки')
+    workout_ax.set_xticks(list(x))
+    workout_ax.set_xticklabels(days, rotation=45 if len(days) > 10 else 0, fontsize=8)
+
+    buffer = io.BytesIO()
+    _figure.savefig(buffer, format='png', dpi=90)
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """
+    Рендеринг графиков прогресса в пуле процессов, чтобы не блокировать цикл событий.
+
+    PNG кэшируется по пользователю, периоду и хэшу данных: пока данные не изменились,
+    повторный запрос возвращает готовую картинку без перерисовки.
+    """
+
+    def __init__(self, workers=CHART_WORKERS, ttl=CHART_CACHE_TTL, maxsize=CHART_CACHE_SIZE):
+        self.workers = workers
+        self.cache = AsyncTTLCache(ttl=ttl, maxsize=maxsize)
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self._pool
+
+    @staticmethod
+    def data_version(series, water_goal, calorie_goal):
+        return hashlib.sha1(repr((series, water_goal, calorie_goal)).encode()).hexdigest()
+
+    async def render(self, user_id, period, series, water_goal, calorie_goal):
+        key = (user_id, period, self.data_version(series, water_goal, calorie_goal))
+        loop = asyncio.get_running_loop()
+        return await self.cache.get_or_fetch(
+            key, lambda: loop.run_in_executor(self.pool, render_chart, series, water_goal, calorie_goal)
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,99 @@
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from product_store import normalize_name
+
+# Продуктов на пользователя, пользователей в памяти и сколько последних записей food_logs читать при загрузке
+RECENT_FOODS_PER_USER = int(os.getenv('RECENT_FOODS_PER_USER', '20'))
+RECENT_FOODS_USERS = int(os.getenv('RECENT_FOODS_USERS', '10000'))
+RECENT_FOODS_HISTORY = int(os.getenv('RECENT_FOODS_HISTORY', '500'))
+RECENT_FOODS_BUTTONS = 6
+
+
+class RecentFoods:
+    """
+    Недавние и частые продукты каждого пользователя для быстрых кнопок в /log_food.
+
+    Индекс пользователя строится из последних записей food_logs при первом обращении
+    (калорийность на 100г — из calories и weight_grams последней записи), а дальше
+    обновляется в памяти после каждого log_food. На пользователя хранится не больше
+    per_user продуктов: вытесняется самый редкий и давний. Пользователи — LRU до max_users.
+    Работает только из цикла событий; апдейты одного пользователя обрабатываются по очереди.
+    """
+
+    def __init__(self, db, per_user=RECENT_FOODS_PER_USER, max_users=RECENT_FOODS_USERS,
+                 history=RECENT_FOODS_HISTORY):
+        self.db = db
+        self.per_user = per_user
+        self.max_users = max_users
+        self.history = history
+        # user_id -> {нормализованное название: [название, ккал на 100г, сколько раз, последняя запись]}
+        self._users = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def _index(self, user_id):
+        foods = self._users.get(user_id)
+        if foods is not None:
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return foods
+        self.misses += 1
+        foods = {}
+        # Записи идут от новых к старым: калорийность берётся из последней записи продукта
+        for name, calories, weight, timestamp in await self.db.get_recent_foods(user_id, self.history):
+            key = normalize_name(name or '')
+            if not key:
+                continue
+            entry = foods.get(key)
+            if entry is not None:
+                entry[2] += 1
+            elif weight and weight > 0:
+                foods[key] = [name, round(calories / weight * 100, 1), 1, timestamp]
+        for key in sorted(foods, key=lambda k: (foods[k][2], foods[k][3]))[:max(0, len(foods) - self.per_user)]:
+            del foods[key]
+        # Пока шла загрузка, индекс мог появиться через record()
+        foods = self._users.setdefault(user_id, foods)
+        self._users.move_to_end(user_id)
+        if len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return foods
+
+    def record(self, user_id, name, calories_per_100g, timestamp=None):
+        """Учитывает новую запись о еде; индекс ещё не загруженного пользователя прочитается из базы позже"""
+        timestamp = timestamp or datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        foods = self._users.get(user_id)
+        key = normalize_name(name)
+        if foods is None or not key:
+            return
+        entry = foods.get(key)
+        if entry is not None:
+            entry[1] = calories_per_100g
+            entry[2] += 1
+            entry[3] = timestamp
+            return
+        foods[key] = [name, calories_per_100g, 1, timestamp]
+        if len(foods) > self.per_user:
+            del foods[min((k for k in foods if k != key), key=lambda k: (foods[k][2], foods[k][3]))]
+
+    async def suggestions(self, user_id, limit=RECENT_FOODS_BUTTONS):
+        """Продукты для кнопок: два последних, затем самые частые"""
+        entries = list((await self._index(user_id)).values())
+        recent = sorted(entries, key=lambda e: e[3], reverse=True)[:2]
+        frequent = sorted(entries, key=lambda e: (e[2], e[3]), reverse=True)
+        result = []
+        for entry in recent + frequent:
+            if not any(entry is chosen for chosen in result):
+                result.append(entry)
+        return [{'name': name, 'calories_per_100g': calories} for name, calories, _, _ in result[:limit]]
+
+    async def match(self, user_id, text):
+        """Продукт из истории пользователя с тем же названием или None"""
+        entry = (await self._index(user_id)).get(normalize_name(text))
+        if entry is None:
+            return None
+        return {'name': entry[0], 'calories_per_100g': entry[1]}
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'users': len(self._users)}
@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+REMINDER_INTERVAL = int(os.getenv('REMINDER_INTERVAL', '900'))
+REMINDER_COOLDOWN = int(os.getenv('REMINDER_COOLDOWN', str(3 * 3600)))
+# Telegram допускает около 30 сообщений в секунду на бота, оставляем запас
+REMINDER_RATE = float(os.getenv('REMINDER_RATE', '25'))
+REMINDER_DAY_START = int(os.getenv('REMINDER_DAY_START', '8'))
+REMINDER_DAY_END = int(os.getenv('REMINDER_DAY_END', '22'))
+
+
+def day_fraction(now, start_hour=REMINDER_DAY_START, end_hour=REMINDER_DAY_END):
+    """Доля дневной нормы, которую к моменту now уже стоило выпить (0 до начала дня, 1 после конца)"""
+    hours = now.hour + now.minute / 60
+    return min(1.0, max(0.0, (hours - start_hour) / (end_hour - start_hour)))
+
+
+class ReminderScheduler:
+    """
+    Напоминания о воде для отстающих от нормы пользователей.
+
+    tick() запускается JobQueue раз в interval секунд: один запрос к базе выбирает всех,
+    кто выпил меньше пропорциональной времени суток части нормы. Отправка — одна задача,
+    которая разбирает кучу (время отправки, пользователь) со скоростью не выше rate сообщений
+    в секунду. За тик в очередь ставится не больше, чем успеет уйти до следующего тика;
+    остальные пользователи попадут в следующие тики. Позднее пробуждение не превращается
+    в пачку: за любую секунду отправляется не больше rate сообщений, остальные ждут в куче.
+    """
+
+    def __init__(self, db, interval=REMINDER_INTERVAL, cooldown=REMINDER_COOLDOWN, rate=REMINDER_RATE,
+                 fraction=day_fraction):
+        self.db = db
+        self.fraction = fraction
+        self.interval = interval
+        self.cooldown = cooldown
+        self.rate = rate
+        self._heap = []
+        self._next_slot = 0.0
+        # Моменты отправок за последнюю секунду: скользящее окно лимита
+        self._recent = deque()
+        self._paused_until = 0.0
+        self._sender = None
+        self.ticks = 0
+        self.last_tick_seconds = 0.0
+        self.max_tick_seconds = 0.0
+        self.last_candidates = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.rate_limited = 0
+
+    def schedule(self, job_queue, first=60):
+        return job_queue.run_repeating(self.tick, interval=self.interval, first=first, name='water_reminders')
+
+    async def tick(self, context):
+        start = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        fraction = self.fraction(now)
+        capacity = int(self.rate * self.interval) - len(self._heap)
+        candidates = []
+        if fraction > 0 and capacity > 0:
+            sent_before = (now - timedelta(seconds=self.cooldown)).strftime('%Y-%m-%d %H:%M:%S')
+            candidates = await self.db.get_users_behind_water(fraction, sent_before, capacity)
+        if candidates:
+            # Отметка ставится при постановке в очередь, чтобы следующий тик не выбрал их повторно
+            await self.db.mark_reminders_sent([row[0] for row in candidates], now.strftime('%Y-%m-%d %H:%M:%S'))
+            self._enqueue(candidates)
+            if self._sender is None or self._sender.done():
+                self._sender = asyncio.create_task(self._send_loop(context.bot))
+
+        elapsed = time.perf_counter() - start
+        self.ticks += 1
+        self.last_candidates = len(candidates)
+        self.last_tick_seconds = elapsed
+        self.max_tick_seconds = max(self.max_tick_seconds, elapsed)
+        logger.info("Напоминания: тик %.3f сек, в очередь %d, в очереди всего %d",
+                    elapsed, len(candidates), len(self._heap))
+
+    def _enqueue(self, candidates):
+        slot = max(self._next_slot, time.monotonic())
+        step = 1 / self.rate
+        for user_id, consumed, target in candidates:
+            heapq.heappush(self._heap, (slot, user_id, int(consumed), int(target)))
+            slot += step
+        self._next_slot = slot
+
+    async def _send_loop(self, bot):
+        limit = max(1, int(self.rate))
+        while self._heap:
+            now = time.monotonic()
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            budget = limit - len(self._recent)
+            delay = self._heap[0][0] - now
+            if budget <= 0:
+                delay = max(delay, self._recent[0] + 1 - now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < budget:
+                batch.append(heapq.heappop(self._heap))
+            self._recent.extend([now] * len(batch))
+            await asyncio.gather(*(self._send(bot, *entry[1:]) for entry in batch))
+
+    async def _send(self, bot, user_id, consumed, target):
+        try:
+            await bot.send_message(
+                chat_id=user_id,
+                text=f"💧 Не забудьте про воду: выпито {consumed} из {target} мл.\n"
+                     f"Запишите стакан командой /log_water 250"
+            )
+            self.sent += 1
+        except RetryAfter as e:
+            # Telegram просит подождать: сдвигаем всю очередь, сохраняя интервалы между отправками.
+            # Сдвиг на константу не нарушает свойство кучи
+            self.rate_limited += 1
+            now = time.monotonic()
+            retry_at = now + e.retry_after
+            if retry_at > self._paused_until:
+                shift = retry_at - max(self._paused_until, now)
+                self._paused_until = retry_at
+                self._heap = [(slot + shift, *rest) for slot, *rest in self._heap]
+                self._next_slot += shift
+            heapq.heappush(self._heap, (retry_at, user_id, consumed, target))
+        except Forbidden:
+            # Пользователь заблокировал бота — больше не напоминаем
+            self.blocked += 1
+            await self.db.set_reminders_enabled(user_id, False)
+        except TelegramError as e:
+            self.failed += 1
+            logger.warning("Не удалось отправить напоминание %s: %s", user_id, e)
+
+    def stats(self):
+        return {
+            'ticks': self.ticks,
+            'last_tick_ms': self.last_tick_seconds * 1000,
+            'max_tick_ms': self.max_tick_seconds * 1000,
+            'last_candidates': self.last_candidates,
+            'queued': len(self._heap),
+            'sent': self.sent,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'rate_limited': self.rate_limited,
+        }
+
+    async def close(self):
+        if self._sender is not None:
+            self._sender.cancel()
@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+import pytest
+from hypothesis import example, given, settings
+from hypothesis import strategies as st
+
+from calculator import Calculator
+
+# Пакетные методы должны поэлементно совпадать со скалярными, в том числе на граничных
+# и бессмысленных для бота значениях: нулевой и отрицательной длительности, пропущенной температуре
+
+weights = st.one_of(st.integers(-10, 400), st.floats(-10, 400, allow_nan=False))
+heights = st.one_of(st.integers(0, 260), st.floats(0, 260, allow_nan=False))
+ages = st.one_of(st.sampled_from([0, 1, 17, 18, 65, 120]), st.integers(-5, 150))
+minutes = st.one_of(st.sampled_from([-30, -1, 0, 29, 30, 59, 60, 89, 90, 1000]),
+                    st.integers(-600, 1440), st.floats(-600, 1440, allow_nan=False))
+temperatures = st.one_of(st.none(), st.just(math.nan), st.sampled_from([0, 25, 25.5, 50, 51]),
+                         st.floats(-60, 60, allow_nan=False))
+# NumPy отрезает завершающие '\x00' у строк, а таких названий в боте не бывает
+texts = st.text(st.characters(blacklist_characters='\x00'), max_size=12)
+genders = st.one_of(st.sampled_from(['male', 'female', 'Male', 'MALE', 'FEMALE', '']), texts)
+workouts = st.one_of(st.sampled_from(list(Calculator.WORKOUT_CALORIES_PER_MINUTE) + ['Бег', 'КАРДИО', 'скакалка']),
+                     texts)
+
+
+def rows(**columns):
+    """Столбцы одинаковой длины: каждая строка — отдельный пользователь"""
+    return st.lists(st.tuples(*columns.values()), max_size=50).map(
+        lambda items: {name: [item[i] for item in items] for i, name in enumerate(columns)}
+    )
+
+
+def scalar_temperature(value):
+    """Скалярный метод принимает неизвестную температуру как None, пакетный — как NaN"""
+    return None if value is None or math.isnan(value) else value
+
+
+@settings(max_examples=300)
+@given(rows(weight=weights, height=heights, age=ages, gender=genders))
+@example({'weight': [70], 'height': [175], 'age': [0], 'gender': ['Male']})
+def test_bmr_batch_matches_scalar(data):
+    expected = [Calculator.calculate_bmr(w, h, a, g)
+                for w, h, a, g in zip(data['weight'], data['height'], data['age'], data['gender'])]
+    actual = Calculator.calculate_bmr_batch(data['weight'], data['height'], data['age'], data['gender'])
+    assert actual.tolist() == expected
+
+
+@settings(max_examples=300)
+@given(rows(bmr=st.floats(-2000, 5000, allow_nan=False), activity=minutes))
+def test_calorie_goal_batch_matches_scalar(data):
+    expected = [Calculator.calculate_calorie_goal(b, m) for b, m in zip(data['bmr'], data['activity'])]
+    actual = Calculator.calculate_calorie_goal_batch(data['bmr'], data['activity'])
+    assert actual.tolist() == expected
+
+
+@settings(max_examples=300)
+@given(rows(weight=weights, activity=minutes, temperature=temperatures))
+@example({'weight': [70], 'activity': [0], 'temperature': [None]})
+@example({'weight': [70], 'activity': [-1], 'temperature': [math.nan]})
+def test_water_goal_batch_matches_scalar(data):
+    expected = [Calculator.calculate_water_goal(w, m, scalar_temperature(t))
+                for w, m, t in zip(data['weight'], data['activity'], data['temperature'])]
+    temperature = np.array([math.nan if t is None else t for t in data['temperature']], dtype=float)
+    actual = Calculator.calculate_water_goal_batch(data['weight'], data['activity'], temperature)
+    assert actual.tolist() == expected
+
+
+@settings(max_examples=100)
+@given(rows(weight=weights, activity=minutes))
+def test_water_goal_batch_without_temperature(data):
+    expected = [Calculator.calculate_water_goal(w, m) for w, m in zip(data['weight'], data['activity'])]
+    actual = Calculator.calculate_water_goal_batch(data['weight'], data['activity'])
+    assert actual.tolist() == expected
+
+
+@settings(max_examples=300)
+@given(rows(workout=workouts, duration=minutes, weight=weights))
+@example({'workout': ['бег'], 'duration': [0], 'weight': [70]})
+@example({'workout': ['Йога'], 'duration': [-15], 'weight': [70]})
+def test_calories_burned_batch_matches_scalar(data):
+    expected = [Calculator.estimate_calories_burned(k, d, w)
+                for k, d, w in zip(data['workout'], data['duration'], data['weight'])]
+    actual = Calculator.estimate_calories_burned_batch(data['workout'], data['duration'], data['weight'])
+    assert actual.tolist() == expected
+
+
+@pytest.mark.parametrize('activity', [-1, 0, 29, 29.5, 30, 59, 60, 89, 90, 91])
+@pytest.mark.parametrize('temperature', [None, math.nan, 0, 25, 25.01, 50, 60])
+def test_water_and_calorie_boundaries(activity, temperature):
+    bmr = Calculator.calculate_bmr(70, 175, 30, 'male')
+    assert Calculator.calculate_calorie_goal_batch([bmr], [activity]).tolist() == [
+        Calculator.calculate_calorie_goal(bmr, activity)]
+    assert Calculator.calculate_water_goal_batch([70], [activity], [temperature]).tolist() == [
+        Calculator.calculate_water_goal(70, activity, scalar_temperature(temperature))]
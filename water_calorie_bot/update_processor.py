@@ -0,0 +1,81 @@
+import asyncio
+import inspect
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка апдейтов с ограничением max_concurrent_updates.
+
+    Апдейты одного пользователя обрабатываются строго по очереди: ConversationHandler
+    хранит состояние диалога и рассчитывает на последовательную обработку.
+    Апдейты разных пользователей идут параллельно.
+
+    process_update переопределён: в PTB он берёт семафор до do_process_update,
+    и очередь одного пользователя занимала бы общие слоты.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._user_locks = {}
+        self.in_flight = 0
+        self.processed = 0
+
+    @staticmethod
+    def _user_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def process_update(self, update, coroutine):
+        """
+        Сначала замок пользователя, потом общий семафор: апдейты, ждущие своей очереди
+        у одного пользователя, не занимают слоты max_concurrent_updates и не блокируют остальных.
+        """
+        key = self._user_key(update)
+        if key is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+        # Замок живёт, пока у пользователя есть апдейты в обработке
+        entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._semaphore:
+                    await self.do_process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[key]
+            # Отменённый в очереди апдейт: корутина хэндлера так и не запускалась
+            if inspect.iscoroutine(coroutine) and inspect.getcoroutinestate(coroutine) == inspect.CORO_CREATED:
+                coroutine.close()
+
+    async def do_process_update(self, update, coroutine):
+        self.in_flight += 1
+        try:
+            await coroutine
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+
+    def stats(self):
+        return {
+            'max_concurrent_updates': self.max_concurrent_updates,
+            'in_flight': self.in_flight,
+            'active_users': len(self._user_locks),
+            'processed': self.processed,
+        }
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
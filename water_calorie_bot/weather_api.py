@@ -1,30 +1,75 @@
-import requests
+import httpx
 import os
 from dotenv import load_dotenv
 
+from cache import AsyncTTLCache, CircuitBreaker, CircuitOpenError
+
 load_dotenv()
 
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', '900'))
+
 class WeatherAPI:
-    def __init__(self):
+    def __init__(self, base_url=None, timeout=5):
         self.api_key = os.getenv('OPENWEATHER_API_KEY')
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
-    
-    def get_temperature(self, city):
-        """Получает текущую температуру в городе в градусах Цельсия"""
-        if not self.api_key:
-            return None
-        
+        self.base_url = base_url or os.getenv(
+            'OPENWEATHER_BASE_URL', "https://api.openweathermap.org/data/2.5/weather"
+        )
+        self.timeout = timeout
+        self.cache = AsyncTTLCache(ttl=WEATHER_CACHE_TTL)
+        self.breaker = CircuitBreaker()
+        self._client = None
+
+    @property
+    def client(self):
+        # Один пул соединений на весь бот, создаётся при первом запросе
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+        return self._client
+
+    @staticmethod
+    def normalize_city(city):
+        """Ключ кэша: регистр и лишние пробелы не важны"""
+        return ' '.join(city.split()).casefold()
+
+    async def _fetch_temperature(self, city):
         params = {
             'q': city,
             'appid': self.api_key,
             'units': 'metric'
         }
-        
+
+        with self.breaker.call():
+            try:
+                response = await self.client.get(self.base_url, params=params)
+            except httpx.TransportError:
+                self.breaker.record_failure()
+                raise
+
+            # Неизвестный город — не сбой API, выключатель на него не реагирует
+            if response.status_code >= 500 or response.status_code == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        response.raise_for_status()
+        return response.json()['main']['temp']
+
+    async def get_temperature(self, city):
+        """Получает текущую температуру в городе в градусах Цельсия"""
+        if not self.api_key:
+            return None
+
         try:
-            response = requests.get(self.base_url, params=params, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            return data['main']['temp']
-        except requests.RequestException as e:
+            return await self.cache.get_or_fetch(
+                self.normalize_city(city), lambda: self._fetch_temperature(city)
+            )
+        except (httpx.HTTPError, CircuitOpenError, KeyError, ValueError) as e:
             print(f"Ошибка получения погоды: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
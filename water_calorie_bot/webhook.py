@@ -0,0 +1,163 @@
+import hmac
+import json
+import logging
+import os
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookApp:
+    """
+    ASGI-приложение для приёма апдейтов Telegram через вебхук.
+
+    POST на path кладёт апдейт в очередь Application и сразу отвечает 200,
+    обработка идёт в фоне через update_processor. GET /healthcheck отдаёт счётчики.
+    Жизненный цикл Application (initialize/start/stop/shutdown) привязан к lifespan сервера.
+    """
+
+    def __init__(self, application, path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, webhook_url=WEBHOOK_URL):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.webhook_url = webhook_url
+        self.received = 0
+        self.rejected = 0
+        self.invalid = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("Ошибка запуска вебхука")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        application = self.application
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        if self.webhook_url:
+            await application.bot.set_webhook(
+                self.webhook_url + self.path,
+                secret_token=self.secret_token or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+        await application.start()
+        logger.info("Вебхук принимает апдейты на %s", self.path)
+
+    async def shutdown(self):
+        application = self.application
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    async def _http(self, scope, receive, send):
+        if scope['method'] == 'GET' and scope['path'] == '/healthcheck':
+            await self._respond(send, 200, self.stats())
+            return
+        if scope['method'] != 'POST' or scope['path'] != self.path:
+            await self._respond(send, 404, {'error': 'not found'})
+            return
+
+        headers = dict(scope['headers'])
+        token = headers.get(b'x-telegram-bot-api-secret-token', b'').decode('latin-1')
+        if self.secret_token and not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            await self._respond(send, 403, {'error': 'forbidden'})
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            # Клиент отключился, не дождавшись ответа
+            return
+        if len(body) > MAX_BODY_SIZE:
+            self.invalid += 1
+            await self._respond(send, 413, {'error': 'payload too large'})
+            return
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            # de_json падает на апдейтах не той формы (AttributeError, TypeError...): это 400, а не 500
+            self.invalid += 1
+            logger.warning("Некорректный апдейт: %s", e)
+            await self._respond(send, 400, {'error': 'bad update'})
+            return
+        if update is None:
+            self.invalid += 1
+            await self._respond(send, 400, {'error': 'bad update'})
+            return
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        await self._respond(send, 200, {'ok': True})
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            if size <= MAX_BODY_SIZE:
+                chunks.append(message.get('body', b''))
+                size += len(chunks[-1])
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def _respond(send, status, payload):
+        body = json.dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def stats(self):
+        stats = {
+            'status': 'ok' if self.application.running else 'stopped',
+            'received': self.received,
+            'rejected': self.rejected,
+            'invalid': self.invalid,
+            'queue_size': self.application.update_queue.qsize(),
+        }
+        processor = self.application.update_processor
+        if hasattr(processor, 'stats'):
+            stats.update(processor.stats())
+        return stats
+
+
+def run_webhook(application, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """Запускает бота в режиме вебхука под uvicorn"""
+    import uvicorn
+
+    uvicorn.run(WebhookApp(application), host=host, port=port, log_level='warning', lifespan='on')